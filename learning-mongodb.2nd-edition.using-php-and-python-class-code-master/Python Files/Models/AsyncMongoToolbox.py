@@ -0,0 +1,256 @@
+from Models import MongoToolbox
+from Models import HelperModel as Helper
+from shared import constants
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import weakref
+
+"""
+AsyncMongoToolbox.py -- asyncio version of the MongoToolbox
+
+Every MongoToolbox method blocks the calling thread for a full network round trip -- inside an asyncio application
+that means blocking the event loop.  This model exposes the same method surface as MongoToolbox, but each method is
+a coroutine:  the pyMongo call is run on a dedicated thread pool (pyMongo is thread-safe and releases the GIL while
+waiting on the network), so the event loop is free to service other requests while the operation is in flight.
+
+A semaphore caps the number of operations in flight -- this is the concurrency parameter, and it's also the size of
+the thread pool.  It should not exceed the maxPoolSize of the MongoClient, or operations will simply queue for a
+socket inside pyMongo.  An asyncio semaphore belongs to one event loop, so each loop the toolbox is used from gets
+its own semaphore (and its own cap).
+
+Password hashing is pushed off the loop as well: into the HashService process pool when one is configured, otherwise
+onto the toolbox thread pool.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     added insert_raw_records()
+10-17-26        mks     pass the tombstone option through delete_records()
+10-17-26        mks     share the connection profiles with the per-call toolbox
+10-17-26        mks     share the read routes with the per-call toolbox
+10-17-26        mks     one semaphore per event loop, use the running loop
+
+"""
+
+
+class AsyncMongoToolbox:
+    """
+    AsyncMongoToolbox -- awaitable toolbox methods
+
+    Each call runs on its own (synchronous) MongoToolbox so that concurrent calls do not share state.  When a call
+    completes, the result members (new_user_id, number_records_*) of the synchronous toolbox are copied to this
+    object -- with many calls in flight these members reflect the most recently completed call, so callers that
+    need per-call counts should await calls one at a time or read them immediately after the await.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_resource = None
+    hash_service = None
+    concurrency = None
+    executor = None
+    new_user_id = None
+    number_records_matched = None
+    number_records_updated = None
+    number_records_deleted = None
+    duplicate_key_error = False
+    last_error = None
+    slow_operation_recorder = None
+    profiles = None
+    operation_profiles = None
+    read_routes = None
+    operation_read_routes = None
+
+    def __init__(self, mongo_resource, concurrency=constants.ASYNC_CONCURRENCY, hash_service=None):
+        """
+        __init__()  --  class instantiation method
+
+        There is one required input parameter - the mongo resource (MongoClient) created by the MongoConnectorModel -
+        and two optional parameters:
+
+        concurrency -- the maximum number of toolbox operations in flight at the same time
+        hash_service -- an instantiated HashService used for password hashing
+
+        :param mongo_resource:  the mongodb resource that was instantiated in the mongoConnector class
+        :param concurrency:     integer - maximum number of operations in flight
+        :param hash_service:    optional HashService object used for password hashing
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     semaphores are kept per event loop
+
+        """
+        self.mongo_resource = mongo_resource
+        self.hash_service = hash_service
+        self.concurrency = max(1, int(concurrency))
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.status = True
+
+    async def check_for_existing_account(self, user, email):
+        return await self._run('check_for_existing_account', user, email)
+
+    async def add_user(self, user_data):
+        """
+        add_user() -- asyncMongoToolbox method
+
+        The password is hashed off the event loop and the record is then inserted using insert_one_record().
+
+        :param user_data: a dictionary of key-value pairs representing the user data that will be inserted into mongodb
+        :return: a boolean indicating if the user record was inserted
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        user_data['password'] = await self.hash_password(user_data['password'])
+        return await self.insert_one_record([user_data])
+
+    async def insert_one_record(self, data, db=None, collection=None):
+        return await self._run('insert_one_record', data, db=db, collection=collection)
+
+    async def insert_many_records(self, data, db=None, collection=None):
+        return await self._run('insert_many_records', data, db=db, collection=collection)
+
+    async def insert_raw_records(self, data, db=None, collection=None, inject_meta=True):
+        return await self._run('insert_raw_records', data, db=db, collection=collection, inject_meta=inject_meta)
+
+    async def update_one_record(self, query, update, upsert_value=False, db=None, collection=None):
+        return await self._run('update_one_record', query, update, upsert_value=upsert_value, db=db,
+                               collection=collection)
+
+    async def update_many_records(self, query, update, upsert_value=False, db=None, collection=None):
+        return await self._run('update_many_records', query, update, upsert_value=upsert_value, db=db,
+                               collection=collection)
+
+    async def delete_records(self, query_filter, db=None, collection=None, multi=False, tombstone=False):
+        return await self._run('delete_records', query_filter, db=db, collection=collection, multi=multi,
+                               tombstone=tombstone)
+
+    async def hash_password(self, password):
+        """
+        hash_password() -- asyncMongoToolbox method
+
+        Returns the bcrypt hash of the password without blocking the event loop -- the hash is computed in the
+        HashService process pool if one was configured, otherwise on the toolbox thread pool.
+
+        :param password:    clear-text password string
+        :return:            the bcrypt hash of the password
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     use the running loop
+
+        """
+        if self.hash_service is not None:
+            return await asyncio.wrap_future(self.hash_service.submit(password))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, Helper.hash_string, password)
+
+    async def hash_passwords(self, passwords):
+        """
+        hash_passwords() -- asyncMongoToolbox method
+
+        The batch version of hash_password() -- the hashes are returned in the same order as the input passwords.
+
+        :param passwords:   a list of clear-text password strings
+        :return:            list of bcrypt hashes, in input order
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return list(await asyncio.gather(*[self.hash_password(password) for password in passwords]))
+
+    def close(self, wait=True):
+        """
+        close() -- asyncMongoToolbox method
+
+        Shuts down the toolbox thread pool.  The MongoClient is owned by the connection registry and is not closed.
+
+        :param wait:    boolean - wait for in-flight operations to complete
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+        self.status = False
+
+    async def _run(self, method_name, *args, **kwargs):
+        """
+        _run() -- asyncMongoToolbox private method
+
+        Runs the named MongoToolbox method on the thread pool, bounded by the running loop's concurrency semaphore,
+        and copies the result members back to this object when the call completes.
+
+        :param method_name: string containing the name of the MongoToolbox method to invoke
+        :return:            the return value of the MongoToolbox method
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     copy back the trapped exception recorded for the metrics
+        10-17-26        mks     share the slow-operation recorder with the per-call toolbox
+        10-17-26        mks     share the connection profiles with the per-call toolbox
+        10-17-26        mks     share the read routes with the per-call toolbox
+        10-17-26        mks     one semaphore per event loop
+
+        """
+        # a semaphore is bound to the loop it's first used in, so each running loop gets its own -- created on first
+        # use, and dropped with the loop
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        toolbox = MongoToolbox.MongoToolbox(self.mongo_resource, self.hash_service)
+        toolbox.slow_operation_recorder = self.slow_operation_recorder
+        if self.profiles is not None:
+            toolbox.configure_profiles(self.profiles, self.operation_profiles)
+        if self.read_routes is not None:
+            toolbox.configure_read_routes(self.read_routes, self.operation_read_routes)
+        async with semaphore:
+            result = await loop.run_in_executor(self.executor,
+                                                functools.partial(getattr(toolbox, method_name), *args, **kwargs))
+        self.new_user_id = toolbox.new_user_id
+        self.number_records_matched = toolbox.number_records_matched
+        self.number_records_updated = toolbox.number_records_updated
+        self.number_records_deleted = toolbox.number_records_deleted
+        self.duplicate_key_error = toolbox.duplicate_key_error
+        self.last_error = toolbox.last_error
+        return result
@@ -0,0 +1,179 @@
+from Models import AsyncMongoToolbox
+from Models import HelperModel
+from Models import EmailValidationModel
+from shared import constants
+import asyncio
+import time
+
+"""
+AsyncUserModel.py -- asyncio version of the UserModel
+
+This model mirrors the UserModel method-for-method, but every method is a coroutine built on the AsyncMongoToolbox,
+so an asyncio application can keep many user operations in flight from a single process.
+
+The email validation may perform blocking DNS/SMTP requests, so it is also run off the event loop.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     added the tombstone option
+
+"""
+
+
+class AsyncUserModel:
+    """
+    AsyncUserModel -- awaitable user-management
+
+    As with the UserModel, we assume that the connection to the mongo resource has already been instantiated.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    mongo_toolbox = None
+    error_stack = None
+    email_validator = None
+    tombstones = False
+
+    def __init__(self, mongo_resource, concurrency=constants.ASYNC_CONCURRENCY, hash_service=None,
+                 email_validator=None, tombstones=False):
+        """
+        __init__() -- AsyncUserModel Instantiation Class
+
+        The __init__ method requires the connector resource object that was generated in the MongoConnectorModel; the
+        concurrency and hash_service parameters are optional and are passed through to the AsyncMongoToolbox.  The
+        optional email_validator is an EmailDomainValidator (see UserModel), and the optional tombstones flag makes
+        delete_user() leave a tombstone for every deleted user, for the incremental extracts (see UserModel).
+
+        :param mongo_resource:  mongo resource object generated in the MongoConnector model
+        :param concurrency:     integer - maximum number of toolbox operations in flight
+        :param hash_service:    optional HashService object used for password hashing
+        :param email_validator: optional EmailDomainValidator object
+        :param tombstones:      optional boolean - record deletes in the tombstone collection
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the tombstone option
+
+        """
+        self.mongo_toolbox = AsyncMongoToolbox.AsyncMongoToolbox(mongo_resource, concurrency, hash_service)
+        self.error_stack = []
+        self.tombstones = tombstones
+        if email_validator is None:
+            email_validator = EmailValidationModel.EmailDomainValidator()
+        self.email_validator = email_validator
+
+    async def validate_new_user_data(self, data):
+        """
+        validate_new_user_data() -- AsyncUserModel Method
+
+        The awaitable version of UserModel.validate_new_user_data() -- see that method for a description.
+
+        :param data:  dictionary containing the user's username, email, and password
+        :return: Boolean value indicating if validation of the user data was successful
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     use the running loop
+
+        """
+        user_name = data['username']
+        user_password = data['password']
+        user_email = data['email']
+
+        status, err_msg = HelperModel.validate_password_length(user_password)
+        if status is False:
+            self.error_stack.append(err_msg)
+            return status
+        loop = asyncio.get_running_loop()
+        is_valid = await loop.run_in_executor(self.mongo_toolbox.executor, self.email_validator.validate, user_email)
+        if is_valid is False:
+            self.error_stack.append('email: ' + user_email + ' failed validation')
+            return False
+        return await self.mongo_toolbox.check_for_existing_account(user_name, user_email)
+
+    async def insert_new_user(self, user_data):
+        """
+        insert_new_user() -- AsyncUserModel method
+
+        Passes the user data through to the toolbox add_user() method, which hashes the password off the loop.
+
+        :param user_data: dictionary containing the user's username, password, and email address
+        :return: Boolean indicating if the account was successfully created or not
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return await self.mongo_toolbox.add_user(user_data)
+
+    async def update_user(self, user_data):
+        """
+        update_user() -- AsyncUserModel method
+
+        The awaitable version of UserModel.update_user() -- the user_data dictionary must contain the "target_user"
+        key, which is used to build the query filter.
+
+        :param user_data:   a dictionary containing both the query filter and the update data
+        :return:            a boolean value received from the toolbox method indicating event success or failure
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        query_filter = {"username": user_data['target_user']}
+        del user_data["target_user"]
+        user_data['last_updated'] = int(time.time())
+        if 'password' in user_data:
+            user_data['password'] = await self.mongo_toolbox.hash_password(user_data['password'])
+        user_data = {"$set": user_data}
+        return await self.mongo_toolbox.update_one_record(query_filter, user_data)
+
+    async def delete_user(self, user_data):
+        """
+        delete_user() -- AsyncUserModel method
+
+        Deletes the user whose username is passed as the single input parameter -- leaving a tombstone, if the model
+        was created with tombstones.
+
+        :param user_data: string containing the username that will be removed from the collection
+        :return:          boolean value indicating if the delete request was successfully processed
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     leave a tombstone, when configured
+
+        """
+        query_filter = {"username": user_data}
+        return await self.mongo_toolbox.delete_records(query_filter, tombstone=self.tombstones)
+
+    def close(self):
+        self.mongo_toolbox.close()
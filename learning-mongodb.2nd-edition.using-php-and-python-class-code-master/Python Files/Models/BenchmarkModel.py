@@ -0,0 +1,363 @@
+from Models import MongoToolbox
+from Models import IndexManagerModel
+from Models import HelperModel as Helper
+from shared import constants
+import platform
+import time
+import tracemalloc
+
+"""
+BenchmarkModel.py -- reproducible benchmark suite for the MongoToolbox and password hashing
+
+Each benchmark case times individual toolbox calls and reports:
+
+    calls               -- the number of timed calls
+    documents           -- the number of documents the calls touched
+    ops_per_sec         -- documents per second (for single-document calls this is calls per second)
+    p50_ms/p95_ms/p99_ms -- per-call latency percentiles, in milliseconds
+    alloc_peak_bytes    -- peak Python memory allocated during a (separate, shorter) tracemalloc pass
+
+Cases run against a scratch database so they never touch application data, and every case starts from a freshly
+dropped collection.  The document payloads are generated deterministically, so two runs of the suite do exactly the
+same work.
+
+The results are a JSON-serializable dictionary -- compare_results() diffs two result sets and flags regressions, so
+a saved run can be used as the baseline for the next one.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+
+def connect_backend(backend=constants.BENCHMARK_BACKEND_AUTO, uri=constants.BENCHMARK_URI):
+    """
+    connect_backend() -- benchmark helper function
+
+    Returns a client for the benchmark, and the name of the backend used:
+
+    mongod      -- a real mongod at the uri; we ping the server so we know it's there
+    mongomock   -- the in-process mongomock stand-in (the mongomock package must be installed)
+    auto        -- mongod if one is reachable, otherwise mongomock
+
+    Numbers from the mongomock backend measure the client-side cost of the toolbox only -- they're useful for
+    catching regressions in our own code, not for sizing the cluster.
+
+    :param backend: string - one of the BENCHMARK_BACKEND_* constants
+    :param uri:     string - the mongod connection uri
+    :return:        the client and the backend name, or (None, None) if no backend is available
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    if backend in (constants.BENCHMARK_BACKEND_AUTO, constants.BENCHMARK_BACKEND_MONGOD):
+        try:
+            from pymongo import MongoClient
+            client = MongoClient(uri, serverSelectionTimeoutMS=constants.BENCHMARK_CONNECT_TIMEOUT_MS)
+            client.admin.command('ping')
+            return client, constants.BENCHMARK_BACKEND_MONGOD
+        except Exception as e:
+            if backend == constants.BENCHMARK_BACKEND_MONGOD:
+                print('unable to reach mongod at %s: %s - %s' % (uri, e.__class__, e))
+                return None, None
+    try:
+        import mongomock
+    except ImportError:
+        print('no mongod is reachable and the mongomock package is not installed')
+        return None, None
+    return mongomock.MongoClient(), constants.BENCHMARK_BACKEND_MONGOMOCK
+
+
+def compare_results(baseline, current, threshold=constants.BENCHMARK_REGRESSION_THRESHOLD):
+    """
+    compare_results() -- benchmark helper function
+
+    Compares two result sets, case by case.  A case regresses if its throughput dropped, or its p95 latency rose,
+    by more than the threshold (a fraction: 0.10 is 10%).  Cases that only exist in one of the result sets are
+    reported, but are not regressions.
+
+    :param baseline:    dictionary - the baseline results
+    :param current:     dictionary - the results of the current run
+    :param threshold:   float - the fractional change tolerated before a case is flagged
+    :return:            a list of per-case comparison dictionaries, and a Boolean that's True if any case regressed
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    comparison = []
+    regressed = False
+    base_cases = baseline.get('results', {})
+    current_cases = current.get('results', {})
+    for name in sorted(set(base_cases) | set(current_cases)):
+        if name not in base_cases or name not in current_cases:
+            comparison.append({'case': name, 'status': 'new' if name in current_cases else 'missing'})
+            continue
+        base, now = base_cases[name], current_cases[name]
+        throughput_change = _relative_change(base['ops_per_sec'], now['ops_per_sec'])
+        p95_change = _relative_change(base['p95_ms'], now['p95_ms'])
+        status = 'ok'
+        if throughput_change < -threshold or p95_change > threshold:
+            status = 'regressed'
+            regressed = True
+        elif throughput_change > threshold and p95_change < threshold:
+            status = 'improved'
+        comparison.append({'case': name, 'status': status,
+                           'ops_per_sec_change': round(throughput_change, 4),
+                           'p95_change': round(p95_change, 4)})
+    return comparison, regressed
+
+
+def _relative_change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / float(before)
+
+
+class BenchmarkSuite:
+    """
+    BenchmarkSuite -- the benchmark cases
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    client = None
+    backend = None
+    iterations = None
+    batch_sizes = None
+    bcrypt_rounds = None
+    results = None
+
+    def __init__(self, client, backend, iterations=constants.BENCHMARK_ITERATIONS,
+                 batch_sizes=constants.BENCHMARK_BATCH_SIZES, bcrypt_rounds=constants.BENCHMARK_BCRYPT_ROUNDS):
+        """
+        __init__() -- BenchmarkSuite instantiation method
+
+        :param client:          the client returned by connect_backend()
+        :param backend:         string - the backend name returned by connect_backend()
+        :param iterations:      integer - the number of timed calls per case
+        :param batch_sizes:     list of integers - the insert_many_records batch sizes to benchmark
+        :param bcrypt_rounds:   list of integers - the bcrypt cost factors to benchmark
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.client = client
+        self.backend = backend
+        self.iterations = max(1, int(iterations))
+        self.batch_sizes = list(batch_sizes)
+        self.bcrypt_rounds = list(bcrypt_rounds)
+        self.results = {}
+
+    def run(self, case_filter=None):
+        """
+        run() -- BenchmarkSuite method
+
+        Runs every benchmark case (or, if case_filter is given, only the cases whose name contains the filter
+        string) and returns the result set.
+
+        :param case_filter: optional string - run only the matching cases
+        :return:            dictionary containing the run metadata and the per-case results
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.results = {}
+        for name, case in self._cases():
+            if case_filter is None or case_filter in name:
+                print('running: %s' % name)
+                self.results[name] = case()
+        self.client.drop_database(constants.BENCHMARK_DATABASE)
+        return {
+            'meta': {
+                'backend': self.backend,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'iterations': self.iterations,
+                'timestamp': int(time.time())
+            },
+            'results': self.results
+        }
+
+    def _cases(self):
+        cases = [('insert_one_record', self._bench_insert_one)]
+        for batch_size in self.batch_sizes:
+            cases.append(('insert_many_records[%d]' % batch_size, self._make_insert_many(batch_size)))
+        cases += [
+            ('update_one_record', self._bench_update_one),
+            ('update_many_records', self._bench_update_many),
+            ('delete_records[single]', self._bench_delete_single),
+            ('delete_records[multi]', self._bench_delete_multi),
+            ('check_for_existing_account[no-index]', self._make_existing_account(False)),
+            ('check_for_existing_account[indexed]', self._make_existing_account(True))
+        ]
+        for rounds in self.bcrypt_rounds:
+            cases.append(('hash_string[rounds=%d]' % rounds, self._make_hash(rounds)))
+        return cases
+
+    def _bench_insert_one(self):
+        toolbox = self._fresh_toolbox()
+        documents = self._documents(self.iterations)
+        return self._measure(lambda i: toolbox.insert_one_record([documents[i]]), self.iterations,
+                             allocation_call=lambda i: toolbox.insert_one_record([self._document(10 ** 7 + i)]))
+
+    def _make_insert_many(self, batch_size):
+        def bench():
+            toolbox = self._fresh_toolbox()
+            calls = max(1, self.iterations // batch_size)
+            batches = [self._documents(batch_size, i * batch_size) for i in range(calls)]
+            return self._measure(lambda i: toolbox.insert_many_records(batches[i]), calls,
+                                 documents_per_call=batch_size,
+                                 allocation_call=lambda i: toolbox.insert_many_records(
+                                     self._documents(batch_size, 10 ** 7 + i * batch_size)))
+        return bench
+
+    def _bench_update_one(self):
+        toolbox = self._populated_toolbox(self.iterations)
+        return self._measure(lambda i: toolbox.update_one_record({'username': self._username(i)},
+                                                                 {'$set': {'last_updated': i}}), self.iterations)
+
+    def _bench_update_many(self):
+        toolbox = self._populated_toolbox(self.iterations)
+        group_size = constants.BENCHMARK_MULTI_GROUP_SIZE
+        calls = max(1, self.iterations // group_size)
+        return self._measure(lambda i: toolbox.update_many_records({'group': i}, {'$set': {'last_updated': i}}),
+                             calls, documents_per_call=group_size)
+
+    def _bench_delete_single(self):
+        toolbox = self._populated_toolbox(self.iterations * 2)
+        return self._measure(lambda i: toolbox.delete_records({'username': self._username(i)}), self.iterations,
+                             allocation_call=lambda i: toolbox.delete_records(
+                                 {'username': self._username(self.iterations + i)}))
+
+    def _bench_delete_multi(self):
+        toolbox = self._populated_toolbox(self.iterations)
+        group_size = constants.BENCHMARK_MULTI_GROUP_SIZE
+        calls = max(1, self.iterations // group_size)
+        return self._measure(lambda i: toolbox.delete_records({'group': i}, multi=True), calls,
+                             documents_per_call=group_size)
+
+    def _make_existing_account(self, indexed):
+        def bench():
+            toolbox = self._populated_toolbox(self.iterations)
+            if indexed is True:
+                IndexManagerModel.IndexManager(toolbox).ensure_indexes()
+            # look for accounts that don't exist -- this is the signup path, and the worst case for an unindexed $or
+            return self._measure(lambda i: toolbox.check_for_existing_account('nobody%d' % i, 'nobody%d@bench' % i),
+                                 self.iterations)
+        return bench
+
+    def _make_hash(self, rounds):
+        def bench():
+            calls = max(1, min(self.iterations, constants.BENCHMARK_HASH_CALLS))
+            return self._measure(lambda i: Helper.hash_string('password%d' % i, rounds), calls)
+        return bench
+
+    def _measure(self, call, calls, documents_per_call=1, allocation_call=None):
+        """
+        _measure() -- BenchmarkSuite private method
+
+        Times each call individually and summarizes the latencies.  Memory is measured in a second, shorter, pass
+        with tracemalloc enabled, so the tracing overhead doesn't distort the timings -- cases that consume their
+        data (inserts, deletes) provide a separate allocation_call that works on fresh data.
+
+        :param call:                function taking the call index
+        :param calls:               integer - the number of timed calls
+        :param documents_per_call:  integer - documents touched by each call
+        :param allocation_call:     optional function used for the allocation pass
+        :return:                    dictionary containing the case results
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        latencies = []
+        start_time = time.perf_counter()
+        for i in range(calls):
+            call_start = time.perf_counter()
+            call(i)
+            latencies.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start_time
+
+        allocation_calls = min(calls, constants.BENCHMARK_ALLOCATION_CALLS)
+        tracemalloc.start()
+        for i in range(allocation_calls):
+            (allocation_call or call)(i)
+        alloc_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'calls': calls,
+            'documents': calls * documents_per_call,
+            'ops_per_sec': round(calls * documents_per_call / elapsed, 1) if elapsed > 0 else 0.0,
+            'p50_ms': round(Helper.percentile(latencies, 50) * 1000, 4),
+            'p95_ms': round(Helper.percentile(latencies, 95) * 1000, 4),
+            'p99_ms': round(Helper.percentile(latencies, 99) * 1000, 4),
+            'alloc_peak_bytes': alloc_peak
+        }
+
+    def _fresh_toolbox(self):
+        # point a toolbox at an empty scratch collection
+        toolbox = MongoToolbox.MongoToolbox(self.client)
+        toolbox.database = self.client[constants.BENCHMARK_DATABASE]
+        toolbox.database.drop_collection(constants.BENCHMARK_COLLECTION)
+        toolbox.collection = toolbox.database[constants.BENCHMARK_COLLECTION]
+        return toolbox
+
+    def _populated_toolbox(self, count):
+        toolbox = self._fresh_toolbox()
+        documents = self._documents(count)
+        for start in range(0, count, constants.BULK_IMPORT_CHUNK_SIZE):
+            toolbox.collection.insert_many(documents[start:start + constants.BULK_IMPORT_CHUNK_SIZE])
+        return toolbox
+
+    def _documents(self, count, offset=0):
+        return [self._document(offset + i) for i in range(count)]
+
+    def _document(self, i):
+        # deterministic payload, shaped like MongoConnectorDataModel.newUser
+        return {
+            'username': self._username(i),
+            'password': 'not-a-real-hash-%08d' % i,
+            'email': '%s@bench.example.com' % self._username(i),
+            'token': 'BENCH-%08d' % i,
+            'created': i,
+            'group': i // constants.BENCHMARK_MULTI_GROUP_SIZE
+        }
+
+    @staticmethod
+    def _username(i):
+        return 'bench%08d' % i
@@ -0,0 +1,357 @@
+from pymongo import errors as mongo_errors
+from Models import HelperModel as Helper
+from shared import constants
+import csv
+import json
+import os
+import time
+
+"""
+BulkImportModel.py -- Model for streaming large user data-sets into mongoDB
+
+When we onboard a new tenant, we may have millions of user accounts to create -- calling the UserModel methods once
+per user simply doesn't scale.  This model reads user records from a CSV or JSONL file (or from any iterable of
+dictionaries), validates and hashes each record, and then writes the records to mongo in bounded-size chunks using
+the MongoToolbox insert_many_records() method.
+
+Only one chunk is ever held in memory, so peak memory does not grow with the size of the input file.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     per-record accounting of partially-written chunks
+10-17-26        mks     the record validation is shared with the parallel loader
+10-17-26        mks     reject required fields that aren't strings
+
+"""
+
+
+def read_records(source, file_format=None):
+    """
+    read_records() -- bulk import helper function
+
+    This is a generator function that yields user records, one dictionary at a time, from the source.  There are two
+    input parameters to the function:
+
+    source -- this is either a string containing the path to a CSV or JSONL file, an open file handle (or any other
+    iterable of text lines), or an iterable of dictionaries.
+    file_format -- optional string; one of the IMPORT_FORMAT_* constants.  If the source is a file path and the format
+    is not given, we'll infer the format from the file extension.  If the source is an iterable and no format is given,
+    then we assume that the iterable is already yielding dictionaries.
+
+    Blank lines in JSONL input are skipped.
+
+    :param source:       file path, iterable of text lines, or iterable of dictionaries
+    :param file_format:  optional, the format of the source data (csv or jsonl)
+    :return:             yields each record as a dictionary
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    if isinstance(source, str):
+        if file_format is None:
+            extension = os.path.splitext(source)[1].lower()
+            file_format = constants.IMPORT_FORMAT_CSV if extension == '.csv' else constants.IMPORT_FORMAT_JSONL
+        with open(source, 'r', newline='') as file_handle:
+            for record in read_records(file_handle, file_format):
+                yield record
+    elif file_format == constants.IMPORT_FORMAT_CSV:
+        for record in csv.DictReader(source):
+            yield record
+    elif file_format == constants.IMPORT_FORMAT_JSONL:
+        for line in source:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        for record in source:
+            yield record
+
+
+def validate_record(record):
+    """
+    validate_record() -- bulk import helper function
+
+    Validates a single record read by read_records(): the record must be a dictionary, the username, password and
+    email fields must be non-empty strings (a JSONL record can hold any JSON type), and the password must pass the
+    HelperModel length validation.  A CSV row with more fields than the header is rejected (csv.DictReader files the
+    extra fields under a None key, which can't be stored).
+
+    :param record:  dictionary containing a single user record
+    :return:        boolean indicating if the record is valid, and a diagnostic message if it is not
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     the required fields must be strings
+
+    """
+    if not isinstance(record, dict):
+        return False, 'not a record: %s' % type(record).__name__
+    if None in record:
+        return False, 'more fields than the header: %d extra' % len(record[None])
+    for field in ('username', 'password', 'email'):
+        if not record.get(field):
+            return False, 'missing required field: ' + field
+        if not isinstance(record[field], str):
+            return False, '%s is not a string: %s' % (field, type(record[field]).__name__)
+    status, err_msg = Helper.validate_password_length(record['password'])
+    if status is False:
+        return status, err_msg
+    if '@' not in record['email']:
+        return False, 'email: ' + record['email'] + ' failed validation'
+    return True, None
+
+
+class BulkImportModel:
+    """
+    BulkImportModel -- streaming bulk-import of user accounts
+
+    The class requires an instantiated UserModel -- we use the UserModel's toolbox for the writes and, when full
+    validation is requested, the UserModel's validate_new_user_data() method.
+
+    After an import completes, the counters (class members) and the report() method describe what happened.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    user_model = None
+    chunk_size = None
+    full_validation = False
+    max_errors = None
+    records_read = 0
+    records_inserted = 0
+    records_rejected = 0
+    records_failed = 0
+    chunks_written = 0
+    chunks_failed = 0
+    elapsed_time = 0.0
+    error_stack = None
+
+    def __init__(self, user_model, chunk_size=constants.BULK_IMPORT_CHUNK_SIZE, full_validation=False,
+                 max_errors=constants.BULK_IMPORT_MAX_ERRORS):
+        """
+        __init__() -- BulkImportModel instantiation method
+
+        There is one required input parameter, and three optional parameters to the method:
+
+        user_model -- an instantiated UserModel object
+        chunk_size -- the maximum number of records sent to mongo in a single insert_many() request
+        full_validation -- if True, each record is validated using UserModel.validate_new_user_data() which includes
+        the email MX check and a per-record lookup for pre-existing accounts.  This is slow, so the default is to
+        only validate the fields locally.
+        max_errors -- the maximum number of diagnostic messages we'll keep in the error stack.  Errors beyond this
+        limit are still counted but the message is discarded so that memory stays bounded.
+
+        :param user_model:      instantiated UserModel object
+        :param chunk_size:      integer - number of records per insert request
+        :param full_validation: boolean - use the UserModel validation (default: False)
+        :param max_errors:      integer - maximum number of diagnostic messages to retain
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.user_model = user_model
+        self.chunk_size = max(1, int(chunk_size))
+        self.full_validation = full_validation
+        self.max_errors = max_errors
+        self.error_stack = []
+
+    def import_records(self, source, file_format=None):
+        """
+        import_records() -- BulkImportModel method
+
+        This is the main entry-point to the bulk import.  The input parameters are passed directly through to the
+        read_records() function -- see that function for a description.
+
+        Each record is validated and valid records are collected into a chunk; when the chunk reaches chunk_size
+        records, the clear-text passwords in the chunk are replaced with their bcrypt hashes (in a single batch, so
+        a configured HashService can spread the work across cores) and the chunk is written to mongo and discarded.
+        Any remaining records are written when the source is exhausted.
+
+        Invalid records are counted as rejected; records that failed to write are counted as failed.  A malformed CSV
+        file aborts the import, as a malformed JSONL line does.
+
+        :param source:       file path, iterable of text lines, or iterable of dictionaries
+        :param file_format:  optional, the format of the source data (csv or jsonl)
+        :return:             a dictionary containing the import report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     abort on a malformed CSV file
+
+        """
+        self._reset_counters()
+        start_time = time.time()
+        chunk = []
+        try:
+            for record in read_records(source, file_format):
+                self.records_read += 1
+                is_valid, err_msg = self._validate_record(record)
+                if is_valid is False:
+                    self.records_rejected += 1
+                    self._add_error('record %d: %s' % (self.records_read, err_msg))
+                    continue
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(chunk)
+                    chunk = []
+            if len(chunk) > 0:
+                self._write_chunk(chunk)
+            self.status = self.records_failed == 0
+        except (IOError, ValueError, csv.Error) as e:
+            self._add_error('import aborted after %d records: %s - %s' % (self.records_read, e.__class__, e))
+            self.status = False
+        self.elapsed_time = time.time() - start_time
+        return self.report()
+
+    def report(self):
+        """
+        report() -- BulkImportModel method
+
+        Returns a dictionary describing the last import: record and chunk counters, the elapsed time, throughput in
+        records-per-second, and the (bounded) list of diagnostic messages.
+
+        :return: dictionary containing the import report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        throughput = self.records_inserted / self.elapsed_time if self.elapsed_time > 0 else 0.0
+        return {
+            'status': self.status,
+            'records_read': self.records_read,
+            'records_inserted': self.records_inserted,
+            'records_rejected': self.records_rejected,
+            'records_failed': self.records_failed,
+            'chunks_written': self.chunks_written,
+            'chunks_failed': self.chunks_failed,
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'records_per_second': round(throughput, 1),
+            'errors': list(self.error_stack)
+        }
+
+    def _validate_record(self, record):
+        """
+        _validate_record() -- BulkImportModel private method
+
+        Validates a single record with the validate_record() function and, if full validation was requested, the
+        UserModel validation.
+
+        :param record:  dictionary containing a single user record
+        :return:        boolean indicating if the record is valid, and a diagnostic message if it is not
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     reject CSV rows with extra fields
+        10-17-26        mks     moved the record checks to validate_record()
+
+        """
+        is_valid, err_msg = validate_record(record)
+        if is_valid is False:
+            return is_valid, err_msg
+        if self.full_validation is True and self.user_model.validate_new_user_data(record) is False:
+            return False, 'user: ' + record['username'] + ' failed validation'
+        return True, None
+
+    def _write_chunk(self, chunk):
+        """
+        _write_chunk() -- BulkImportModel private method
+
+        Hashes the passwords for the chunk in a single batch and writes the chunk to mongo.  A single-record chunk has
+        to go through insert_one_record() as the insert_many_records() method requires more than one record.
+
+        The chunk is written unordered, so a record that fails (a duplicate username, say) doesn't stop the others:
+        if the write raised a BulkWriteError, the records it inserted are counted as inserted, and only the records
+        with a write error are counted as failed.  Any other error fails the whole chunk.
+
+        :param chunk:   list of validated user records
+        :return:        Boolean indicating if the chunk was written successfully
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     batch-hash the chunk passwords through the toolbox
+        10-17-26        mks     per-record accounting of a partially-written chunk
+
+        """
+        toolbox = self.user_model.mongo_toolbox
+        toolbox.last_error = None
+        hashes = toolbox.hash_passwords([record['password'] for record in chunk])
+        for record, hashed_password in zip(chunk, hashes):
+            record['password'] = hashed_password
+        if len(chunk) == 1:
+            result = toolbox.insert_one_record(chunk)
+        else:
+            result = toolbox.insert_many_records(chunk)
+        if result is True:
+            self.chunks_written += 1
+            self.records_inserted += len(chunk)
+            return result
+        self.chunks_failed += 1
+        chunk_number = self.chunks_written + self.chunks_failed
+        if isinstance(toolbox.last_error, mongo_errors.BulkWriteError):
+            details = toolbox.last_error.details
+            self.records_inserted += details.get('nInserted', 0)
+            for write_error in details.get('writeErrors', []):
+                self.records_failed += 1
+                self._add_error('chunk %d: user %s failed to write: %s' %
+                                (chunk_number, chunk[write_error['index']].get('username'), write_error.get('errmsg')))
+        else:
+            self.records_failed += len(chunk)
+            self._add_error('chunk %d (%d records) failed to write: %s' %
+                            (chunk_number, len(chunk), toolbox.last_error))
+        return result
+
+    def _add_error(self, err_msg):
+        if len(self.error_stack) < self.max_errors:
+            self.error_stack.append(err_msg)
+
+    def _reset_counters(self):
+        self.status = False
+        self.records_read = 0
+        self.records_inserted = 0
+        self.records_rejected = 0
+        self.records_failed = 0
+        self.chunks_written = 0
+        self.chunks_failed = 0
+        self.elapsed_time = 0.0
+        self.error_stack = []
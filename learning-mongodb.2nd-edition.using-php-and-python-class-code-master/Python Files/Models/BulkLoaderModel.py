@@ -0,0 +1,318 @@
+from pymongo import errors as mongo_errors
+from shared import constants
+import random
+import re
+import time
+
+"""
+BulkLoaderModel.py -- chunked, retrying, bulk loader with per-record failure accounting
+
+MongoToolbox.insert_many_records() traps every exception and returns False, so a single duplicate in a large
+unordered batch loses all information about which records landed -- and the caller can only resend everything.
+The BulkLoader writes the records in chunks and, when a chunk fails, parses the BulkWriteError to account for every
+record individually:
+
+    - a duplicate on the idempotency key (the per-record token) or on the _id means the record was already written,
+      by an earlier run or by an earlier attempt of this one -- it's counted as already present, not as a failure
+    - a write error with a transient error code (failover, network, shutdown...) is retried
+    - any other write error is a permanent failure, and is reported with its index in the input, token, error code
+      and message
+
+A chunk that fails as a whole with a transient error (connection lost, primary stepped down) is retried in full, and
+a chunk that was written but didn't satisfy the write concern is retried too -- the idempotency key makes both of
+these replays safe.  Retries use capped exponential backoff with jitter, and records that are still failing when the
+retries are exhausted are reported as failed.
+
+The token index must be unique (see IndexManagerModel) for the replays to be idempotent, and the tokens must come
+with the records (be stable across runs) for a re-run to cost only the records that didn't land -- records without a
+token are given a new one, which only protects the retries within this run.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     records that come with a token are stamped with created too
+
+"""
+
+
+class BulkLoader:
+    """
+    BulkLoader -- chunked bulk loader
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_toolbox = None
+    chunk_size = None
+    max_retries = None
+    backoff_base = None
+    backoff_max = None
+    idempotency_key = None
+    max_errors = None
+    db = None
+    collection = None
+    records_read = 0
+    records_inserted = 0
+    records_already_present = 0
+    records_failed = 0
+    chunks_written = 0
+    retries = 0
+    elapsed_time = 0.0
+    failures = None
+
+    def __init__(self, mongo_toolbox, chunk_size=constants.BULK_LOAD_CHUNK_SIZE,
+                 max_retries=constants.BULK_LOAD_MAX_RETRIES, backoff_base_ms=constants.BULK_LOAD_BACKOFF_BASE_MS,
+                 backoff_max_ms=constants.BULK_LOAD_BACKOFF_MAX_MS, idempotency_key=constants.BULK_LOAD_IDEMPOTENCY_KEY,
+                 max_errors=constants.BULK_IMPORT_MAX_ERRORS, db=None, collection=None):
+        """
+        __init__() -- BulkLoader instantiation method
+
+        There is one required input parameter - an instantiated MongoToolbox - and the following optional parameters:
+
+        chunk_size -- the maximum number of records sent to mongo in a single insert_many() request
+        max_retries -- the number of times a chunk's transient failures are retried before they're reported as failed
+        backoff_base_ms -- the delay before the first retry; the delay doubles with every retry...
+        backoff_max_ms -- ...up to this cap
+        idempotency_key -- the field, with a unique index named <field>_1, that identifies a record across runs
+        max_errors -- the maximum number of failures we keep the details of; failures beyond this limit are still
+        counted, but the details are discarded so that memory stays bounded
+        db, collection -- alternative database/collection names
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base_ms / 1000.0
+        self.backoff_max = backoff_max_ms / 1000.0
+        self.idempotency_key = idempotency_key
+        self.max_errors = max_errors
+        self.db = db
+        self.collection = collection
+        self.failures = []
+
+    def load(self, records):
+        """
+        load() -- BulkLoader method
+
+        Loads the records, chunk by chunk, and returns the load report.  Only one chunk is held in memory at a time,
+        so the records can be any iterable -- for example, the read_records() generator from the BulkImportModel.
+
+        :param records:     an iterable of dictionaries
+        :return:            a dictionary containing the load report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self._reset_counters()
+        start_time = time.time()
+        chunk = []
+        for record in records:
+            # remember the position of each record in the input, so failures can be reported against it
+            chunk.append((self.records_read, record))
+            self.records_read += 1
+            if len(chunk) >= self.chunk_size:
+                self._write_chunk(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            self._write_chunk(chunk)
+        self.status = self.records_failed == 0
+        self.elapsed_time = time.time() - start_time
+        return self.report()
+
+    def report(self):
+        """
+        report() -- BulkLoader method
+
+        Returns a dictionary describing the last load: the record counters, the number of chunks and retries, the
+        elapsed time, throughput in records-per-second, and the details of the (bounded) list of failed records.
+        Every record read is counted as exactly one of inserted, already present, or failed.
+
+        :return: dictionary containing the load report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        throughput = self.records_inserted / self.elapsed_time if self.elapsed_time > 0 else 0.0
+        return {
+            'status': self.status,
+            'records_read': self.records_read,
+            'records_inserted': self.records_inserted,
+            'records_already_present': self.records_already_present,
+            'records_failed': self.records_failed,
+            'chunks_written': self.chunks_written,
+            'retries': self.retries,
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'records_per_second': round(throughput, 1),
+            'failures': list(self.failures)
+        }
+
+    def _write_chunk(self, chunk):
+        """
+        _write_chunk() -- BulkLoader private method
+
+        Writes one chunk, retrying the transient failures with backoff, and accounts for every record in the chunk.
+        Records without an idempotency key are given a token, and every record without a created time is stamped --
+        whether or not it came with its token -- so the incremental extracts and created-range exports see it.  A
+        created time that came with the record is kept.
+
+        :param chunk:   list of (input index, record) tuples
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     stamp created independently of the token
+
+        """
+        stamp = int(time.time())
+        for index, record in chunk:
+            created = record.get('created', stamp)
+            if self.idempotency_key not in record:
+                self.mongo_toolbox.add_meta_fields(record)
+            record['created'] = created
+        target = self.mongo_toolbox.get_collection(self.db, self.collection)
+        pending = chunk
+        attempt = 0
+        while len(pending) > 0:
+            retry, last_error = [], None
+            try:
+                result = target.insert_many([record for index, record in pending], ordered=False)
+                self.records_inserted += len(result.inserted_ids)
+            except mongo_errors.BulkWriteError as e:
+                retry = self._account_write_errors(pending, e.details)
+                last_error = e
+            except (mongo_errors.AutoReconnect, mongo_errors.ConnectionFailure) as e:
+                # the chunk may have partially landed -- the replay reports those records as already present
+                retry, last_error = pending, e
+            except mongo_errors.OperationFailure as e:
+                if self._is_transient(e.code, e) is False:
+                    self._fail_records(pending, e.code, str(e))
+                    break
+                retry, last_error = pending, e
+            except (mongo_errors.PyMongoError, Exception) as e:
+                print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+                self._fail_records(pending, None, '%s - %s' % (e.__class__.__name__, e))
+                break
+
+            if len(retry) > 0 and attempt >= self.max_retries:
+                self._fail_records(retry, getattr(last_error, 'code', None),
+                                   'gave up after %d retries: %s' % (attempt, last_error))
+                retry = []
+            if len(retry) > 0:
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                self.retries += 1
+            pending = retry
+        self.chunks_written += 1
+
+    def _account_write_errors(self, pending, details):
+        """
+        _account_write_errors() -- BulkLoader private method
+
+        Parses the details of a BulkWriteError: counts the inserted and already-present records, records the
+        permanent failures, and returns the records that should be retried.
+
+        If the chunk failed the write concern, the records it inserted may not survive a failover, so we don't count
+        them as inserted -- they're retried with the transient failures, and come back as already present if they
+        did survive.
+
+        :param pending:     list of (input index, record) tuples that were sent in the insert_many() request
+        :param details:     dictionary containing the details of the BulkWriteError
+        :return:            list of (input index, record) tuples to retry
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        retry = []
+        failed_positions = set()
+        for write_error in details.get('writeErrors', []):
+            position = write_error['index']
+            failed_positions.add(position)
+            code = write_error.get('code')
+            if self._is_replay(write_error):
+                self.records_already_present += 1
+            elif self._is_transient(code):
+                retry.append(pending[position])
+            else:
+                self._fail_records([pending[position]], code, write_error.get('errmsg'))
+        if len(details.get('writeConcernErrors', [])) > 0:
+            retry += [entry for position, entry in enumerate(pending) if position not in failed_positions]
+        else:
+            self.records_inserted += details.get('nInserted', 0)
+        return retry
+
+    def _is_replay(self, write_error):
+        # a duplicate on the idempotency key, or on the _id assigned on an earlier attempt, means it's already written
+        if write_error.get('code') not in constants.BULK_LOAD_DUPLICATE_KEY_CODES:
+            return False
+        key_pattern = write_error.get('keyPattern')
+        if key_pattern is not None:
+            return list(key_pattern) in ([self.idempotency_key], ['_id'])
+        match = re.search(r'index: (\S+) dup key', write_error.get('errmsg', ''))
+        return match is not None and match.group(1) in (self.idempotency_key + '_1', '_id_')
+
+    @staticmethod
+    def _is_transient(code, error=None):
+        if error is not None and hasattr(error, 'has_error_label') and error.has_error_label('RetryableWriteError'):
+            return True
+        return code in constants.BULK_LOAD_TRANSIENT_ERROR_CODES
+
+    def _backoff(self, attempt):
+        # capped exponential backoff, with jitter so that parallel loaders don't retry in lock-step
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _fail_records(self, entries, code, errmsg):
+        self.records_failed += len(entries)
+        for index, record in entries:
+            if len(self.failures) < self.max_errors:
+                self.failures.append({
+                    'index': index,
+                    'token': record.get(self.idempotency_key),
+                    'code': code,
+                    'errmsg': errmsg
+                })
+
+    def _reset_counters(self):
+        self.status = False
+        self.records_read = 0
+        self.records_inserted = 0
+        self.records_already_present = 0
+        self.records_failed = 0
+        self.chunks_written = 0
+        self.retries = 0
+        self.elapsed_time = 0.0
+        self.failures = []
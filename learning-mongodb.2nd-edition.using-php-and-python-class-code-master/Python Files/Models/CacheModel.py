@@ -0,0 +1,236 @@
+from collections import OrderedDict
+import threading
+import time
+
+"""
+CacheModel.py -- bounded, in-process LRU cache with time-to-live expiry
+
+This is a small, thread-safe cache used to keep hot documents (or any other lookup result) in memory:
+
+    - the cache holds at most max_size entries -- when it's full, the least-recently-used entry is evicted
+    - every entry expires ttl seconds after it was stored (a per-entry ttl can be given when storing the entry)
+    - hit, miss, eviction and expiration counters are kept so the effectiveness of the cache can be measured
+    - a value can be stored under several keys at once (set_many()) -- the keys form a group, and invalidating any
+      one of them invalidates them all, even after the other keys were evicted or expired on their own
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     added key groups
+
+"""
+
+
+class LRUCache:
+    """
+    LRUCache -- least-recently-used cache with TTL
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    max_size = None
+    ttl = None
+    hits = 0
+    misses = 0
+    evictions = 0
+    expirations = 0
+
+    def __init__(self, max_size, ttl):
+        """
+        __init__() -- LRUCache instantiation method
+
+        :param max_size:    integer - the maximum number of entries held in the cache
+        :param ttl:         number - the default time-to-live, in seconds, of a cache entry
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # key: the frozenset of keys stored with it by set_many() -- kept while any key of the group is cached
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        get() -- LRUCache method
+
+        Returns the value cached under key or, if the key is not in the cache (or has expired), the default value.
+        A hit moves the entry to the most-recently-used position.
+
+        :param key:     the cache key (any hashable value)
+        :param default: the value returned on a cache miss
+        :return:        the cached value, or the default
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._discard(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        set() -- LRUCache method
+
+        Stores the value under key, evicting the least-recently-used entry if the cache is full.
+
+        :param key:     the cache key (any hashable value)
+        :param value:   the value to cache
+        :param ttl:     optional time-to-live, in seconds, overriding the cache default for this entry
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+
+    def set_many(self, keys, value, ttl=None):
+        """
+        set_many() -- LRUCache method
+
+        Stores the value under each of the keys, as one group: invalidating any key of the group invalidates every
+        key of the group.  The group is remembered for as long as any of its keys is cached, so a key that outlived the
+        others (a key that kept getting hits while the others were evicted, say) is still invalidated with them.  Any
+        earlier group of one of the keys is invalidated first.
+
+        :param keys:    list of cache keys
+        :param value:   the value to cache
+        :param ttl:     optional time-to-live, in seconds, overriding the cache default for this entry
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        group = frozenset(keys)
+        with self._lock:
+            for key in group:
+                self._invalidate_group(key)
+            for key in group:
+                self._groups[key] = group
+                self._store(key, value, expires_at)
+
+    def invalidate(self, key):
+        """
+        invalidate() -- LRUCache method
+
+        Removes the key from the cache, if present, along with the other keys of its group (see set_many()).  The
+        hit and miss counters aren't touched.
+
+        :param key:     the cache key
+        :return:        Boolean indicating if an entry was removed
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     invalidate the key's group
+
+        """
+        with self._lock:
+            return self._invalidate_group(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self):
+        """
+        stats() -- LRUCache method
+
+        Returns a dictionary containing the cache counters, the current size and the hit ratio.
+
+        :return: dictionary of cache statistics
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups > 0 else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, value, expires_at):
+        # called with the lock held
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (value, expires_at)
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key):
+        # called with the lock held -- the group is forgotten once none of its keys is cached
+        self._entries.pop(key, None)
+        group = self._groups.get(key)
+        if group is not None and not any(member in self._entries for member in group):
+            for member in group:
+                if self._groups.get(member) is group:
+                    del self._groups[member]
+
+    def _invalidate_group(self, key):
+        # called with the lock held
+        removed = False
+        for member in self._groups.get(key, (key,)):
+            removed = self._entries.pop(member, None) is not None or removed
+            self._groups.pop(member, None)
+        return removed
@@ -0,0 +1,144 @@
+from pymongo import MongoClient
+import os
+import threading
+
+"""
+ConnectionRegistryModel.py -- process-wide registry of MongoClient objects
+
+A MongoClient object is expensive: each one owns a connection pool, background monitor threads and, when we connect
+over TLS, a handshake for every new socket.  It's also thread-safe, so there is no reason for a process to hold more
+than one client per connection configuration.
+
+This model keeps a single MongoClient for each distinct (uri, options) configuration.  The MongoConnectorModel asks
+the registry for its client instead of building a new one on each instantiation.
+
+MongoClient objects are not fork-safe -- a child process must never use a client created by its parent.  After a
+fork, the registry discards (without closing) any inherited clients, so the child builds its own on first use.  This
+makes the registry safe to use with pre-fork servers and multiprocessing workers.
+
+Call close_all() when the application shuts down.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+_clients = {}
+_lock = threading.Lock()
+_owner_pid = os.getpid()
+
+
+def get_client(mongo_uri, client_options):
+    """
+    get_client() -- registry function
+
+    Returns the shared MongoClient for the connection configuration, creating (and registering) the client if this is
+    the first request for the configuration in the current process.
+
+    There are two input parameters:
+
+    mongo_uri -- the mongodb:// connection string
+    client_options -- a dictionary of keyword arguments for the MongoClient constructor
+
+    :param mongo_uri:       string containing the connection uri
+    :param client_options:  dictionary of MongoClient keyword arguments
+    :return:                a MongoClient object
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    _check_owner_pid()
+    key = _make_key(mongo_uri, client_options)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = MongoClient(mongo_uri, **client_options)
+            _clients[key] = client
+    return client
+
+
+def close_all():
+    """
+    close_all() -- registry function
+
+    Closes every registered client, releasing the pooled sockets and stopping the monitor threads, and empties the
+    registry.  This should be called when the application shuts down.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    _check_owner_pid()
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def client_count():
+    """
+    client_count() -- registry function
+
+    :return: the number of clients currently registered in this process
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    _check_owner_pid()
+    return len(_clients)
+
+
+def reset_after_fork():
+    """
+    reset_after_fork() -- registry function
+
+    Invoked in a child process immediately after a fork.  The inherited clients share sockets with the parent, so we
+    drop them without calling close() (which would send end-session commands over the parent's sockets).  We also
+    replace the lock, as it may have been held by another thread in the parent at the moment of the fork.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    global _lock, _owner_pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _owner_pid = os.getpid()
+
+
+def _check_owner_pid():
+    # os.register_at_fork() is not available on all platforms/versions, so we also check the pid on every access
+    if _owner_pid != os.getpid():
+        reset_after_fork()
+
+
+def _make_key(mongo_uri, client_options):
+    # option values are not always hashable (e.g. lists of event listeners), so we key on their repr()
+    return mongo_uri, tuple(sorted((name, repr(value)) for name, value in client_options.items()))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
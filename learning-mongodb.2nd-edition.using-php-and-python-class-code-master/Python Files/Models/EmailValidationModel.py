@@ -0,0 +1,288 @@
+from Models import CacheModel
+from shared import constants
+from concurrent.futures import Future, ThreadPoolExecutor
+import re
+import socket
+import threading
+
+"""
+EmailValidationModel.py -- cached, concurrent, email-domain validation
+
+Validating an email address with validate_email(check_mx=True, verify=True) costs a DNS MX lookup, and an SMTP probe,
+for every address -- it's by far the slowest step in account creation.  But the expensive part of the answer, "can
+this domain receive mail?", is the same for every address at the domain.
+
+This model validates the address syntax locally, and caches the result of the MX lookup per domain:
+
+    - a domain with MX records is cached for EMAIL_DOMAIN_TTL seconds
+    - a domain without MX records is (negatively) cached for EMAIL_DOMAIN_NEGATIVE_TTL seconds
+    - a lookup that fails (timeout, server failure) is not cached -- the address fails validation and the domain
+      will be looked up again on the next request
+
+Concurrent requests for the same domain share a single lookup, and validate_many() resolves every distinct domain in
+a batch once, with bounded concurrency.
+
+DNS resolution is pluggable: a resolver is any object with a resolve_mx(domain) method returning the list of mail
+hosts for the domain (an empty list if there are none) and raising an exception if the lookup failed.  The default
+SystemResolver uses dnspython when it's installed; StaticResolver is a local fake for testing.
+
+The SMTP probe of each address can't be cached, and is still made by default (EMAIL_SMTP_VERIFY) -- so an address is
+valid exactly when validate_email(check_mx=True, verify=True) said it was.  Skipping the probe (smtp_verify=False)
+is an explicit downgrade to the MX check.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     dnspython 2 resolve(), the lookup count is updated under the lock
+10-17-26        mks     the SMTP probe is on by default
+
+"""
+
+
+class SystemResolver:
+    """
+    SystemResolver -- MX lookups using the host's DNS configuration
+
+    If the dnspython package is installed, we query the MX records for the domain.  Otherwise, we fall back to an
+    address lookup of the domain itself (an implicit MX, per RFC 5321).
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     use resolve() -- query() is deprecated in dnspython 2
+
+    """
+    timeout = None
+
+    def __init__(self, timeout=constants.EMAIL_DNS_TIMEOUT):
+        self.timeout = timeout
+
+    def resolve_mx(self, domain):
+        try:
+            import dns.resolver
+            import dns.exception
+        except ImportError:
+            return self._resolve_address(domain)
+        resolver = dns.resolver.Resolver()
+        resolver.lifetime = self.timeout
+        # resolve() replaced the deprecated query() in dnspython 2.0 -- older releases only have query()
+        lookup = resolver.resolve if hasattr(resolver, 'resolve') else resolver.query
+        try:
+            answers = lookup(domain, 'MX')
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return []
+        return [str(answer.exchange).rstrip('.') for answer in answers]
+
+    @staticmethod
+    def _resolve_address(domain):
+        try:
+            socket.getaddrinfo(domain, 25)
+        except socket.gaierror as e:
+            if e.errno in (socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)):
+                return []
+            raise
+        return [domain]
+
+
+class StaticResolver:
+    """
+    StaticResolver -- fake resolver for testing
+
+    Answers MX lookups from a dictionary of {domain: [mail hosts]}; unknown domains have no mail hosts.  The number
+    of lookups made is counted, so tests can confirm that each domain is resolved only once.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    lookups = 0
+
+    def __init__(self, mx_records):
+        self.mx_records = dict(mx_records)
+        self._lock = threading.Lock()
+
+    def resolve_mx(self, domain):
+        with self._lock:
+            self.lookups += 1
+        return list(self.mx_records.get(domain, []))
+
+
+class EmailDomainValidator:
+    """
+    EmailDomainValidator -- validates email addresses with a per-domain result cache
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    resolver = None
+    domain_cache = None
+    negative_ttl = None
+    max_workers = None
+    smtp_verify = True
+    lookups = 0
+
+    def __init__(self, resolver=None, ttl=constants.EMAIL_DOMAIN_TTL, negative_ttl=constants.EMAIL_DOMAIN_NEGATIVE_TTL,
+                 max_workers=constants.EMAIL_DOMAIN_WORKERS, cache_size=constants.EMAIL_DOMAIN_CACHE_SIZE,
+                 smtp_verify=constants.EMAIL_SMTP_VERIFY):
+        """
+        __init__() -- EmailDomainValidator instantiation method
+
+        All of the input parameters are optional:
+
+        resolver -- the object used for MX lookups; defaults to a SystemResolver
+        ttl -- seconds a domain with mail hosts stays cached
+        negative_ttl -- seconds a domain without mail hosts stays cached
+        max_workers -- maximum number of concurrent lookups made by validate_many()
+        cache_size -- maximum number of domains held in the cache
+        smtp_verify -- if True, addresses that pass the domain check are also verified with an SMTP probe through
+        validate_email(verify=True) -- the default.  The probe is per-address and cannot be cached: turning it off is
+        an explicit downgrade to the MX check.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     the SMTP probe is on by default
+
+        """
+        self.resolver = resolver if resolver is not None else SystemResolver()
+        self.domain_cache = CacheModel.LRUCache(cache_size, ttl)
+        self.negative_ttl = negative_ttl
+        self.max_workers = max(1, int(max_workers))
+        self.smtp_verify = smtp_verify
+        self._pattern = re.compile(constants.EMAIL_PATTERN)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def validate(self, email):
+        """
+        validate() -- EmailDomainValidator method
+
+        Validates a single email address: the syntax is checked locally, and then the domain is checked for mail
+        hosts (from the cache, if possible).
+
+        :param email:   string containing the email address
+        :return:        Boolean indicating if the address is valid
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        domain = self.get_domain(email)
+        if domain is None or self._check_domain(domain) is False:
+            return False
+        return self._verify_mailbox(email)
+
+    def validate_many(self, emails):
+        """
+        validate_many() -- EmailDomainValidator method
+
+        Validates a batch of email addresses.  Each distinct domain in the batch that isn't already cached is
+        resolved exactly once, with at most max_workers lookups in flight.
+
+        :param emails:  a list of email address strings
+        :return:        a list of Booleans, one per address, in input order
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        domains = [self.get_domain(email) for email in emails]
+        distinct = set(domain for domain in domains if domain is not None)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(distinct)))) as executor:
+            results = dict(zip(distinct, executor.map(self._check_domain, distinct)))
+        return [domain is not None and results[domain] is True and self._verify_mailbox(email)
+                for email, domain in zip(emails, domains)]
+
+    def get_domain(self, email):
+        """
+        get_domain() -- EmailDomainValidator method
+
+        :param email:   string containing the email address
+        :return:        the (lower-cased) domain of a syntactically valid address, otherwise None
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        match = self._pattern.match(email or '')
+        return match.group(1).lower() if match is not None else None
+
+    def _check_domain(self, domain):
+        """
+        _check_domain() -- EmailDomainValidator private method
+
+        Returns the cached answer for the domain or, on a miss, resolves the domain.  If another thread is already
+        resolving the same domain, we wait for its answer instead of making a second lookup.
+
+        :param domain:  string containing the domain
+        :return:        Boolean indicating if the domain has mail hosts
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     count the lookup under the lock
+
+        """
+        cached = self.domain_cache.get(domain)
+        if cached is not None:
+            return cached
+        with self._lock:
+            pending = self._pending.get(domain)
+            owner = pending is None
+            if owner:
+                pending = Future()
+                self._pending[domain] = pending
+                self.lookups += 1
+        if owner is False:
+            return pending.result()
+
+        result = False
+        try:
+            result = len(self.resolver.resolve_mx(domain)) > 0
+            self.domain_cache.set(domain, result, None if result else self.negative_ttl)
+        except Exception as e:
+            print('MX lookup for %s failed: %s - %s' % (domain, e.__class__, e))
+        finally:
+            with self._lock:
+                del self._pending[domain]
+            pending.set_result(result)
+        return result
+
+    def _verify_mailbox(self, email):
+        if self.smtp_verify is False:
+            return True
+        from validate_email import validate_email
+        return validate_email(email, verify=True) is True
@@ -0,0 +1,330 @@
+from bson import json_util
+from pymongo import errors as mongo_errors
+from shared import constants
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import os
+import time
+
+"""
+ExportModel.py -- parallel, streaming, collection export
+
+A single cursor over the whole collection leaves the export bound to one python thread.  The CollectionExporter
+splits the collection into ranges of the partition field (_id, by default, or any other indexed field such as
+created), and scans the ranges in parallel -- one thread, one cursor, and one output file per range.  The threads
+spend most of their time waiting on the network, or compressing, and both release the GIL.
+
+    - the range boundaries are picked from a $sample of the partition field, so the ranges hold roughly the same
+      number of records whatever the distribution of the values
+    - each range is streamed to its own (gzip-compressed, by default) file, one server batch at a time, so memory per
+      partition is bounded by the batch size
+    - the bson format uses raw batch cursors: the server's batches are written to the file without ever being decoded
+      -- the files can be restored with mongorestore, or read back with MongoToolbox.iterate_raw_documents()
+    - the jsonl format writes each record as MongoDB extended JSON, one record per line
+
+As with find_records(), the bcrypt password hashes aren't exported unless the projection asks for them.
+
+The partitions are read through the analytics read route by default (see MongoToolbox.configure_read_routes()), so
+an export is served by a secondary where there is one, and doesn't compete with the application for the primary.
+
+The boundary $sample and the count of the matching records are read through the same route as the partitions.
+
+The range queries only match values of the same BSON type as the boundaries, so the partition field should hold a
+single type (e.g. not a mix of string and ObjectId _ids): the export compares the number of records exported with the
+number that match the query filter, and fails if they differ.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     partitions are read through a read route
+10-17-26        mks     a count mismatch fails the export, the sample and count use the read route
+
+"""
+
+
+class CollectionExporter:
+    """
+    CollectionExporter -- exports a collection as a set of partition files
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_toolbox = None
+    output_dir = None
+    file_format = None
+    partitions = None
+    partition_field = None
+    workers = None
+    batch_size = None
+    compress = True
+    query_filter = None
+    projection = None
+    db = None
+    collection = None
+    read_route = None
+    elapsed_time = 0.0
+    records_expected = None
+    partition_reports = None
+
+    def __init__(self, mongo_toolbox, output_dir, file_format=constants.EXPORT_FORMAT_JSONL,
+                 partitions=constants.EXPORT_PARTITIONS, partition_field='_id', workers=constants.EXPORT_WORKERS,
+                 batch_size=constants.EXPORT_BATCH_SIZE, compress=True, query_filter=None, projection=None, db=None,
+                 collection=None, read_route=constants.EXPORT_READ_ROUTE):
+        """
+        __init__() -- CollectionExporter instantiation method
+
+        There are two required input parameters -- an instantiated MongoToolbox, and the directory the files are
+        written to (it's created if it doesn't exist) -- and the following optional parameters:
+
+        file_format -- jsonl or bson
+        partitions -- the number of ranges (and output files) the collection is split into
+        partition_field -- the indexed field the collection is split on
+        workers -- the number of partitions exported at the same time
+        batch_size -- the number of records fetched from the server per round trip
+        compress -- gzip the output files
+        query_filter, projection -- only export the matching records, and the projected fields
+        db, collection -- alternative database/collection names
+        read_route -- the read route the partitions are read through; None uses the client's read preference
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the read route
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.partitions = max(1, int(partitions))
+        self.partition_field = partition_field
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.compress = compress
+        self.query_filter = query_filter or {}
+        self.projection = projection
+        self.db = db
+        self.collection = collection
+        self.read_route = read_route
+        self.partition_reports = []
+
+    def export(self):
+        """
+        export() -- CollectionExporter method
+
+        Computes the partition ranges, exports the partitions in parallel, and returns the export report.  The export
+        fails (status False) if any read failed, or if the number of records exported isn't the number of records
+        matching the query filter -- records whose partition field holds a different BSON type than the boundaries
+        fall outside every range.
+
+        :return:    a dictionary containing the export report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     fail on a count mismatch
+
+        """
+        if self.file_format not in (constants.EXPORT_FORMAT_JSONL, constants.EXPORT_FORMAT_BSON):
+            raise ValueError('unsupported export format: %s' % self.file_format)
+        start_time = time.time()
+        os.makedirs(self.output_dir, exist_ok=True)
+        filters = self.partition_filters(self.partition_boundaries())
+        # the toolbox read methods trap their exceptions -- any error in any partition is left in last_error
+        self.mongo_toolbox.last_error = None
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(filters))) as executor:
+            self.partition_reports = list(executor.map(self._export_partition, range(len(filters)), filters))
+        self.records_expected = self._count_expected()
+        exported = sum(report['records'] for report in self.partition_reports)
+        self.status = self.mongo_toolbox.last_error is None and self.records_expected == exported
+        if self.records_expected is not None and self.records_expected != exported:
+            print('exported %d records, but %d match the query filter' % (exported, self.records_expected))
+        self.elapsed_time = time.time() - start_time
+        return self.report()
+
+    def report(self):
+        """
+        report() -- CollectionExporter method
+
+        Returns a dictionary describing the last export: the status, the number of records exported and the number
+        of records matching the query filter when the export ran (the export fails unless they're equal), the bytes
+        written, the elapsed time and throughput, and a report (file name, query filter, records, bytes) for each
+        partition.
+
+        :return:    dictionary containing the export report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     the expected count is taken by export()
+
+        """
+        exported = sum(report['records'] for report in self.partition_reports)
+        throughput = exported / self.elapsed_time if self.elapsed_time > 0 else 0.0
+        return {
+            'status': self.status,
+            'records_exported': exported,
+            'records_expected': self.records_expected,
+            'bytes_written': sum(report['bytes'] for report in self.partition_reports),
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'records_per_second': round(throughput, 1),
+            'partitions': list(self.partition_reports)
+        }
+
+    def partition_boundaries(self):
+        """
+        partition_boundaries() -- CollectionExporter method
+
+        Picks the partitions - 1 values of the partition field that split the collection into ranges of roughly the
+        same size: we $sample EXPORT_SAMPLES_PER_PARTITION records per partition, sort the sampled values, and take
+        evenly spaced values from the sorted list.  Duplicate boundaries (a field with few distinct values) are
+        dropped, so there may be fewer partitions than requested.  The sample is read through the export's read route.
+
+        :return:    a sorted list of boundary values -- empty, if the collection can't be (or needn't be) split
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     sample through the read route
+
+        """
+        if self.partitions == 1:
+            return []
+        samples = self.partitions * constants.EXPORT_SAMPLES_PER_PARTITION
+        pipeline = [
+            {'$match': self.query_filter},
+            {'$sample': {'size': samples}},
+            {'$project': {'_id': 0, 'value': '$' + self.partition_field}},
+            {'$match': {'value': {'$ne': None}}},
+            {'$sort': {'value': 1}}
+        ]
+        try:
+            collection = self.mongo_toolbox.get_collection(self.db, self.collection)
+            target = self.mongo_toolbox._routed('export_sample', collection, self.read_route)
+            values = [record['value'] for record in target.aggregate(pipeline)]
+        except (mongo_errors.PyMongoError, Exception) as e:
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return []
+        boundaries = []
+        for i in range(1, self.partitions):
+            value = values[i * len(values) // self.partitions] if len(values) > 0 else None
+            if value is not None and (len(boundaries) == 0 or value != boundaries[-1]):
+                boundaries.append(value)
+        return boundaries
+
+    def partition_filters(self, boundaries):
+        """
+        partition_filters() -- CollectionExporter method
+
+        Builds one query filter per range: below the first boundary, between each pair of boundaries, and from the
+        last boundary up.  Records where the partition field is missing (or null) are included in the first range.
+
+        :param boundaries:  a sorted list of boundary values
+        :return:            a list of query filters
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        field = self.partition_field
+        if len(boundaries) == 0:
+            ranges = [{}]
+        else:
+            ranges = [{'$or': [{field: {'$lt': boundaries[0]}}, {field: None}]}]
+            for lower, upper in zip(boundaries, boundaries[1:]):
+                ranges.append({field: {'$gte': lower, '$lt': upper}})
+            ranges.append({field: {'$gte': boundaries[-1]}})
+        if len(self.query_filter) == 0:
+            return ranges
+        return [{'$and': [self.query_filter, partition]} if partition else self.query_filter for partition in ranges]
+
+    def _count_expected(self):
+        # the number of records matching the query filter, through the read route -- None if the count failed
+        try:
+            collection = self.mongo_toolbox.get_collection(self.db, self.collection)
+            target = self.mongo_toolbox._routed('export_count', collection, self.read_route)
+            return target.count_documents(self.query_filter)
+        except (mongo_errors.PyMongoError, Exception) as e:
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return None
+
+    def _export_partition(self, number, partition_filter):
+        """
+        _export_partition() -- CollectionExporter private method
+
+        Streams the records in one range to the partition's output file.  Runs on the thread pool.
+
+        :param number:              integer - the partition number, used in the file name
+        :param partition_filter:    dictionary containing the query filter for the range
+        :return:                    dictionary containing the partition report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     read through the read route
+
+        """
+        collection_name = self.mongo_toolbox.get_collection(self.db, self.collection).name
+        file_name = os.path.join(self.output_dir, '%s-%04d.%s%s' % (collection_name, number, self.file_format,
+                                                                   '.gz' if self.compress else ''))
+        records, bytes_written = 0, 0
+        with (gzip.open(file_name, 'wb', compresslevel=constants.EXPORT_COMPRESS_LEVEL) if self.compress
+              else open(file_name, 'wb')) as output_file:
+            if self.file_format == constants.EXPORT_FORMAT_BSON:
+                for batch in self.mongo_toolbox.find_raw_batches(partition_filter, self.projection,
+                                                                 batch_size=self.batch_size, db=self.db,
+                                                                 collection=self.collection,
+                                                                 read_route=self.read_route):
+                    output_file.write(batch)
+                    records += _count_documents(batch)
+                    bytes_written += len(batch)
+            else:
+                for record in self.mongo_toolbox.find_records(partition_filter, self.projection,
+                                                              batch_size=self.batch_size, db=self.db,
+                                                              collection=self.collection, read_route=self.read_route):
+                    line = (json_util.dumps(record) + '\n').encode()
+                    output_file.write(line)
+                    records += 1
+                    bytes_written += len(line)
+        return {
+            'file': file_name,
+            'query_filter': json_util.dumps(partition_filter),
+            'records': records,
+            'bytes': bytes_written
+        }
+
+
+def _count_documents(batch):
+    # walk the length prefixes of the concatenated documents -- nothing is decoded
+    count, position = 0, 0
+    while position < len(batch):
+        position += int.from_bytes(batch[position:position + 4], 'little')
+        count += 1
+    return count
@@ -0,0 +1,188 @@
+from Models import HelperModel as Helper
+from shared import constants
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+
+"""
+HashServiceModel.py -- Model for off-thread, multi-core password hashing
+
+bcrypt is deliberately expensive -- hashing a single password at the default cost factor takes a significant fraction
+of a second of CPU time.  When we hash passwords inline (HelperModel.hash_string) on the request thread, we're capped
+at a few dozen account creates per second per core.
+
+This model wraps a process pool so password hashing can be spread across all of the cores on the host.  There is a
+batch API, hash_many(), which returns the hashes in the same order as the input passwords, and a future-based API,
+submit(), for single passwords.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+
+def _hash_password(password, rounds):
+    """
+    _hash_password() -- hash service worker function
+
+    This is the function executed in the worker processes -- it has to be a module-level function so that it can be
+    pickled and sent to the pool.
+
+    :param password:    clear-text password string
+    :param rounds:      bcrypt cost factor
+    :return:            the bcrypt hash of the password
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    return Helper.hash_string(password, rounds)
+
+
+class HashService:
+    """
+    HashService -- process-pool backed password hashing
+
+    The pool is created when the class is instantiated and must be shut down by calling close() (or by using the
+    service as a context manager) when the application exits.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    rounds = None
+    workers = None
+    chunk_size = None
+    executor = None
+
+    def __init__(self, workers=None, rounds=constants.BCRYPT_ROUNDS, chunk_size=constants.HASH_SERVICE_CHUNK_SIZE):
+        """
+        __init__() -- HashService instantiation method
+
+        All of the input parameters are optional:
+
+        workers -- the number of worker processes in the pool; defaults to the number of cores on the host
+        rounds -- the bcrypt cost factor used for every hash generated by the service
+        chunk_size -- the number of passwords sent to a worker in a single task by hash_many(); larger values reduce
+        the inter-process overhead at the cost of coarser load-balancing
+
+        :param workers:     integer - number of worker processes
+        :param rounds:      integer - bcrypt cost factor
+        :param chunk_size:  integer - number of passwords per worker task in batch requests
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.rounds = rounds
+        self.chunk_size = max(1, int(chunk_size))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.status = True
+
+    def submit(self, password):
+        """
+        submit() -- HashService method
+
+        Queues a single password for hashing and returns a concurrent.futures.Future -- call result() on the future
+        to retrieve the hash.
+
+        :param password:    clear-text password string
+        :return:            a Future that resolves to the bcrypt hash of the password
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return self.executor.submit(_hash_password, password, self.rounds)
+
+    def hash_string(self, password):
+        """
+        hash_string() -- HashService method
+
+        A blocking drop-in replacement for HelperModel.hash_string() -- the hash is generated in the pool, so the
+        calling thread is idle (and not holding the GIL) while bcrypt runs.
+
+        :param password:    clear-text password string
+        :return:            the bcrypt hash of the password
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return self.submit(password).result()
+
+    def hash_many(self, passwords):
+        """
+        hash_many() -- HashService method
+
+        Hashes a batch of passwords across the pool.  The hashes are returned as a list in the same order as the
+        input passwords.
+
+        :param passwords:   an iterable of clear-text password strings
+        :return:            list of bcrypt hashes, in input order
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return list(self.executor.map(_hash_password, passwords, itertools.repeat(self.rounds),
+                                      chunksize=self.chunk_size))
+
+    def close(self, wait=True):
+        """
+        close() -- HashService method
+
+        Shuts down the process pool.  If wait is True (default) then we block until all of the pending hashes have
+        been completed.
+
+        :param wait:    boolean - wait for pending work to complete
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+        self.status = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -1,5 +1,9 @@
+import importlib.util
+import math
+import os
+import sys
+import threading
 import uuid
-import bcrypt
 
 """
     HelpModel.py
@@ -14,10 +18,66 @@ import bcrypt
     HISTORY:
     ========
     01-06-19        mks     original coding
+    10-17-26        mks     added percentile()
+    10-17-26        mks     added generate_guids()
+    10-17-26        mks     added lazy_import(), bcrypt is imported lazily
+    10-17-26        mks     the lazy bcrypt module is loaded under a lock
 
 """
 
 
+def lazy_import(name):
+    """
+    lazy_import() -- helper function
+
+    Returns the named module without executing it: the module is registered in sys.modules, but its code only runs
+    the first time one of its attributes is used.  Short-lived invocations (a CLI that runs a single delete, a
+    serverless handler) then only pay for the dependencies the code path actually uses.
+
+    The name is resolved immediately, so a missing module still raises ImportError here and not on first use.  Note
+    that resolving a submodule (e.g. http.server) imports its parent package.
+
+    The module is loaded by the first attribute access, and (before python 3.12) that load isn't thread-safe: a lazy
+    module that can be first used from several threads at once must have its first use guarded by a lock (see
+    hash_string()).
+
+    :param name:    string containing the (absolute) module name
+    :return:        the module object
+    :raises ImportError: if the module can't be found
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     documented the thread-safety of the first use
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError('No module named %s' % name, name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # bind the submodule to its package, as the import statement would
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+# bcrypt is only needed when a password is hashed -- the first hash can come from any of the hashing threads, so
+# the module is loaded under a lock
+bcrypt = lazy_import('bcrypt')
+_bcrypt_lock = threading.Lock()
+_bcrypt_loaded = False
+
+
 def generate_guid():
     """
     generate_guid() -- helper function
@@ -38,7 +98,29 @@ def generate_guid():
     return str(uuid.uuid4()).upper()
 
 
-def hash_string(some_string):
+def generate_guids(count):
+    """
+    generate_guids() -- helper function
+
+    The batch version of generate_guid(): returns a list of count upper-cased, version-4, GUIDs.  The random bits
+    for the entire batch are read from the OS in a single call, instead of one call per GUID.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    :param count:   integer - the number of GUIDs to generate
+    :return:        a list of 36-character GUIDs (with hashes) converted to upper case letters
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    random_bytes = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=random_bytes[i:i + 16], version=4)).upper() for i in range(0, 16 * count, 16)]
+
+
+def hash_string(some_string, rounds=None):
     """
     hash_string() -- helper function
 
@@ -46,20 +128,35 @@ def hash_string(some_string):
 
     a string value that should be the user's password -- this is the value that will be encrypted.
 
+    The optional second parameter is the bcrypt cost factor (log2 rounds) -- if not provided, we use the bcrypt
+    default.
+
     The function returns the encrypted password.
 
+    The first call loads the (lazily imported) bcrypt module under a lock, as the hashing thread pools can make their
+    first calls concurrently.
+
     @author     mshallop@linux.com
     @version    1.0
 
     :param some_string:  the string to be bcrypt'd-hashed
+    :param rounds:       optional integer bcrypt cost factor
     :return: returns the encrypted strung
 
     HISTORY:
     ========
     01-06-19        mks     original coding
+    10-17-26        mks     added the optional cost factor
+    10-17-26        mks     load bcrypt under a lock on first use
 
     """
-    return bcrypt.hashpw(some_string.encode(), bcrypt.gensalt())
+    global _bcrypt_loaded
+    if _bcrypt_loaded is False:
+        with _bcrypt_lock:
+            bcrypt.gensalt      # the first attribute access runs the module
+            _bcrypt_loaded = True
+    salt = bcrypt.gensalt() if rounds is None else bcrypt.gensalt(rounds)
+    return bcrypt.hashpw(some_string.encode(), salt)
 
 
 def validate_password_length(password):
@@ -94,3 +191,29 @@ def validate_password_length(password):
         return_value = False
 
     return return_value, return_message
+
+
+def percentile(sorted_values, percent):
+    """
+    percentile() -- helper function
+
+    This function requires two input parameters: a list of numbers, already sorted in ascending order, and the
+    percentile (0-100) to return.  We use the nearest-rank method, so the value returned is always one of the
+    values in the list.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    :param sorted_values:   list of numbers, sorted ascending
+    :param percent:         number between 0 and 100
+    :return: the value at the percentile, or None if the list is empty
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    if len(sorted_values) == 0:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
@@ -0,0 +1,231 @@
+from bson import json_util
+from Models import IndexManagerModel
+from shared import constants
+import gzip
+import json
+import os
+import time
+
+"""
+IncrementalExtractModel.py -- incremental change extract keyed on created/last_updated
+
+The downstream sync used to re-export the whole collection every night.  insert_one_record() (and the other insert
+paths) stamp every record with created, and UserModel.update_user() stamps last_updated, so the records that changed
+since the last run can be found with two index-backed range queries.  The IncrementalExtractor:
+
+    - keeps a high-water mark in a small JSON state file
+    - streams the records created or updated since the high-water mark, and the tombstones of the records deleted
+      since the high-water mark (see MongoToolbox.delete_records(tombstone=True)), to a JSONL change file
+    - only moves the high-water mark forward once the change file is complete -- a failed run is simply repeated
+
+Every line of the change file is a MongoDB extended JSON document:
+
+    {"op": "upsert", "document": {...}}
+    {"op": "delete", "_id": ..., "token": ..., "deleted_at": ...}
+
+The timestamps are stamped by the application servers, and a write can commit after a later timestamp was read, so
+each run starts OVERLAP seconds before the high-water mark: the extract is at-least-once, and the downstream apply
+must be idempotent (upsert by _id, delete by _id).  The very first run, without a high-water mark, is a full extract.
+
+The extract reads from the primary with a majority read concern (the INCREMENTAL_READ_ROUTE read route), whatever
+the client's read preference: a secondary lagging by more than the overlap would otherwise miss changes for good, as
+the high-water mark moves past them.
+
+With the created_1__id_1 and last_updated_1 indexes (see IndexManagerModel), the cost of a run scales with the
+number of changes, not with the size of the collection.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     the extract reads from the primary, with a majority read concern
+
+"""
+
+
+class IncrementalExtractor:
+    """
+    IncrementalExtractor -- extracts the changes since the previous run
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_toolbox = None
+    state_file = None
+    overlap = None
+    batch_size = None
+    projection = None
+    db = None
+    collection = None
+    records_upserted = 0
+    records_deleted = 0
+    elapsed_time = 0.0
+
+    def __init__(self, mongo_toolbox, state_file=constants.INCREMENTAL_STATE_FILE,
+                 overlap=constants.INCREMENTAL_OVERLAP_SECONDS, batch_size=constants.EXPORT_BATCH_SIZE,
+                 projection=None, db=None, collection=None):
+        """
+        __init__() -- IncrementalExtractor instantiation method
+
+        There is one required input parameter - an instantiated MongoToolbox - and the following optional parameters:
+
+        state_file -- the JSON file holding the high-water mark
+        overlap -- the number of seconds before the high-water mark each run starts at
+        batch_size -- the number of records fetched from the server per round trip
+        projection -- the fields extracted; as with find_records(), the password hash is excluded by default
+        db, collection -- alternative database/collection names
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        self.state_file = state_file
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.projection = projection
+        self.db = db
+        self.collection = collection
+
+    def extract(self, output_file):
+        """
+        extract() -- IncrementalExtractor method
+
+        Writes the changes since the high-water mark to the output file (gzip-compressed if the name ends in .gz) and,
+        if the extract completed, saves the time the run started as the new high-water mark.  The changes are written
+        to a temporary file that's renamed when it's complete, so a failed run never leaves a partial change file.
+
+        :param output_file: string containing the path of the change file
+        :return:            a dictionary containing the extract report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        start_time = time.time()
+        run_started = int(start_time)
+        high_water_mark = self.load_state().get('high_water_mark')
+        since = high_water_mark - self.overlap if high_water_mark is not None else None
+        self.records_upserted, self.records_deleted = 0, 0
+        self.mongo_toolbox.last_error = None
+
+        temp_file = output_file + '.tmp'
+        with (gzip.open(temp_file, 'wb') if output_file.endswith('.gz') else open(temp_file, 'wb')) as change_file:
+            for change in self.changes(since):
+                change_file.write((json_util.dumps(change) + '\n').encode())
+                if change['op'] == 'upsert':
+                    self.records_upserted += 1
+                else:
+                    self.records_deleted += 1
+
+        # the toolbox read methods trap their exceptions -- an error leaves the high-water mark where it was
+        self.status = self.mongo_toolbox.last_error is None
+        if self.status is True:
+            os.replace(temp_file, output_file)
+            self.save_state({'high_water_mark': run_started, 'previous_high_water_mark': high_water_mark,
+                             'records_upserted': self.records_upserted, 'records_deleted': self.records_deleted})
+        else:
+            os.remove(temp_file)
+        self.elapsed_time = time.time() - start_time
+        return {
+            'status': self.status,
+            'file': output_file if self.status is True else None,
+            'since': since,
+            'high_water_mark': run_started if self.status is True else high_water_mark,
+            'records_upserted': self.records_upserted,
+            'records_deleted': self.records_deleted,
+            'elapsed_seconds': round(self.elapsed_time, 3)
+        }
+
+    def changes(self, since=None):
+        """
+        changes() -- IncrementalExtractor method
+
+        A generator that yields the change events since the given time: an upsert event for every record created or
+        updated at, or after, the time, and then a delete event for every tombstone written at, or after, the time.
+        If since is None, every record is yielded as an upsert (and no deletes).
+
+        :param since:   integer - seconds since the epoch, or None
+        :return:        yields each change event as a dictionary
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     read from the primary, with a majority read concern
+
+        """
+        query_filter = {} if since is None else self.changed_filter(since)
+        for record in self.mongo_toolbox.find_records(query_filter, self.projection, batch_size=self.batch_size,
+                                                      db=self.db, collection=self.collection,
+                                                      read_route=constants.INCREMENTAL_READ_ROUTE):
+            yield {'op': 'upsert', 'document': record}
+        if since is None:
+            return
+        tombstones = self.mongo_toolbox.tombstone_collection(self.db, self.collection)
+        for tombstone in self.mongo_toolbox.find_records({'deleted_at': {'$gte': since}}, None,
+                                                         batch_size=self.batch_size, db=tombstones.database.name,
+                                                         collection=tombstones.name,
+                                                         read_route=constants.INCREMENTAL_READ_ROUTE):
+            yield {'op': 'delete', '_id': tombstone['_id'], 'token': tombstone.get('token'),
+                   'deleted_at': tombstone['deleted_at']}
+
+    def ensure_indexes(self):
+        """
+        ensure_indexes() -- IncrementalExtractor method
+
+        Creates any missing index the extract relies on: the created and last_updated indexes on the collection, and
+        the deleted_at index on its tombstone collection.
+
+        :return:    Boolean indicating if all of the indexes exist
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        tombstones = self.mongo_toolbox.tombstone_collection(self.db, self.collection)
+        collection_status = IndexManagerModel.IndexManager(self.mongo_toolbox, db=self.db,
+                                                           collection=self.collection).ensure_indexes()
+        tombstone_status = IndexManagerModel.IndexManager(self.mongo_toolbox, IndexManagerModel.TOMBSTONE_INDEXES,
+                                                          tombstones.database.name, tombstones.name).ensure_indexes()
+        return collection_status and tombstone_status
+
+    def load_state(self):
+        # a missing state file means this is the first run
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as state:
+            return json.load(state)
+
+    def save_state(self, state):
+        # write-and-rename, so the state file is never left half-written
+        with open(self.state_file + '.tmp', 'w') as state_output:
+            json.dump(state, state_output, indent=2, sort_keys=True)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    @staticmethod
+    def changed_filter(since):
+        # each $or branch is a range on its own index: created_1__id_1 and last_updated_1
+        return {'$or': [{'created': {'$gte': since}}, {'last_updated': {'$gte': since}}]}
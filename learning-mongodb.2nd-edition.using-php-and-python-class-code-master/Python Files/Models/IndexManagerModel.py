@@ -0,0 +1,300 @@
+from pymongo import errors as mongo_errors
+from pymongo import IndexModel, ASCENDING
+
+"""
+IndexManagerModel.py -- declarative index management for the toolbox collections
+
+The toolbox relies on indexes that, until now, nobody created: without them, every uniqueness check and every
+lookup by username, email or token is a collection scan.  This model declares the indexes a collection should have,
+reports on the difference between the declaration and what actually exists on the server, and creates the missing
+indexes.  It's intended to be run at application start-up, or on demand from an admin tool.
+
+An index declaration is a dictionary:
+
+    name    -- the index name
+    keys    -- a list of (field, direction) tuples
+    options -- optional dictionary of index options passed to the server (unique, sparse, expireAfterSeconds...)
+
+With the unique indexes in place, the account-creation path no longer needs the check_for_existing_account() round
+trip -- a duplicate username or email is rejected by the server with a DuplicateKeyError.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     added the last_updated and tombstone indexes for incremental extracts
+10-17-26        mks     added the expire_at TTL index for expiring deletes
+10-17-26        mks     added the unique index check
+10-17-26        mks     added the TTL index check
+
+"""
+
+# the TTL index expiring deletes rely on
+USER_EXPIRY_INDEX = 'expire_at_1'
+
+# the indexes the toolbox relies on for the users collection
+USER_INDEXES = [
+    {'name': 'username_1', 'keys': [('username', ASCENDING)], 'options': {'unique': True}},
+    {'name': 'email_1', 'keys': [('email', ASCENDING)], 'options': {'unique': True}},
+    {'name': 'token_1', 'keys': [('token', ASCENDING)], 'options': {'unique': True}},
+    {'name': 'created_1__id_1', 'keys': [('created', ASCENDING), ('_id', ASCENDING)]},
+    {'name': 'last_updated_1', 'keys': [('last_updated', ASCENDING)]},
+    # TTL: the server's TTL monitor removes a user once its expire_at date has passed (see UserModel.delete_users())
+    {'name': USER_EXPIRY_INDEX, 'keys': [('expire_at', ASCENDING)],
+     'options': {'expireAfterSeconds': 0, 'sparse': True}}
+]
+
+# the indexes for the tombstone collection written by delete_records(tombstone=True)
+TOMBSTONE_INDEXES = [
+    {'name': 'deleted_at_1', 'keys': [('deleted_at', ASCENDING)]}
+]
+
+
+class IndexManager:
+    """
+    IndexManager -- ensure and report on declared indexes
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_toolbox = None
+    collection = None
+    index_specs = None
+
+    def __init__(self, mongo_toolbox, index_specs=None, db=None, collection=None):
+        """
+        __init__() -- IndexManager instantiation method
+
+        There is one required input parameter - an instantiated MongoToolbox - and three optional parameters:
+
+        index_specs -- a list of index declarations (see the module description); defaults to USER_INDEXES plus any
+        additional indexes that are configured later via add_index()
+        db -- alternative database name
+        collection -- alternative collection name
+
+        :param mongo_toolbox:   an instantiated MongoToolbox object
+        :param index_specs:     optional list of index declarations
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        self.collection = mongo_toolbox.get_collection(db, collection)
+        self.index_specs = list(USER_INDEXES if index_specs is None else index_specs)
+
+    def add_index(self, name, keys, **options):
+        """
+        add_index() -- IndexManager method
+
+        Adds an index declaration to the manager -- this is how anything beyond the default indexes is configured.
+
+        :param name:    string containing the index name
+        :param keys:    list of (field, direction) tuples
+        :param options: index options, e.g. unique=True
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.index_specs = [spec for spec in self.index_specs if spec['name'] != name]
+        self.index_specs.append({'name': name, 'keys': list(keys), 'options': options})
+
+    def report(self):
+        """
+        report() -- IndexManager method
+
+        Compares the declared indexes to the indexes on the server and returns a dictionary of lists:
+
+        missing     -- declared indexes that do not exist on the server
+        mismatched  -- declared indexes that exist under the same name but with different keys or options
+        extra       -- indexes on the server that were not declared (the _id index is ignored)
+        building    -- index builds currently in progress on the collection
+        present     -- declared indexes that exist and match
+
+        If the server can't be queried, we display the error and return None.
+
+        :return: dictionary containing the index report, or None on error
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        try:
+            existing = self.collection.index_information()
+        except (mongo_errors.PyMongoError, Exception) as e:
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return None
+
+        report = {'missing': [], 'mismatched': [], 'extra': [], 'building': self._index_builds(), 'present': []}
+        declared = set()
+        for spec in self.index_specs:
+            declared.add(spec['name'])
+            info = existing.get(spec['name'])
+            if info is None:
+                report['missing'].append(spec['name'])
+            elif self._matches(spec, info) is False:
+                report['mismatched'].append(spec['name'])
+            else:
+                report['present'].append(spec['name'])
+        for name in existing:
+            if name != '_id_' and name not in declared:
+                report['extra'].append(name)
+        return report
+
+    def ensure_indexes(self):
+        """
+        ensure_indexes() -- IndexManager method
+
+        Creates every declared index that's missing from the server.  Mismatched indexes are reported but never
+        dropped and rebuilt automatically -- rebuilding a unique index on a large collection is an operational
+        decision, not something we want to happen as a side effect of an application restart.
+
+        The status member is set to True only if, after the call, every declared index is present and matches its
+        declaration.
+
+        :return: Boolean indicating if all of the declared indexes are in place
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.status = False
+        report = self.report()
+        if report is None:
+            return False
+        missing = [spec for spec in self.index_specs if spec['name'] in report['missing']]
+        if len(missing) > 0:
+            try:
+                self.collection.create_indexes([IndexModel(spec['keys'], name=spec['name'],
+                                                           **spec.get('options', {})) for spec in missing])
+            except (mongo_errors.PyMongoError, Exception) as e:
+                print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+                return False
+        for name in report['mismatched']:
+            print('index %s exists but does not match its declaration' % name)
+        self.status = len(report['mismatched']) == 0
+        return self.status
+
+    def unique_indexes_present(self):
+        """
+        unique_indexes_present() -- IndexManager method
+
+        Checks, without creating anything, that every declared unique index exists and matches its declaration -- the
+        check for code that relies on the server to reject duplicate users (see UserModel rely_on_unique_indexes).
+        The missing or mismatched unique indexes are displayed.
+
+        :return: Boolean indicating if all of the declared unique indexes are in place
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        report = self.report()
+        if report is None:
+            return False
+        absent = [spec['name'] for spec in self.index_specs
+                  if spec.get('options', {}).get('unique') is True and spec['name'] not in report['present']]
+        for name in absent:
+            print('unique index %s is missing, or does not match its declaration' % name)
+        return len(absent) == 0
+
+    def expiry_index_present(self):
+        """
+        expiry_index_present() -- IndexManager method
+
+        Checks, without creating anything, that the expire_at TTL index exists and matches its declaration -- the
+        check for expiring deletes (see UserModel.delete_users()): without the index, the expired users are hidden
+        from the lookups but never removed.  A missing or mismatched index is displayed.
+
+        :return: Boolean indicating if the TTL index is in place
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        report = self.report()
+        if report is None:
+            return False
+        if USER_EXPIRY_INDEX not in report['present']:
+            print('TTL index %s is missing, or does not match its declaration' % USER_EXPIRY_INDEX)
+            return False
+        return True
+
+    def _index_builds(self):
+        """
+        _index_builds() -- IndexManager private method
+
+        Returns a list of the index builds in progress on the collection, taken from the server's currentOp output.
+        The currentOp command requires elevated privileges on some deployments -- if it fails, we return an empty
+        list rather than failing the report.
+
+        :return: list of dictionaries describing the in-progress builds
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        database = self.collection.database
+        try:
+            result = database.client.admin.command({'currentOp': True, 'command.createIndexes': self.collection.name})
+        except (mongo_errors.PyMongoError, Exception):
+            return []
+        builds = []
+        for operation in result.get('inprog', []):
+            command = operation.get('command', {})
+            if operation.get('ns', '').startswith(database.name + '.'):
+                builds.append({
+                    'indexes': [index.get('name') for index in command.get('indexes', [])],
+                    'progress': operation.get('progress'),
+                    'msg': operation.get('msg')
+                })
+        return builds
+
+    @staticmethod
+    def _matches(spec, info):
+        # compare the key pattern and the options we declared -- the server adds others (v, ns) which we ignore
+        if [tuple(key) for key in info.get('key', [])] != [tuple(key) for key in spec['keys']]:
+            return False
+        for option, value in spec.get('options', {}).items():
+            if info.get(option) != value:
+                return False
+        return True
@@ -0,0 +1,485 @@
+from pymongo import monitoring
+from bson import BSON
+from Models import HelperModel as Helper
+from shared import constants
+import bisect
+import functools
+import threading
+import time
+
+"""
+MetricsModel.py -- per-operation latency and throughput instrumentation
+
+There are two sources of measurements:
+
+1. toolbox timers -- every instrumented MongoToolbox method is wrapped by the timed() decorator, which records the
+   latency of the call, the number of documents it touched, and the class of any exception it trapped, keyed by
+   operation, database, collection and the connection profile the toolbox selected for the operation -- so the effect
+   of a profile can be compared with the default settings.
+2. command monitoring -- the CommandMetricsListener is registered with the MongoClient (see MongoConnectorModel) and
+   records the server round-trip time of every command pyMongo sends, keyed by command name, database and
+   collection.  Measuring the request size means encoding every command a second time -- full insert_many batches
+   included -- so it's opt-in (the commandMonitoringBytes setting), and the byte counters stay at 0 without it.  A
+   single toolbox call can issue several commands (e.g. insert_many_records on a large batch, or a cursor's getMore
+   requests), so the two views complement each other.
+
+Latencies are kept in fixed-bucket histograms, so memory is constant regardless of traffic.  The registry can be
+read through snapshot() (a dictionary) or to_prometheus() (the Prometheus text exposition format), and
+start_exporter() serves the Prometheus text over HTTP for scraping.
+
+The module-level registry is the one used by the toolbox and the command listener.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     operations are also keyed by connection profile
+10-17-26        mks     the HTTP server is imported lazily, when the exporter is started
+10-17-26        mks     request sizes are opt-in, and the exporter listens on localhost by default
+10-17-26        mks     the general-purpose counters are exported as typed _total counters
+
+"""
+
+# the exporter's HTTP server is only needed by long-running services
+http_server = Helper.lazy_import('http.server')
+
+
+class Histogram:
+    """
+    Histogram -- fixed-bucket latency histogram
+
+    Bucket upper bounds are in seconds; observations larger than the last bound are counted in the implicit +Inf
+    bucket.  Percentiles are estimated as the upper bound of the bucket that contains the percentile.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        target = percent / 100.0 * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = []
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            buckets.append((self.bounds[i] if i < len(self.bounds) else float('inf'), cumulative))
+        return {
+            'count': self.count,
+            'sum_seconds': self.sum,
+            'p50_seconds': self.percentile(50),
+            'p95_seconds': self.percentile(95),
+            'p99_seconds': self.percentile(99),
+            'buckets': buckets
+        }
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry -- thread-safe store of operation and command metrics
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+
+    def __init__(self, bounds=constants.METRICS_LATENCY_BUCKETS):
+        self.bounds = list(bounds)
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._commands = {}
+        self._errors = {}
+        self._counters = {}
+
+    def record_operation(self, operation, database, collection, seconds, documents=0, error=None,
+                         profile=constants.PROFILE_DEFAULT):
+        """
+        record_operation() -- MetricsRegistry method
+
+        Records one toolbox call.
+
+        :param operation:   string - the toolbox operation (method) name
+        :param database:    string - the database name
+        :param collection:  string - the collection name
+        :param seconds:     float - the latency of the call
+        :param documents:   integer - the number of documents the call touched
+        :param error:       optional exception trapped by the call
+        :param profile:     string - the connection profile the call used
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the profile label
+
+        """
+        key = (operation, database, collection, profile)
+        with self._lock:
+            entry = self._operations.get(key)
+            if entry is None:
+                entry = {'histogram': Histogram(self.bounds), 'documents': 0, 'errors': 0}
+                self._operations[key] = entry
+            entry['histogram'].observe(seconds)
+            entry['documents'] += documents or 0
+            if error is not None:
+                entry['errors'] += 1
+                error_key = (operation, error.__class__.__name__)
+                self._errors[error_key] = self._errors.get(error_key, 0) + 1
+
+    def record_command(self, command, database, collection, seconds, bytes_sent, failed=False):
+        """
+        record_command() -- MetricsRegistry method
+
+        Records one command round trip, as reported by the command listener.
+
+        :param command:     string - the command name (insert, update, find, getMore...)
+        :param database:    string - the database name
+        :param collection:  string - the collection name, if the command targets one
+        :param seconds:     float - the round-trip time
+        :param bytes_sent:  integer - the size of the encoded command
+        :param failed:      boolean - the command failed
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        key = (command, database, collection)
+        with self._lock:
+            entry = self._commands.get(key)
+            if entry is None:
+                entry = {'histogram': Histogram(self.bounds), 'bytes_sent': 0, 'failures': 0}
+                self._commands[key] = entry
+            entry['histogram'].observe(seconds)
+            entry['bytes_sent'] += bytes_sent
+            if failed:
+                entry['failures'] += 1
+
+    def increment(self, name, labels=None, amount=1):
+        """
+        increment() -- MetricsRegistry method
+
+        Increments a general-purpose counter, identified by name and an optional dictionary of labels.
+
+        :param name:    string - the counter name
+        :param labels:  optional dictionary of label names and values
+        :param amount:  the amount to add to the counter
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """
+        snapshot() -- MetricsRegistry method
+
+        Returns a copy of every metric as a dictionary -- operations are keyed by "name/database/collection@profile",
+        commands by "name/database/collection", errors by "operation/error class", and counters by "name{labels}".
+
+        :return: dictionary containing the metrics
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the profile label
+
+        """
+        with self._lock:
+            operations = {}
+            for (operation, database, collection, profile), entry in self._operations.items():
+                summary = entry['histogram'].snapshot()
+                summary.update(documents=entry['documents'], errors=entry['errors'])
+                operations['%s/%s/%s@%s' % (operation, database, collection, profile)] = summary
+            commands = {}
+            for (command, database, collection), entry in self._commands.items():
+                summary = entry['histogram'].snapshot()
+                summary.update(bytes_sent=entry['bytes_sent'], failures=entry['failures'])
+                commands['%s/%s/%s' % (command, database, collection)] = summary
+            errors = dict(('%s/%s' % key, count) for key, count in self._errors.items())
+            counters = dict(('%s{%s}' % (name, ','.join('%s=%s' % label for label in labels)), count)
+                            for (name, labels), count in self._counters.items())
+        return {'operations': operations, 'commands': commands, 'errors': errors, 'counters': counters}
+
+    def to_prometheus(self):
+        """
+        to_prometheus() -- MetricsRegistry method
+
+        Renders the metrics in the Prometheus text exposition format.  The general-purpose counters are exported
+        with a _total suffix (e.g. read_route_decisions_total), under one TYPE line per counter name.
+
+        :return: string containing the metrics
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the profile label
+        10-17-26        mks     typed _total names for the general-purpose counters
+
+        """
+        lines = []
+        with self._lock:
+            lines += ['# TYPE mongo_toolbox_operation_seconds histogram']
+            for (operation, database, collection, profile), entry in sorted(self._operations.items()):
+                labels = _labels(operation=operation, database=database, collection=collection, profile=profile)
+                lines += _histogram_lines('mongo_toolbox_operation_seconds', labels, entry['histogram'])
+            lines += ['# TYPE mongo_toolbox_documents_total counter']
+            for (operation, database, collection, profile), entry in sorted(self._operations.items()):
+                labels = _labels(operation=operation, database=database, collection=collection, profile=profile)
+                lines.append('mongo_toolbox_documents_total{%s} %d' % (labels, entry['documents']))
+            lines += ['# TYPE mongo_toolbox_errors_total counter']
+            for (operation, error_class), count in sorted(self._errors.items()):
+                lines.append('mongo_toolbox_errors_total{%s} %d' % (_labels(operation=operation,
+                                                                            error_class=error_class), count))
+            lines += ['# TYPE mongo_command_seconds histogram']
+            for (command, database, collection), entry in sorted(self._commands.items()):
+                labels = _labels(command=command, database=database, collection=collection)
+                lines += _histogram_lines('mongo_command_seconds', labels, entry['histogram'])
+            lines += ['# TYPE mongo_command_bytes_sent_total counter']
+            for (command, database, collection), entry in sorted(self._commands.items()):
+                labels = _labels(command=command, database=database, collection=collection)
+                lines.append('mongo_command_bytes_sent_total{%s} %d' % (labels, entry['bytes_sent']))
+            typed = None
+            for (name, labels), count in sorted(self._counters.items()):
+                name = name if name.endswith('_total') else name + '_total'
+                if name != typed:
+                    lines += ['# TYPE %s counter' % name]
+                    typed = name
+                lines.append('%s{%s} %s' % (name, _labels(**dict(labels)), count))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._commands.clear()
+            self._errors.clear()
+            self._counters.clear()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    CommandMetricsListener -- pyMongo command-monitoring listener
+
+    Pass an instance to the MongoClient in the event_listeners option.  Measuring the request size means encoding
+    the command a second time, on the hot path, so it's only done with measure_bytes=True.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     measure_bytes defaults to False
+
+    """
+
+    def __init__(self, metrics_registry, measure_bytes=False):
+        self.metrics_registry = metrics_registry
+        self.measure_bytes = measure_bytes
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        bytes_sent = len(BSON.encode(event.command)) if self.measure_bytes else 0
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.database_name, collection if isinstance(collection, str) else '', bytes_sent)
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+    def _finish(self, event, failed):
+        with self._lock:
+            database, collection, bytes_sent = self._pending.pop((event.connection_id, event.request_id),
+                                                                 (event.database_name, '', 0))
+        self.metrics_registry.record_command(event.command_name, database, collection,
+                                             event.duration_micros / 1000000.0, bytes_sent, failed)
+
+
+def timed(operation, documents=None, query=None):
+    """
+    timed() -- metrics decorator
+
+    Decorates a MongoToolbox method so that every call is recorded in the toolbox's metrics registry.  The toolbox
+    methods trap their exceptions and save them in the last_error member, which is how the decorator learns the
+    error class.
+
+    If the toolbox has a slow_operation_recorder (see SlowOperationModel), and the method has a query function, the
+    call's query filter and latency are also passed to the recorder.
+
+    :param operation:   string - the operation name recorded in the metrics
+    :param documents:   optional function of (toolbox, result, args) returning the number of documents touched
+    :param query:       optional function of (toolbox, args, kwargs) returning the query filter used by the call
+    :return:            the decorator
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     pass slow calls to the toolbox's slow-operation recorder
+    10-17-26        mks     record the connection profile used by the call
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self.last_error = None
+            start_time = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            elapsed = time.perf_counter() - start_time
+            touched = documents(self, result, args) if documents is not None and result is not False else 0
+            self.metrics.record_operation(operation, _name_of(self.database), _name_of(self.collection), elapsed,
+                                          touched, self.last_error, self.profile_name(operation))
+            if query is not None and self.slow_operation_recorder is not None:
+                self.slow_operation_recorder.observe(self, operation, query(self, args, kwargs), elapsed,
+                                                     kwargs.get('db'), kwargs.get('collection'))
+            return result
+        return wrapper
+    return decorator
+
+
+def argument(position, name):
+    """
+    argument() -- metrics helper function
+
+    Builds a timed() query function that returns one of the decorated method's arguments, whether it was passed by
+    position or by name.
+
+    :param position:    integer - the position of the argument, not counting self
+    :param name:        string - the name of the argument
+    :return:            a function of (toolbox, args, kwargs)
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    return lambda toolbox, args, kwargs: args[position] if len(args) > position else kwargs.get(name)
+
+
+def start_exporter(port=constants.METRICS_EXPORTER_PORT, host=constants.METRICS_EXPORTER_HOST,
+                   metrics_registry=None):
+    """
+    start_exporter() -- metrics helper function
+
+    Starts a background HTTP server that answers every GET request with the Prometheus text for the registry.  By
+    default the server only listens on the loopback interface -- pass the host explicitly to expose it.
+
+    :param port:                integer - the port to listen on
+    :param host:                string - the interface to listen on
+    :param metrics_registry:    optional MetricsRegistry; defaults to the module registry
+    :return:                    the HTTPServer object (call shutdown() on it to stop the exporter)
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+    10-17-26        mks     lazily imported HTTP server
+    10-17-26        mks     listen on localhost by default
+
+    """
+    source = metrics_registry if metrics_registry is not None else registry
+
+    class ExporterHandler(http_server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = source.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, message_format, *args):
+            pass
+
+    server = http_server.HTTPServer((host, port), ExporterHandler)
+    threading.Thread(target=server.serve_forever, name='MetricsExporter', daemon=True).start()
+    return server
+
+
+def _name_of(resource):
+    # the toolbox overrides can leave a string (rather than a pyMongo object) in the database/collection members
+    return getattr(resource, 'name', resource if isinstance(resource, str) else '')
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in sorted(labels.items()))
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for i, bucket_count in enumerate(histogram.counts):
+        cumulative += bucket_count
+        bound = '+Inf' if i == len(histogram.bounds) else repr(histogram.bounds[i])
+        lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+    lines.append('%s_sum{%s} %r' % (name, labels, histogram.sum))
+    lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+    return lines
+
+
+# the process-wide registry used by the toolbox, and the listeners that feed it the command timings -- without, and
+# with, the request sizes
+registry = MetricsRegistry()
+command_listener = CommandMetricsListener(registry)
+command_size_listener = CommandMetricsListener(registry, measure_bytes=True)
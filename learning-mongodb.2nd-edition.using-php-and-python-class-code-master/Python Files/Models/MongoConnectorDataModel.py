@@ -7,19 +7,69 @@ If a field is not-applicable, then ensure that it is populated with a None value
 
 Also included are some data payloads used for testing various CRUD operations
 
+The settings below are the defaults -- none of them need to be edited in code.  When the class is instantiated, the
+defaults are overridden, in order, by:
+
+1. a JSON configuration file: the config_file parameter or, if not given, the file named by the MONGO_CONFIG_FILE
+   environment variable.  The file holds an object whose keys are the member names below, e.g.:
+
+        {"uri": "mongo.example.com", "readPreference": "primary", "ssl": null, "profile": "bulk-throughput",
+         "operationProfiles": {"insert_many_records": "bulk-throughput"}}
+
+2. environment variables: MONGO_ followed by the member name in upper snake case -- MONGO_URI, MONGO_PORT,
+   MONGO_READ_PREFERENCE, MONGO_AUTH_DB, MONGO_PROFILE...  The string settings (CONFIG_STRING_SETTINGS in the
+   constants: uri, login, password, authDB, replSetName...) are taken verbatim; the other values are parsed as JSON
+   where they can be (numbers, booleans, null, lists, objects), and taken as plain strings where they can't.  To unset
+   a string setting, set it to null in the configuration file.
+
+The uri setting (MONGO_URI) is either the host name of a single node, combined with the port setting, or a full
+connection string -- mongodb://db:27017/?replicaSet=rs0 or mongodb+srv://... -- which is used as it is, and overrides
+the port, replSet and replSetName settings.
+
+Connection profiles are named bundles of tuning settings (see CONNECTION_PROFILES in the constants):
+
+    profile -- the profile whose client options (compression, pool sizes, timeouts) are used to build the client
+    operationProfiles -- maps toolbox operations to profiles, whose write concern, read concern, cursor batch size and
+        time limit are applied to that operation only (see MongoToolbox.configure_profiles())
+    profiles -- the profile definitions; profiles in the configuration file are merged into the built-in profiles
+
+Read routes are named read preferences (see READ_ROUTES in the constants) that individual toolbox reads are sent to:
+
+    operationReadRoutes -- maps toolbox operations to read routes (see MongoToolbox.configure_read_routes())
+    readRoutes -- the route definitions; as with the profiles, the configuration file's routes are merged in
+
 @author     mshallop@linux.com
 @version    1.0
 
 HISTORY:
 ========
 12-29-18        mks     original coding
+10-17-26        mks     added bulk-import settings
+10-17-26        mks     added connection-pool settings
+10-17-26        mks     added the ensure-indexes start-up setting
+10-17-26        mks     added the command-monitoring setting
+10-17-26        mks     added the slow-operation capture setting
+10-17-26        mks     added parallel-load settings
+10-17-26        mks     added incremental extract settings
+10-17-26        mks     settings loaded from a configuration file and the environment, added connection profiles
+10-17-26        mks     added read routes
+10-17-26        mks     added the connect-on-first-use and warm-up settings
+10-17-26        mks     added the command-monitoring request-size setting
+10-17-26        mks     the uri setting accepts a full connection string
+10-17-26        mks     index creation at start-up is opt-in
+10-17-26        mks     string settings are taken verbatim from the environment
 
 """
+from shared import constants
+import copy
+import json
+import os
+import re
 
 
 class MongoConnectorDataModel:
 
-    def __init__(self):
+    def __init__(self, config_file=None, use_environment=True):
         self.uri = '192.168.1.57'
         self.port = 27017
         self.login = None
@@ -32,8 +82,27 @@ class MongoConnectorDataModel:
             'node3': 'host3:port3'
         }]
         self.readPreference = 'secondaryPreferred'
+        self.maxPoolSize = 100              # connection-pool tuning: None means use the pyMongo default
+        self.minPoolSize = 0
+        self.maxIdleTimeMS = None
+        self.waitQueueTimeoutMS = None
+        self.connectTimeoutMS = 500         # timeouts apply to every connection type: None means the pyMongo default
+        self.serverSelectionTimeoutMS = 1000
+        self.socketTimeoutMS = None
+        self.compressors = None             # wire compression, e.g. 'zstd,snappy,zlib'
+        self.connectOnFirstUse = True       # don't open the client's monitors/connections until the first operation
+        self.warmUp = False                 # long-running services: open the pool and select a server at start-up
+        self.profile = constants.PROFILE_DEFAULT
+        self.operationProfiles = {}         # toolbox operation name: profile name
+        self.profiles = copy.deepcopy(constants.CONNECTION_PROFILES)
+        self.operationReadRoutes = dict(constants.READ_ROUTE_OPERATIONS)    # toolbox operation name: route name
+        self.readRoutes = copy.deepcopy(constants.READ_ROUTES)
         self.database = 'test'
         self.table = 'users'
+        self.ensureIndexes = False          # opt-in: create any missing toolbox indexes at start-up
+        self.commandMonitoring = True       # record per-command latency in the metrics registry
+        self.commandMonitoringBytes = False     # opt-in: also record request sizes (re-encodes every command)
+        self.slowOperationMS = None         # opt-in: explain toolbox calls slower than this many milliseconds
         self.ssl = [{
             'peer_name': '192.1688.1.57',
             'verify_peer': True,
@@ -56,3 +125,115 @@ class MongoConnectorDataModel:
                 'work': '555-1213'
             }]
         }]
+        self.bulkImport = [{
+            'source': './users.jsonl',
+            'format': None,                 # None: infer from the file extension
+            'chunk_size': 1000
+        }]
+        self.parallelLoad = [{
+            'workers': 4,                   # 0: load in-process
+            'chunk_size': 1000,
+            'local': False                  # True: workers connect to a stand-alone mongod on localhost
+        }]
+        self.incrementalExtract = [{
+            'output': './users-changes.jsonl.gz',
+            'state_file': './incremental_state.json',
+            'tombstones': True              # deletes leave a tombstone for the extract
+        }]
+
+        # the file, then the environment, override the defaults
+        if config_file is None:
+            config_file = os.environ.get(constants.CONFIG_FILE_ENV)
+        if config_file is not None:
+            self.load_file(config_file)
+        if use_environment is True:
+            self.load_environment()
+
+    def load_file(self, config_file):
+        """
+        load_file() -- MongoConnectorDataModel method
+
+        Overrides the settings with the members of the JSON object in the configuration file.  The profiles (and read
+        routes) in the file are merged into the existing ones: a new name adds a profile, an existing name replaces it.
+
+        :param config_file: string containing the path of the JSON configuration file
+        :raises ValueError: if the file sets a member that doesn't exist
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     merge the read routes
+
+        """
+        with open(config_file) as config:
+            settings = json.load(config)
+        for name, value in settings.items():
+            self._set(name, value)
+
+    def load_environment(self, environ=None):
+        """
+        load_environment() -- MongoConnectorDataModel method
+
+        Overrides the settings with the MONGO_* environment variables -- MONGO_ followed by the member name in upper
+        snake case.  The string settings (CONFIG_STRING_SETTINGS) are used verbatim; for the others, a value that
+        parses as JSON is used as parsed, anything else is used as a string.  MONGO_URI may hold a full connection
+        string, as well as a host name (see the module notes).
+
+        :param environ: optional dictionary of environment variables; defaults to os.environ
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     documented MONGO_URI connection strings
+        10-17-26        mks     take the string settings verbatim
+
+        """
+        environ = os.environ if environ is None else environ
+        for name in list(vars(self)):
+            variable = constants.CONFIG_ENV_PREFIX + re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', name).upper()
+            if variable not in environ:
+                continue
+            value = environ[variable]
+            if name not in constants.CONFIG_STRING_SETTINGS:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            self._set(name, value)
+
+    def get_profile(self, name=None):
+        """
+        get_profile() -- MongoConnectorDataModel method
+
+        Returns the definition of a connection profile -- the client profile if no name is given.
+
+        :param name:        optional string containing the profile name
+        :return:            dictionary containing the profile
+        :raises ValueError: if the profile isn't defined
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        name = self.profile if name is None else name
+        if name not in self.profiles:
+            raise ValueError('unknown connection profile: %s' % name)
+        return self.profiles[name]
+
+    def _set(self, name, value):
+        if not hasattr(self, name):
+            raise ValueError('unknown connection setting: %s' % name)
+        if name in ('profiles', 'readRoutes'):
+            getattr(self, name).update(value)
+        else:
+            setattr(self, name, value)
@@ -1,8 +1,11 @@
 from Models import MongoConnectorDataModel
-from pymongo import MongoClient
+from Models import ConnectionRegistryModel as ConnectionRegistry
+from Models import MetricsModel
 from pymongo import errors as mongo_errors
+from concurrent.futures import ThreadPoolExecutor
 import re
 import ssl
+import time
 
 
 class MongoConnectorModel:
@@ -18,12 +21,13 @@ class MongoConnectorModel:
     directive based on the configuration.  Processing starts as follows:
 
     1. Assign/Initialize local variables (lvars)
-    2. Instantiate the MongoConnectorDataModel class
+    2. Instantiate the MongoConnectorDataModel class, unless a configuration was passed in the connect_data parameter
     3. Assign the read-preference -- if not set, default to primaryPreferred
     4. Create the mongo_uri variable to hold the connection string (argument 1 to MongoClient())
     5. Check if we're using RBAC and, if so, toggle a flag for later processing
     6. Check if we're connecting to a replication-set and, if so, build the replication set member list and tag
-    7. Otherwise, use the default URL:PORT (this works same way for sharded clusters)
+    7. Otherwise, use the default URL:PORT (this works same way for sharded clusters) -- unless the uri setting is
+       already a full connection string (mongodb:// or mongodb+srv://), which is then used as it is
     8. If SSL is enabled and we'll be connecting over TLS, then build one of two connection requests depending
        on the state of the RBAC flag we set in step 5
     9. If SSL is not enabled, then connect either using RBAC or just a simple connection
@@ -32,6 +36,19 @@ class MongoConnectorModel:
     If an exception is trapped, display the exception message and return.  Otherwise, if we connnected to the
     mongoDB service successfully, toggle the class member status to True and return.
 
+    The MongoClient itself is obtained from the ConnectionRegistryModel -- every MongoConnectorModel instantiated with
+    the same configuration (in the same process) shares one client, and so one connection pool.  The pool is tuned by
+    the maxPoolSize, minPoolSize, maxIdleTimeMS and waitQueueTimeoutMS settings in the data model.
+
+    The connect, server-selection and socket timeouts, and the wire compressors, are applied to every connection type,
+    and then the client options of the data model's connection profile (e.g. bulk-throughput) override them.  The
+    configuration used is kept in the connect_data member, so the toolbox can pick up the per-operation profiles.
+
+    With the connectOnFirstUse setting (the default), the client is built with connect=False on every connection type:
+    no monitor threads are started, and no sockets are opened, until the first operation -- a short-lived invocation
+    that fails validation never touches the network.  Long-running services can call warm_up() to pay the server
+    selection and connection set-up before taking traffic.
+
     @author     mshallop@linux.com
     @version    1.0
 
@@ -39,21 +56,32 @@ class MongoConnectorModel:
     ========
     12-29-18        mks     original coding
     01-06-19        mks     corrected SSL parameters for connection resource
+    10-17-26        mks     shared clients via the connection registry, added pool tuning
+    10-17-26        mks     optional command monitoring for the metrics registry
+    10-17-26        mks     optional connect_data parameter
+    10-17-26        mks     timeouts and compression on every connection type, connection profiles
+    10-17-26        mks     connect on first use on every connection type, added warm_up()
+    10-17-26        mks     request-size command monitoring is opt-in
+    10-17-26        mks     accept a full connection string in the uri setting
 
     """
 
     # lvar init
     status = False
+    connect_data = None
 
-    def __init__(self):
+    def __init__(self, connect_data=None):
         # lvar init
         add_auth = False
 
-        connect_data = MongoConnectorDataModel.MongoConnectorDataModel()
+        # the configuration can be passed in (e.g. to a worker process) -- otherwise, use the data model defaults
+        if connect_data is None:
+            connect_data = MongoConnectorDataModel.MongoConnectorDataModel()
         if connect_data.uri is None:
             connect_data.uri = 'localhost'
         if connect_data.port is None:
             connect_data.port = 27017
+        self.connect_data = connect_data
 
         # set the read-preference for this connection
         read_preference = connect_data.readPreference if connect_data.readPreference is not None else 'primaryPreferred'
@@ -65,8 +93,11 @@ class MongoConnectorModel:
         if connect_data.login is not None and connect_data.password is not None and connect_data.authDB is not None:
             add_auth = True
 
+        # a full connection string (e.g. from MONGO_URI) carries its own hosts and options: use it as it is
+        if re.match(r'mongodb(\+srv)?://', connect_data.uri):
+            mongo_uri = connect_data.uri
         # if we're connecting to a replSet, then build the replSet connect string
-        if connect_data.replSetName is not None and connect_data.replSet is not None:
+        elif connect_data.replSetName is not None and connect_data.replSet is not None:
             for replSet_node in connect_data.replSet:
                 mongo_uri += replSet_node + ','
             mongo_uri = re.sub(',$', '', mongo_uri)  # strip trailing comma from string
@@ -74,40 +105,108 @@ class MongoConnectorModel:
         else:           # otherwise, connect to a single node (either mongod or mongos)
             mongo_uri += '%s:%s' % (connect_data.uri, connect_data.port)
 
+        # connection-pool, timeout and compression tuning -- only the options that have been configured are passed to
+        # the client, and the profile's client options override them
+        pool_options = {}
+        for option in ('maxPoolSize', 'minPoolSize', 'maxIdleTimeMS', 'waitQueueTimeoutMS', 'connectTimeoutMS',
+                       'serverSelectionTimeoutMS', 'socketTimeoutMS', 'compressors'):
+            if getattr(connect_data, option, None) is not None:
+                pool_options[option] = getattr(connect_data, option)
+
         # starting with the most complex option, eval the connection config to see how to connect to mongoDB
         try:
             if connect_data.ssl is not None:  # we have SSL config -- connect to the DB using TLS
                 if add_auth:
-                    self.res_mongo = MongoClient(mongo_uri,
-                                                 ssl=True,
-                                                 readPreference=read_preference,
-                                                 username=connect_data.login,
-                                                 password=connect_data.password,
-                                                 authSource=connect_data.authDB,
-                                                 authMechanism='SCRAM-SHA-1',
-                                                 ssl_certfile=connect_data.ssl[0]['cert_file'],
-                                                 ssl_cert_reqs=ssl.CERT_REQUIRED,
-                                                 ssl_ca_certs=connect_data.ssl[0]['key_file'])
+                    client_options = dict(ssl=True,
+                                          readPreference=read_preference,
+                                          username=connect_data.login,
+                                          password=connect_data.password,
+                                          authSource=connect_data.authDB,
+                                          authMechanism='SCRAM-SHA-1',
+                                          ssl_certfile=connect_data.ssl[0]['cert_file'],
+                                          ssl_cert_reqs=ssl.CERT_REQUIRED,
+                                          ssl_ca_certs=connect_data.ssl[0]['key_file'])
                 else:
-                    self.res_mongo = MongoClient(mongo_uri,
-                                                 ssl=True,
-                                                 readPreference=read_preference,
-                                                 connect=False,
-                                                 connectTimeoutMS=500,
-                                                 serverSelectionTimeoutMS=1000,
-                                                 ssl_certfile=connect_data.ssl[0]['cert_file'],
-                                                 ssl_cert_reqs=ssl.CERT_REQUIRED,
-                                                 ssl_ca_certs=connect_data.ssl[0]['key_file'])
+                    client_options = dict(ssl=True,
+                                          readPreference=read_preference,
+                                          ssl_certfile=connect_data.ssl[0]['cert_file'],
+                                          ssl_cert_reqs=ssl.CERT_REQUIRED,
+                                          ssl_ca_certs=connect_data.ssl[0]['key_file'])
             else:
                 # we're not connecting over TLS/SSL
                 if add_auth:
-                    self.res_mongo = MongoClient(mongo_uri,
-                                                 readPreference=read_preference,
-                                                 username=connect_data.login,
-                                                 password=connect_data.password,
-                                                 authSource=connect_data.authDB)
+                    client_options = dict(readPreference=read_preference,
+                                          username=connect_data.login,
+                                          password=connect_data.password,
+                                          authSource=connect_data.authDB)
                 else:
-                    self.res_mongo = MongoClient(mongo_uri, readPreference=read_preference)
+                    client_options = dict(readPreference=read_preference)
+            client_options.update(pool_options)
+            client_options['connect'] = not getattr(connect_data, 'connectOnFirstUse', True)
+            client_options.update(connect_data.get_profile().get('client', {}))
+            if getattr(connect_data, 'commandMonitoring', False):
+                client_options['event_listeners'] = [
+                    MetricsModel.command_size_listener if getattr(connect_data, 'commandMonitoringBytes', False)
+                    else MetricsModel.command_listener]
+            # the registry hands back the process-wide client for this configuration, building it only once
+            self.res_mongo = ConnectionRegistry.get_client(mongo_uri, client_options)
             self.status = True
         except (mongo_errors.ConnectionFailure, Exception) as err:
             print('Exception caught: {0}' . format(err))
+
+    def warm_up(self, connections=None):
+        """
+        warm_up() -- MongoConnectorModel method
+
+        Pays the connection set-up costs ahead of traffic: a ping runs server selection (and, on a new client, the
+        topology discovery, TCP/TLS handshakes and authentication of the first connection), then that many pings are
+        run concurrently, so each checks out its own pooled connection and the pool holds at least minPoolSize open
+        connections before the first request arrives.  The pings are sent to the primary.
+
+        :param connections:     optional integer - the number of connections to open; defaults to minPoolSize
+        :return:                dictionary containing the status, the number of connections, and the timings
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if connections is None:
+            connections = self.connect_data.minPoolSize or 1
+        report = {'status': False, 'connections': connections, 'server_selection_seconds': None,
+                  'pool_seconds': None}
+        if self.status is False:
+            return report
+        try:
+            start_time = time.perf_counter()
+            self.res_mongo.admin.command('ping')
+            report['server_selection_seconds'] = round(time.perf_counter() - start_time, 4)
+            start_time = time.perf_counter()
+            if connections > 1:
+                with ThreadPoolExecutor(max_workers=connections) as executor:
+                    list(executor.map(lambda i: self.res_mongo.admin.command('ping'), range(connections)))
+            report['pool_seconds'] = round(time.perf_counter() - start_time, 4)
+            report['status'] = True
+        except (mongo_errors.PyMongoError, Exception) as e:
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+        return report
+
+    @staticmethod
+    def close_all():
+        """
+        close_all() -- MongoConnectorModel method
+
+        Closes every MongoClient held in the process-wide connection registry -- call this on application shutdown.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        ConnectionRegistry.close_all()
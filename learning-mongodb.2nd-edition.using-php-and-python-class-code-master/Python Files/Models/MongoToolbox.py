@@ -1,5 +1,17 @@
 from pymongo import errors as mongo_errors
+from pymongo import ReplaceOne
+from pymongo import UpdateOne
+from pymongo.read_concern import ReadConcern
+from pymongo import read_preferences
+from pymongo.write_concern import WriteConcern
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
 from Models import HelperModel as Helper
+from Models import MetricsModel
+from shared import constants
+import bson
+import struct
 import time
 
 """
@@ -16,9 +28,30 @@ HISTORY:
 ========
 01-06-19        mks     original coding begins
 01-20-19        mks     refactored for scalable processing and generic data handling
+10-17-26        mks     per-operation latency/throughput instrumentation via MetricsModel
+10-17-26        mks     opt-in slow-operation capture via SlowOperationModel
+10-17-26        mks     pre-encoded (RawBSON) insert path
+10-17-26        mks     raw batch reads
+10-17-26        mks     delete tombstones for incremental extracts
+10-17-26        mks     per-operation connection profiles
+10-17-26        mks     per-call read routing
+10-17-26        mks     batched single-record updates
 
 """
 
+# codec options that split a BSON stream into RawBSONDocuments without decoding them
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+# the encoded token field, up to its value: string type, field name, and the length of a 36-character GUID + null
+RAW_TOKEN_PREFIX = b'\x02token\x00' + struct.pack('<i', 37)
+# the read preference class for each read route mode
+READ_PREFERENCE_MODES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest
+}
+
 
 class MongoToolbox:
     # set up some class member variables
@@ -30,8 +63,28 @@ class MongoToolbox:
     number_records_matched = None
     number_records_updated = None
     number_records_deleted = None
-
-    def __init__(self, mongo_resource):
+    # the write errors of the most recent bulk_update_records() call: {index, code, errmsg}
+    write_errors = None
+    duplicate_key_error = False
+    hash_service = None
+    # reads never return the bcrypt password hash unless the caller explicitly projects it
+    default_projection = {"password": 0}
+    # every instrumented call is recorded in this registry (see MetricsModel); last_error is the exception, if any,
+    # trapped by the most recent call
+    metrics = MetricsModel.registry
+    last_error = None
+    # opt-in SlowOperationRecorder (see SlowOperationModel) -- None disables the slow-operation capture
+    slow_operation_recorder = None
+    # connection profiles (see configure_profiles()) -- operations without a profile use the client's settings
+    profiles = None
+    operation_profiles = None
+    _profiled_collections = None
+    # read routing (see configure_read_routes()) -- reads without a route use the client's read preference
+    read_routes = constants.READ_ROUTES
+    operation_read_routes = constants.READ_ROUTE_OPERATIONS
+    _routed_collections = None
+
+    def __init__(self, mongo_resource, hash_service=None):
         """
         __init__()  --  class instantiation method
 
@@ -42,21 +95,31 @@ class MongoToolbox:
         when we instantiated the mongoConnector model.  From this, we'll derive and assign the mongodb resources
         to class member variables.
 
+        The optional hash_service parameter is an instantiated HashService -- if provided, passwords are hashed in
+        the service's process pool instead of inline on the calling thread.
+
         @author     mshallop@linux.com
         @version    1.0
 
         :param mongo_resource: this is the mongodb resource that was instantiated in the mongoConnector class
         instantiation.
+        :param hash_service:   optional HashService object used for password hashing
 
         HISTORY:
         ========
         01-06-19    mks     original coding
+        10-17-26    mks     added the optional hash service
+        10-17-26    mks     per-call read routing
 
         """
         self.mongo_resource = mongo_resource
+        self.hash_service = hash_service
         self.database = self.mongo_resource.test  # name of our database
         self.collection = self.database.users  # name of the database collection
+        self._routed_collections = {}
 
+    @MetricsModel.timed('check_for_existing_account',
+                        query=lambda toolbox, args, kwargs: toolbox.account_filter(*args, **kwargs))
     def check_for_existing_account(self, user, email):
         """
         check_for_existing_account() -- mongoToolbox method
@@ -76,6 +139,14 @@ class MongoToolbox:
         Build a mongodb query to search for any record with the username OR with the email.  If neither are found in
         the db search, return a boolean(true) value and no diagnostic message.
 
+        We only need to know if *any* record matches, so we use find_one() with an _id-only projection -- with the
+        username and email indexes in place (see IndexManagerModel), each $or branch is an index lookup and the
+        server stops at the first match.
+
+        Note that this check is inherently racy (two clients can pass the check at the same time) -- the unique
+        indexes are the real guarantee, and once they're in place callers can skip this round trip and rely on the
+        DuplicateKeyError trapped by insert_one_record().
+
         :param user:  string containing the user's username
         :param email: string containing the user's email address
         :exception: traps mongo and general exception on the query request
@@ -89,22 +160,47 @@ class MongoToolbox:
         HISTORY:
         ========
         01-06-19        mks     original coding
+        10-17-26        mks     find_one() with an _id projection instead of iterating a full cursor
+        10-17-26        mks     query filter built by account_filter()
+        10-17-26        mks     per-operation connection profile
+        10-17-26        mks     per-call read routing
 
         """
-        user_list = []
         try:
-            found = self.collection.find({"$or": [{"username": user}, {"email": email}]})
-            for user in found:
-                user_list.append(user['username'])
-            if len(user_list) == 0:
+            target = self._routed('check_for_existing_account',
+                                  self._profiled('check_for_existing_account', self.collection))
+            found = target.find_one(self.account_filter(user, email), {"_id": 1})
+            if found is None:
                 return True
             else:
                 print('username or email is already in-use')
                 return False
         except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
             print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
             return False
 
+    @staticmethod
+    def account_filter(user, email):
+        """
+        account_filter() -- mongoToolbox method
+
+        Returns the query filter used by check_for_existing_account(): any record with the username OR the email.
+
+        :param user:  string containing the user's username
+        :param email: string containing the user's email address
+        :return:      dictionary containing the query filter
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return {"$or": [{"username": user}, {"email": email}]}
+
     def add_user(self, user_data):
         """
         add_user() -- mongoToolbox method
@@ -131,11 +227,58 @@ class MongoToolbox:
         HISTORY:
         ========
         01-06-19        mks     original coding
+        10-17-26        mks     hash via the hash service, when configured
 
         """
-        user_data['password'] = Helper.hash_string(user_data['password'])
+        user_data['password'] = self.hash_password(user_data['password'])
         return self.insert_one_record([user_data])
 
+    @MetricsModel.timed('hash_password', lambda toolbox, result, args: 1)
+    def hash_password(self, password):
+        """
+        hash_password() -- mongoToolbox method
+
+        Returns the bcrypt hash of the clear-text password.  If a HashService was assigned to the toolbox, the hash
+        is generated in the service's process pool; otherwise we fall back to the inline HelperModel function.
+
+        :param password:    clear-text password string
+        :return:            the bcrypt hash of the password
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if self.hash_service is not None:
+            return self.hash_service.hash_string(password)
+        return Helper.hash_string(password)
+
+    @MetricsModel.timed('hash_passwords', lambda toolbox, result, args: len(result))
+    def hash_passwords(self, passwords):
+        """
+        hash_passwords() -- mongoToolbox method
+
+        The batch version of hash_password() -- returns a list of hashes in the same order as the input passwords.
+
+        :param passwords:   a list of clear-text password strings
+        :return:            list of bcrypt hashes, in input order
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if self.hash_service is not None:
+            return self.hash_service.hash_many(passwords)
+        return [Helper.hash_string(password) for password in passwords]
+
+    @MetricsModel.timed('insert_one_record', lambda toolbox, result, args: 1)
     def insert_one_record(self, data, db=None, collection=None):
         """
         insert_one_record() -- mongoToolbox method
@@ -157,6 +300,9 @@ class MongoToolbox:
         value if an exception is raised.  Otherwise, the record is inserted -- we'll save the mongo _id value in a
         member variable in case the client needs it later and return a Boolean(true) on a successful insert event.
 
+        If the insert is rejected by a unique index, the duplicate_key_error member is set to True so the calling
+        client can tell a duplicate account apart from any other failure.
+
         :param data:        a list containing a single dictionary record
         :param db:          optional - alternative database name
         :param collection:  optional - alternative collection name
@@ -168,8 +314,11 @@ class MongoToolbox:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     trap duplicate-key errors raised by the unique indexes
+        10-17-26        mks     per-operation connection profile
 
         """
+        self.duplicate_key_error = False
         # check if we're going to override the default db or collection
         if db is not None:
             self.database = self.mongo_resource.db
@@ -182,16 +331,23 @@ class MongoToolbox:
                 data[0]["token"] = Helper.generate_guid()
                 data[0]["created"] = int(time.time())
                 # invoke the pycharm insert_one() method
-                result = self.collection.insert_one(data[0])
+                result = self._profiled('insert_one_record', self.collection).insert_one(data[0])
                 self.new_user_id = result.inserted_id
                 return True
+            except mongo_errors.DuplicateKeyError as e:
+                self.last_error = e
+                self.duplicate_key_error = True
+                print('username or email is already in-use: %s' % e)
+                return False
             except (mongo_errors.PyMongoError, Exception) as e:
+                self.last_error = e
                 print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
                 return False
         else:
             print('Error - data payload for insert_one_record contained more than one record')
             return False
 
+    @MetricsModel.timed('insert_many_records', lambda toolbox, result, args: len(toolbox.new_user_id))
     def insert_many_records(self, data, db=None, collection=None):
         """
         insert_many_records() -- mongoToolbox method
@@ -199,13 +355,13 @@ class MongoToolbox:
         This method is used to perform a database insert when we have more than a single record to be inserted into a
         collection.  There are three input parameters, two of which are optional, to this method:
 
-        The data parameter is an iterable of documents to insert.
+        The data parameter is an iterable of documents to insert -- this can be a list, or a generator, so that
+        callers reading from large files don't have to materialise the entire data set first.
         The db parameter is optional and can be used to override the destination database set in the constructor
         The collection parameter is also optional and can be used to override the collection set in the constructor
 
-        We loop through the list of documents and we first inject the meta fields into every document.  When that's
-        completed, we call the pyMongo insert_many() method to insert all of the records in a single query -- this is,
-        of course, exception-trapped.
+        We lazily inject the meta fields into every document as pyMongo walks the iterable, and call the pyMongo
+        insert_many() method to insert all of the records in a single query -- this is, of course, exception-trapped.
 
         If the insert successfully completes, we return a Boolean(true) to the calling client and store the list of
         mongo _id's in the local member.
@@ -223,27 +379,82 @@ class MongoToolbox:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     accept any iterable (not just an indexable list) so we can stream chunked imports
+        10-17-26        mks     per-operation connection profile
 
         """
         if db is not None:
             self.database = self.mongo_resource.db
         if collection is not None:
             self.collection = collection
-        # ensure that the data has more than 1 record
-        if len(data) <= 1:
+        # ensure that the data has more than 1 record -- we can only check this for sized data sets (lists, tuples)
+        # as generators and other streaming iterables cannot be measured without consuming them
+        if hasattr(data, '__len__') and len(data) <= 1:
             print('insert_many_records requires a data-set with more than one record')
             return False
         try:
-            for i in range(0, len(data)):
-                data[i]["token"] = Helper.generate_guid()
-                data[i]["created"] = int(time.time())
-            result = self.collection.insert_many(data, ordered=False)
+            target = self._profiled('insert_many_records', self.collection)
+            result = target.insert_many(self._inject_meta_fields(data), ordered=False)
             self.new_user_id = result.inserted_ids
             return True
         except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
             print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
             return False
 
+    @MetricsModel.timed('insert_raw_records', lambda toolbox, result, args: len(toolbox.new_user_id))
+    def insert_raw_records(self, data, db=None, collection=None, inject_meta=True):
+        """
+        insert_raw_records() -- mongoToolbox method
+
+        The fast path for bulk inserts of documents that are already BSON-encoded -- for example, documents produced
+        by an upstream process, or read from a mongodump .bson file.  insert_many_records() changes every record in
+        a python loop and pyMongo then encodes each dictionary again; here, the documents are never decoded into
+        dictionaries, and pyMongo sends the encoded bytes as-is.
+
+        The data parameter can be:
+
+            - an iterable of RawBSONDocument objects, or of bytes objects each holding one encoded document
+            - a bytes object holding a stream of concatenated encoded documents
+            - a (binary) file object holding a stream of concatenated encoded documents
+
+        When inject_meta is True (default), the meta fields are spliced into the encoded bytes of each document: the
+        created time is taken, and encoded, once for the whole call, and the tokens are generated in blocks.  The
+        documents must not already contain token or created fields -- pass inject_meta=False for documents that
+        were produced with them.
+
+        A document whose first field isn't _id is given a new ObjectId as its first field, so we can report the _ids
+        of the inserted records in the new_user_id member.  (The BSON encoders always write _id first, so documents
+        with an _id are expected to have it as their first field.)
+
+        :param data:            the encoded documents -- see above
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+        :param inject_meta:     boolean - splice the token and created fields into each document
+        :return:                Boolean indicating if the insert request completed successfully or not
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     per-operation connection profile
+
+        """
+        inserted_ids = []
+        try:
+            documents = self._splice_raw_documents(self.iterate_raw_documents(data), inserted_ids, inject_meta)
+            self.get_collection(db, collection, 'insert_raw_records').insert_many(documents, ordered=False)
+            self.new_user_id = inserted_ids
+            return True
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return False
+
+    @MetricsModel.timed('update_one_record', lambda toolbox, result, args: toolbox.number_records_updated,
+                        query=MetricsModel.argument(0, 'query'))
     def update_one_record(self, query, update, upsert_value=False, db=None, collection=None):
         """
         update_one_record() -- mongoToolbox method
@@ -278,6 +489,7 @@ class MongoToolbox:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     per-operation connection profile
 
         """
         self.number_records_matched = 0
@@ -287,14 +499,18 @@ class MongoToolbox:
         if collection is not None:
             self.collection = collection
         try:
-            result = self.collection.update_one(query, update, upsert=upsert_value)
+            target = self._profiled('update_one_record', self.collection)
+            result = target.update_one(query, update, upsert=upsert_value)
             self.number_records_matched = result.matched_count
             self.number_records_updated = result.modified_count
             return True
         except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
             print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
             return False
 
+    @MetricsModel.timed('update_many_records', lambda toolbox, result, args: toolbox.number_records_updated,
+                        query=MetricsModel.argument(0, 'query'))
     def update_many_records(self, query, update, upsert_value=False, db=None, collection=None):
         """
         update_many_records() -- mongoToolbox method
@@ -332,6 +548,7 @@ class MongoToolbox:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     per-operation connection profile
 
         """
         self.number_records_updated = 0
@@ -342,15 +559,78 @@ class MongoToolbox:
             self.collection = collection
         try:
             # do not need the old "multi=true" param - that's implied by update_many()
-            result = self.collection.update_many(query, update, upsert=upsert_value)
+            target = self._profiled('update_many_records', self.collection)
+            result = target.update_many(query, update, upsert=upsert_value)
+            self.number_records_matched = result.matched_count
+            self.number_records_updated = result.modified_count
+            return True
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return False
+
+    @MetricsModel.timed('bulk_update_records', lambda toolbox, result, args: toolbox.number_records_updated)
+    def bulk_update_records(self, updates, db=None, collection=None):
+        """
+        bulk_update_records() -- mongoToolbox method
+
+        The batch version of update_one_record() -- the updates are sent to mongo as a single, unordered, bulk_write()
+        of UpdateOne requests, so one slow or failing update doesn't hold up the others.  The input parameters are:
+
+        updates:    a list of (query, update) tuples, each a final-form query filter and $set directive, as for
+                    update_one_record()
+        db:         a string value containing the name of an alternative database
+        collection: a string value containing the name of an alternative collection
+
+        The number_records_matched and number_records_updated members are set to the totals for the batch -- the server
+        doesn't report them per update -- and the write_errors member to a list of the updates that failed, each as a
+        {index, code, errmsg} dictionary, where index is the position of the update in the input list.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        :param updates:     list of (query, update) tuples
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :return:            Boolean indicating if every update completed successfully
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        operation = 'bulk_update_records'
+        self.number_records_matched = 0
+        self.number_records_updated = 0
+        self.write_errors = []
+        if not updates:
+            return True
+        try:
+            target = self.get_collection(db, collection, operation)
+            result = target.bulk_write([UpdateOne(query, update) for query, update in updates], ordered=False)
             self.number_records_matched = result.matched_count
             self.number_records_updated = result.modified_count
             return True
+        except mongo_errors.BulkWriteError as e:
+            # the updates without a write error were applied
+            self.last_error = e
+            self.number_records_matched = e.details.get('nMatched', 0)
+            self.number_records_updated = e.details.get('nModified', 0)
+            self.write_errors = [{'index': error['index'], 'code': error.get('code'), 'errmsg': error.get('errmsg')}
+                                 for error in e.details.get('writeErrors', [])]
+            print('a mongo exception was trapped: %s - %d of %d updates failed' %
+                  (e.__class__, len(self.write_errors), len(updates)))
+            return False
         except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            self.write_errors = [{'index': index, 'code': getattr(e, 'code', None), 'errmsg': str(e)}
+                                 for index in range(len(updates))]
             print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
             return False
 
-    def delete_records(self, query_filter, db=None, collection=None, multi=False):
+    @MetricsModel.timed('delete_records', lambda toolbox, result, args: toolbox.number_records_deleted,
+                        query=MetricsModel.argument(0, 'query_filter'))
+    def delete_records(self, query_filter, db=None, collection=None, multi=False, tombstone=False):
         """
         delete_records() -- mongoToolbox method
 
@@ -363,16 +643,26 @@ class MongoToolbox:
         db:             a string value containing the name of an alternative database that exists in the same resource
         collection:     a string value containing the name of the collection to use, if not the default
         multi:          a boolean value that drives if we'll invoke delete_one() (false) or delete_many() (true)
+        tombstone:      a boolean value -- if true, a tombstone is left for every deleted record (see below)
 
         We start by resetting the member variable that reports back on how many records were removed in the operation.
         Next, we processing the DB and collection overrides...
         Then we test the multi parameter and if false (default), we invoke the delete_one() method in pyMongo - else
         we invoke pyMongo's delete_many() method.  Both use the same input parameter.
 
+        Incremental extracts can't see a deleted record, so, when tombstone is true, we first fetch the _id (and the
+        token) of the records the filter matches, upsert a tombstone -- {_id, token, deleted_at} -- for each of them
+        into the tombstone collection (see tombstone_collection()), and only then delete exactly those records.  A
+        record is never deleted without its tombstone: if the tombstones can't be written, nothing is deleted, and if
+        the delete fails, the tombstones are already in place -- either way we display the error and return a
+        Boolean(false), and the delete should be repeated.  The tombstones are upserts, so repeating a delete is
+        harmless.
+
         :param query_filter: the query filter, in array format, that determines which records are deleted
         :param db:           a string value, optional, containing the name of an alternative database
         :param collection:   a string value, optional, containing the name of an alternative collection
         :param multi:        a boolean value, optional, indicating which pyMongo delete operation to invoke
+        :param tombstone:    a boolean value, optional, indicating if tombstones are written for the deleted records
         :return:             a boolean value to indicate if the delete request was successfully processed or not
 
         @author     mshallop@linux.com
@@ -381,6 +671,11 @@ class MongoToolbox:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     optional tombstones for incremental extracts
+        10-17-26        mks     per-operation connection profile
+        10-17-26        mks     per-call read routing
+        10-17-26        mks     the tombstones are written before the records are deleted
+        10-17-26        mks     the tombstones are written by write_tombstones()
 
         """
         self.number_records_deleted = 0
@@ -389,12 +684,586 @@ class MongoToolbox:
         if collection is not None:
             self.collection = collection
         try:
+            target = self._profiled('delete_records', self.collection)
+            deleted = None
+            if tombstone is True:
+                # pin the delete to the records we're going to tombstone
+                deleted = list(self._routed('delete_records', target).find(query_filter, {"token": 1},
+                                                                           limit=0 if multi else 1))
+                if not deleted:
+                    return True
+                query_filter = {"_id": {"$in": [record["_id"] for record in deleted]}}
+                multi = True
+                if self.write_tombstones(deleted, int(time.time())) is False:
+                    return False
             if multi is False:
-                result = self.collection.delete_one(query_filter)
+                result = target.delete_one(query_filter)
             else:
-                result = self.collection.delete_many(query_filter)
+                result = target.delete_many(query_filter)
             self.number_records_deleted = result.deleted_count
             return True
         except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
             print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
             return False
+
+    @MetricsModel.timed('find_one_record', lambda toolbox, result, args: 0 if result is None else 1,
+                        query=MetricsModel.argument(0, 'query_filter'))
+    def find_one_record(self, query_filter, projection=None, db=None, collection=None, read_route=None):
+        """
+        find_one_record() -- mongoToolbox method
+
+        This method fetches a single record from a collection.  The input parameters are:
+
+        query_filter:   the final-form query filter that the record must satisfy
+        projection:     optional projection -- if not provided, we return every field except the bcrypt password hash
+        db:             optional string value containing the name of an alternative database
+        collection:     optional string value containing the name of an alternative collection
+        read_route:     optional name of the read route (see configure_read_routes()), e.g. primary
+
+        Unlike the write methods, the db/collection overrides do not change the toolbox defaults.
+
+        :param query_filter:    dictionary containing the query filter
+        :param projection:      optional dictionary containing the projection
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+        :param read_route:      optional - the read route for this call
+        :return:                the matching record as a dictionary, or None if not found (or on error)
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     per-operation connection profile
+        10-17-26        mks     per-call read routing
+
+        """
+        if projection is None:
+            projection = self.default_projection
+        try:
+            target = self._routed('find_one_record', self.get_collection(db, collection, 'find_one_record'), read_route)
+            return target.find_one(query_filter, projection)
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return None
+
+    def find_records(self, query_filter=None, projection=None, sort=None, limit=0, batch_size=None, db=None,
+                     collection=None, read_route=None):
+        """
+        find_records() -- mongoToolbox method
+
+        This is the general-purpose read method -- it's a generator that yields the matching records one at a time,
+        so memory use stays flat no matter how many records match: the pyMongo cursor fetches the records from the
+        server in batches, and only the current batch is held in memory.
+
+        The input parameters, all optional, are:
+
+        query_filter:   the final-form query filter; defaults to all records
+        projection:     the fields to return; defaults to every field except the bcrypt password hash -- the hash is
+                        only returned when the caller explicitly projects it
+        sort:           a list of (field, direction) tuples
+        limit:          the maximum number of records to return; 0 (default) means no limit
+        batch_size:     the number of records fetched from the server per round trip
+        db:             a string value containing the name of an alternative database
+        collection:     a string value containing the name of an alternative collection
+        read_route:     the name of the read route (see configure_read_routes()) -- e.g. analytics, for heavy reads
+                        that can be served by a secondary
+
+        Note that because this is a generator, the query isn't sent to the server until the first record is requested.
+        If an exception is raised while iterating the cursor, we display the error, save it in last_error, and stop the
+        iteration -- so a caller that has to tell a truncated result from the end of the records must clear last_error
+        before iterating, and check it afterwards.
+
+        :param query_filter:    optional dictionary containing the query filter
+        :param projection:      optional dictionary containing the projection
+        :param sort:            optional list of (field, direction) tuples
+        :param limit:           optional integer - maximum number of records returned
+        :param batch_size:      optional integer - number of records per server round trip
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+        :param read_route:      optional - the read route for this call
+        :return:                yields each matching record as a dictionary
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     per-operation connection profile
+        10-17-26        mks     per-call read routing
+        10-17-26        mks     documented the last_error check for truncated reads
+
+        """
+        operation = 'find_records'
+        if projection is None:
+            projection = self.default_projection
+        try:
+            target = self._routed(operation, self.get_collection(db, collection, operation), read_route)
+            cursor = target.find(query_filter or {}, projection, limit=limit)
+            if sort is not None:
+                cursor = cursor.sort(sort)
+            if batch_size is None:
+                batch_size = self.profile_setting(operation, 'batch_size')
+            if batch_size is not None:
+                cursor = cursor.batch_size(batch_size)
+            if self.profile_setting(operation, 'max_time_ms') is not None:
+                cursor = cursor.max_time_ms(self.profile_setting(operation, 'max_time_ms'))
+            for record in cursor:
+                yield record
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+
+    def find_raw_batches(self, query_filter=None, projection=None, sort=None, batch_size=None, db=None,
+                         collection=None, read_route=None):
+        """
+        find_raw_batches() -- mongoToolbox method
+
+        The undecoded version of find_records(): a generator that yields each batch returned by the server as a bytes
+        object holding the concatenated, BSON-encoded, records -- exactly as they came off the wire.  pyMongo never
+        decodes the records into dictionaries, so this is the fastest way to stream records to a .bson file or to
+        another server.  (Use iterate_raw_documents() to split a batch into RawBSONDocuments.)
+
+        The input parameters, and the default projection, are the same as find_records() -- and, as with
+        find_records(), an error ends the iteration and is left in last_error for the caller to check.
+
+        :param query_filter:    optional dictionary containing the query filter
+        :param projection:      optional dictionary containing the projection
+        :param sort:            optional list of (field, direction) tuples
+        :param batch_size:      optional integer - number of records per server round trip
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+        :param read_route:      optional - the read route for this call
+        :return:                yields each batch as a bytes object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     per-operation connection profile
+        10-17-26        mks     per-call read routing
+        10-17-26        mks     documented the last_error check for truncated reads
+
+        """
+        operation = 'find_raw_batches'
+        if projection is None:
+            projection = self.default_projection
+        try:
+            target = self._routed(operation, self.get_collection(db, collection, operation), read_route)
+            cursor = target.find_raw_batches(query_filter or {}, projection)
+            if sort is not None:
+                cursor = cursor.sort(sort)
+            if batch_size is None:
+                batch_size = self.profile_setting(operation, 'batch_size')
+            if batch_size is not None:
+                cursor = cursor.batch_size(batch_size)
+            if self.profile_setting(operation, 'max_time_ms') is not None:
+                cursor = cursor.max_time_ms(self.profile_setting(operation, 'max_time_ms'))
+            for batch in cursor:
+                yield batch
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+
+    def get_collection(self, db=None, collection=None, operation=None):
+        """
+        get_collection() -- mongoToolbox method
+
+        Returns the pyMongo collection object for the optional db and collection names.  Unlike the db and collection
+        overrides on the CRUD methods, the toolbox defaults are not modified -- if a name is not provided, we use the
+        default database/collection set in the constructor.
+
+        If an operation name is provided, the collection carries the write and read concerns of the connection
+        profile selected for that operation (see configure_profiles()).
+
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :param operation:   optional - the name of the operation the collection is used for
+        :return:            a pyMongo collection object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     per-operation connection profile
+
+        """
+        database = self.database if db is None else self.mongo_resource[db]
+        if collection is None:
+            target = self.collection if db is None else database[self.collection.name]
+        else:
+            target = database[collection]
+        return target if operation is None else self._profiled(operation, target)
+
+    def configure_profiles(self, profiles, operation_profiles=None):
+        """
+        configure_profiles() -- mongoToolbox method
+
+        Sets the connection profiles the toolbox operations can select -- typically the profiles and operationProfiles
+        settings of the MongoConnectorDataModel.  An operation (the name of a toolbox method, e.g. insert_many_records)
+        mapped to a profile uses the profile's settings:
+
+            write_concern -- a dictionary of WriteConcern arguments, e.g. {'w': 'majority', 'wtimeout': 1000}
+            read_concern -- a dictionary of ReadConcern arguments, e.g. {'level': 'majority'}
+            batch_size -- the default cursor batch size for find_records() and find_raw_batches()
+            max_time_ms -- the server-side time limit for find_records() and find_raw_batches()
+
+        The client options of a profile (compression, pool sizes, timeouts) are fixed when the client is built, and
+        only apply to the profile named in the data model's profile setting.  The metrics of every call are labelled
+        with the operation's profile, so the profiles can be compared.
+
+        :param profiles:            dictionary of profile name: profile settings
+        :param operation_profiles:  optional dictionary of operation name: profile name
+        :raises ValueError:         if an operation is mapped to a profile that isn't defined
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        operation_profiles = dict(operation_profiles or {})
+        for operation, profile in operation_profiles.items():
+            if profile not in profiles:
+                raise ValueError('operation %s is mapped to an unknown connection profile: %s' % (operation, profile))
+        self.profiles = profiles
+        self.operation_profiles = operation_profiles
+        self._profiled_collections = {}
+
+    def profile_name(self, operation):
+        # the name of the connection profile the operation uses
+        if self.operation_profiles is None:
+            return constants.PROFILE_DEFAULT
+        return self.operation_profiles.get(operation, constants.PROFILE_DEFAULT)
+
+    def profile_setting(self, operation, name, default=None):
+        # one setting of the connection profile the operation uses
+        if self.profiles is None:
+            return default
+        return self.profiles.get(self.profile_name(operation), {}).get(name, default)
+
+    def _profiled(self, operation, collection):
+        """
+        _profiled() -- mongoToolbox private method
+
+        Returns the collection with the write and read concerns of the operation's connection profile applied.  The
+        profiled collection objects are cached, by collection and profile, so with_options() runs once for each.
+
+        :param operation:   string - the toolbox operation name
+        :param collection:  a pyMongo collection object
+        :return:            a pyMongo collection object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if self.profiles is None:
+            return collection
+        key = (collection.full_name, self.profile_name(operation))
+        profiled = self._profiled_collections.get(key)
+        if profiled is None:
+            write_concern = self.profile_setting(operation, 'write_concern')
+            read_concern = self.profile_setting(operation, 'read_concern')
+            profiled = collection.with_options(
+                write_concern=WriteConcern(**write_concern) if write_concern is not None else None,
+                read_concern=ReadConcern(**read_concern) if read_concern is not None else None)
+            self._profiled_collections[key] = profiled
+        return profiled
+
+    def configure_read_routes(self, read_routes, operation_read_routes=None):
+        """
+        configure_read_routes() -- mongoToolbox method
+
+        Sets the read routes -- named read preferences -- the toolbox reads can be sent to, typically the readRoutes
+        and operationReadRoutes settings of the MongoConnectorDataModel.  Each route is a dictionary:
+
+            mode -- primary, primaryPreferred, secondary, secondaryPreferred or nearest
+            tag_sets -- optional list of tag sets, tried in order; {} matches any member
+            max_staleness -- optional, in seconds: secondaries lagging the primary by more are never read
+            read_concern -- optional read concern level (e.g. majority) for the reads on the route
+
+        A read uses, in order: the read_route passed to the call, the route mapped to the operation, or the client's
+        read preference.  By default, the uniqueness check in check_for_existing_account() and the reads that pin a
+        tombstoned delete go to the primary, whatever the client's read preference.  Every routing decision is
+        counted in the read_route_decisions metric, by operation and route.
+
+        :param read_routes:             dictionary of route name: route settings
+        :param operation_read_routes:   optional dictionary of operation name: route name
+        :raises ValueError:             if an operation is mapped to a route that isn't defined, or a mode is unknown
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     optional read concern per route
+
+        """
+        operation_read_routes = dict(operation_read_routes or {})
+        for operation, route in operation_read_routes.items():
+            if route not in read_routes:
+                raise ValueError('operation %s is mapped to an unknown read route: %s' % (operation, route))
+        for route, settings in read_routes.items():
+            if settings.get('mode', 'primary') not in READ_PREFERENCE_MODES:
+                raise ValueError('read route %s has an unknown mode: %s' % (route, settings.get('mode')))
+        self.read_routes = read_routes
+        self.operation_read_routes = operation_read_routes
+        self._routed_collections = {}
+
+    @staticmethod
+    def read_preference(route_settings):
+        """
+        read_preference() -- mongoToolbox method
+
+        Builds the pyMongo read preference for a read route's settings (see configure_read_routes()).
+
+        :param route_settings:  dictionary containing the mode, and the optional tag_sets and max_staleness
+        :return:                a pyMongo read preference object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        mode = route_settings.get('mode', 'primary')
+        if mode == 'primary':
+            return read_preferences.Primary()
+        return READ_PREFERENCE_MODES[mode](tag_sets=route_settings.get('tag_sets'),
+                                           max_staleness=route_settings.get('max_staleness', -1))
+
+    def _routed(self, operation, collection, read_route=None):
+        """
+        _routed() -- mongoToolbox private method
+
+        Returns the collection with the read preference (and read concern, if the route has one) of the read route
+        for this call, and counts the decision.
+        The routed collection objects are cached, by collection, profile and route.
+
+        :param operation:   string - the toolbox operation name
+        :param collection:  a pyMongo collection object (with the operation's profile applied)
+        :param read_route:  optional - the route passed to the call
+        :return:            a pyMongo collection object
+        :raises ValueError: if the route isn't defined
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     optional read concern per route
+
+        """
+        route = read_route if read_route is not None else self.operation_read_routes.get(operation)
+        if route is not None and route not in self.read_routes:
+            raise ValueError('unknown read route: %s' % route)
+        self.metrics.increment('read_route_decisions', {'operation': operation,
+                                                        'route': route or constants.READ_ROUTE_CLIENT})
+        if route is None:
+            return collection
+        key = (collection.full_name, self.profile_name(operation), route)
+        routed = self._routed_collections.get(key)
+        if routed is None:
+            settings = self.read_routes[route]
+            read_concern = ReadConcern(settings['read_concern']) if settings.get('read_concern') else None
+            routed = collection.with_options(read_preference=self.read_preference(settings), read_concern=read_concern)
+            self._routed_collections[key] = routed
+        return routed
+
+    def write_tombstones(self, records, deleted_at, db=None, collection=None):
+        """
+        write_tombstones() -- mongoToolbox method
+
+        Upserts a tombstone -- {_id, token, deleted_at} -- into the tombstone collection (see tombstone_collection())
+        for each of the records, in one unordered bulk write.  The records need only hold the _id and the token.  The
+        tombstones are upserts, so writing the same tombstone twice is harmless.
+
+        :param records:     list of dictionaries, each containing the _id and (optionally) the token of a record
+        :param deleted_at:  integer - the deletion time, in seconds since the epoch
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :return:            Boolean indicating if the tombstones were written
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if not records:
+            return True
+        try:
+            self._profiled('delete_records', self.tombstone_collection(db, collection)).bulk_write([
+                ReplaceOne({"_id": record["_id"]},
+                           {"_id": record["_id"], "token": record.get("token"), "deleted_at": deleted_at},
+                           upsert=True) for record in records], ordered=False)
+            return True
+        except (mongo_errors.PyMongoError, Exception) as e:
+            self.last_error = e
+            print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+            return False
+
+    def tombstone_collection(self, db=None, collection=None):
+        """
+        tombstone_collection() -- mongoToolbox method
+
+        Returns the pyMongo collection object holding the tombstones for a collection: it's in the same database, and
+        it's named after the collection with the TOMBSTONE_SUFFIX appended.
+
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :return:            a pyMongo collection object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        target = self.get_collection(db, collection)
+        return target.database[target.name + constants.TOMBSTONE_SUFFIX]
+
+    @staticmethod
+    def add_meta_fields(record):
+        """
+        add_meta_fields() -- mongoToolbox method
+
+        Injects the record guid (token) and the processing time (created) into a single record, and returns the
+        record.
+
+        :param record:  a dictionary containing a single record
+        :return:        the record, with the meta fields injected
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        record["token"] = Helper.generate_guid()
+        record["created"] = int(time.time())
+        return record
+
+    @staticmethod
+    def _inject_meta_fields(data):
+        """
+        _inject_meta_fields() -- mongoToolbox private method
+
+        This is a generator that walks the data iterable and injects the record guid (token) and the processing time
+        (created) into each document as it's consumed.  Because we never index into the data, it works equally well
+        for lists and for streaming iterables.
+
+        :param data:    an iterable of documents
+        :return:        yields each document with the token and created fields injected
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        for record in data:
+            yield MongoToolbox.add_meta_fields(record)
+
+    @staticmethod
+    def iterate_raw_documents(data):
+        """
+        iterate_raw_documents() -- mongoToolbox method
+
+        Returns an iterable of encoded documents for insert_raw_records(): a bytes stream, or a binary file, of
+        concatenated documents is split into RawBSONDocument objects -- which only wrap the bytes, nothing is
+        decoded -- and any other iterable is returned unchanged.
+
+        :param data:    a bytes object, a binary file object, or an iterable of encoded documents
+        :return:        an iterable of encoded documents
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return bson.decode_iter(bytes(data), RAW_CODEC_OPTIONS)
+        if hasattr(data, 'read'):
+            return bson.decode_file_iter(data, RAW_CODEC_OPTIONS)
+        return data
+
+    @staticmethod
+    def _splice_raw_documents(documents, inserted_ids, inject_meta=True):
+        """
+        _splice_raw_documents() -- mongoToolbox private method
+
+        A generator that walks the encoded documents and, working directly on the bytes, adds an _id (if the
+        document doesn't start with one) and, when inject_meta is True, the token and created fields.  A BSON
+        document is a length, a list of encoded fields, and a terminating null -- so adding fields is a matter of
+        concatenation, and updating the length.
+
+        The _id of every document is appended to inserted_ids as it's consumed.
+
+        :param documents:       an iterable of RawBSONDocument objects, or of bytes objects
+        :param inserted_ids:    a list the _ids are appended to
+        :param inject_meta:     boolean - add the token and created fields
+        :return:                yields each document as a RawBSONDocument
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        # one created time per call -- encode the field once and re-use the bytes for every document
+        created_field = bson.BSON.encode({"created": int(time.time())})[4:-1] if inject_meta else b''
+        tokens = iter(())
+        for document in documents:
+            raw = document.raw if isinstance(document, RawBSONDocument) else bytes(document)
+            id_field = b''
+            if raw[5:9] != b'_id\x00':
+                document_id = ObjectId()
+                id_field = b'\x07_id\x00' + document_id.binary
+            elif raw[4:5] == b'\x07':
+                document_id = ObjectId(raw[9:21])
+            else:
+                document_id = RawBSONDocument(raw)['_id']
+            meta_fields = b''
+            if inject_meta:
+                token = next(tokens, None)
+                if token is None:
+                    tokens = iter(Helper.generate_guids(constants.RAW_INSERT_TOKEN_BLOCK))
+                    token = next(tokens)
+                meta_fields = RAW_TOKEN_PREFIX + token.encode() + b'\x00' + created_field
+            if id_field or meta_fields:
+                raw = struct.pack('<i', len(raw) + len(id_field) + len(meta_fields)) + id_field + raw[4:-1] + \
+                    meta_fields + b'\x00'
+            inserted_ids.append(document_id)
+            yield RawBSONDocument(raw)
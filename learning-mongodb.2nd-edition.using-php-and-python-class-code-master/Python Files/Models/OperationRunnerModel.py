@@ -0,0 +1,404 @@
+from Models import UserModel
+from Models import BulkLoaderModel
+from Models import CacheModel
+from Models import EmailValidationModel
+from Models import HelperModel as Helper
+from shared import constants
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+
+"""
+OperationRunnerModel.py -- batched, concurrent, replay of a user operation log
+
+The OperationRunner reads a stream of user operations -- one JSON object per line -- and applies them through the
+UserModel and MongoToolbox:
+
+    {"op": "create", "username": "...", "password": "...", "email": "..."}
+    {"op": "update", "target_user": "...", "email": "...", "password": "..."}
+    {"op": "delete", "username": "..."}
+
+The create operations hold the same fields as the MongoConnectorDataModel newUser payload, and the update operations
+the same fields as the UserModel update_user() payload.  Passwords are in clear text and are hashed on the way in.
+The creates are validated as testMongo's OP_CREATE validates them (password length and email domain), but the
+existing-account check is left to the unique indexes -- runOperations.py refuses to run without them.  A line whose
+user isn't a non-empty string, or an update line whose new username, email or password isn't, is failed on its own.
+
+Consecutive operations of the same type are grouped into batches, and each batch is a single batched call:
+
+    - create -- the passwords are hashed in one call, and the batch is written by a BulkLoader, so a replayed create
+      (same token) is counted as already present and every failed record is reported
+    - update -- one UserModel.update_users() call: the updates of the same user are merged, and the batch is sent as
+      one unordered bulk write
+    - delete -- one UserModel.delete_users() call: an $in delete on the usernames or, with expire set, a soft delete
+      that leaves the removal of the users to the TTL monitor
+
+The batches run on a pool of worker threads, each with its own UserModel over the shared client.  The order of the
+log is preserved where it matters: a batch waits for every earlier batch of a different type, and for every earlier
+batch that touches one of its users, to complete before it starts.
+
+The report holds, for each operation type, the counts, throughput, and the batch latency percentiles, and the
+(bounded) details of the failed operations -- their position in the stream, user and error.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     update batches are a single update_users() call
+10-17-26        mks     delete batches are a single delete_users() call, optionally expiring
+10-17-26        mks     creates are validated, and the users of every line are checked when it's read
+10-17-26        mks     the string fields of update lines are checked when they're read
+
+"""
+
+# the field that names the user each operation type applies to
+_USER_FIELDS = {
+    constants.RUNNER_OP_CREATE: 'username',
+    constants.RUNNER_OP_UPDATE: 'target_user',
+    constants.RUNNER_OP_DELETE: 'username'
+}
+
+
+class OperationRunner:
+    """
+    OperationRunner -- applies a log of user operations in concurrent batches
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_resource = None
+    connect_data = None
+    batch_size = None
+    concurrency = None
+    max_in_flight = None
+    tombstones = False
+    expire = False
+    max_errors = None
+    user_cache = None
+    email_validator = None
+    operations_read = 0
+    operations_succeeded = 0
+    operations_failed = 0
+    elapsed_time = 0.0
+    operation_stats = None
+    failures = None
+
+    def __init__(self, mongo_resource, connect_data=None, batch_size=constants.RUNNER_BATCH_SIZE,
+                 concurrency=constants.RUNNER_CONCURRENCY, max_in_flight=None, tombstones=False,
+                 max_errors=constants.BULK_IMPORT_MAX_ERRORS, expire=False):
+        """
+        __init__() -- OperationRunner instantiation method
+
+        There is one required input parameter - the mongo resource (MongoClient) created by the MongoConnectorModel -
+        and the following optional parameters:
+
+        connect_data -- a MongoConnectorDataModel object; if provided, its connection profiles and read routes are
+        configured on every worker's toolbox
+        batch_size -- the maximum number of consecutive operations of the same type in a batch
+        concurrency -- the number of worker threads
+        max_in_flight -- the maximum number of batches queued or in progress; defaults to twice the concurrency
+        tombstones -- deletes leave a tombstone (see MongoToolbox.delete_records())
+        max_errors -- the maximum number of failed operations we keep the details of
+        expire -- deletes expire the users instead, for the TTL monitor to remove (see UserModel.delete_users())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the expire option
+
+        """
+        self.mongo_resource = mongo_resource
+        self.connect_data = connect_data
+        self.batch_size = max(1, int(batch_size))
+        self.concurrency = max(1, int(concurrency))
+        self.max_in_flight = max_in_flight if max_in_flight is not None else self.concurrency * 2
+        self.tombstones = tombstones
+        self.max_errors = max_errors
+        self.expire = expire
+        # the worker UserModels share one user cache, so an update on one thread invalidates the user for all of them
+        self.user_cache = CacheModel.LRUCache(constants.USER_CACHE_SIZE, constants.USER_CACHE_TTL)
+        self.email_validator = EmailValidationModel.EmailDomainValidator()
+        self._local = threading.local()
+        self.operation_stats = {}
+        self.failures = []
+
+    def run(self, source):
+        """
+        run() -- OperationRunner method
+
+        Applies the operations in the source, and returns the run report.  Lines that aren't valid JSON, or aren't a
+        known operation, are reported as failed and skipped.
+
+        :param source:  string containing the path of a JSONL file, or an iterable of text lines
+        :return:        a dictionary containing the run report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self._reset_counters()
+        start_time = time.time()
+        in_flight = deque()
+        current_type = None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for op_type, batch in self._batches(self._read_operations(source)):
+                users = set(self._user_of(operation) for index, operation in batch)
+                # batches of another type, or touching the same users, have to land first
+                while len(in_flight) > 0 and (op_type != current_type or len(in_flight) >= self.max_in_flight or
+                                              any(users & batch_users for batch_users, future in in_flight)):
+                    self._collect(in_flight.popleft()[1].result())
+                current_type = op_type
+                in_flight.append((users, executor.submit(self._run_batch, op_type, batch)))
+            while len(in_flight) > 0:
+                self._collect(in_flight.popleft()[1].result())
+        self.status = self.operations_failed == 0
+        self.elapsed_time = time.time() - start_time
+        return self.report()
+
+    def report(self):
+        """
+        report() -- OperationRunner method
+
+        Returns a dictionary describing the last run: the operation counters and throughput, the statistics for each
+        operation type (operations, failed, batches, operations per second of batch time, and the p50/p95/p99 batch
+        latency in milliseconds), and the (bounded) details of the failed operations.
+
+        :return: dictionary containing the run report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        operations = {}
+        for op_type, stats in self.operation_stats.items():
+            latencies = sorted(stats['latencies'])
+            busy = sum(latencies)
+            operations[op_type] = {
+                'operations': stats['operations'],
+                'failed': stats['failed'],
+                'batches': len(latencies),
+                'operations_per_second': round(stats['operations'] / busy, 1) if busy > 0 else 0.0,
+                'p50_ms': _milliseconds(Helper.percentile(latencies, 50)),
+                'p95_ms': _milliseconds(Helper.percentile(latencies, 95)),
+                'p99_ms': _milliseconds(Helper.percentile(latencies, 99))
+            }
+        throughput = self.operations_read / self.elapsed_time if self.elapsed_time > 0 else 0.0
+        return {
+            'status': self.status,
+            'operations_read': self.operations_read,
+            'operations_succeeded': self.operations_succeeded,
+            'operations_failed': self.operations_failed,
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'operations_per_second': round(throughput, 1),
+            'operations': operations,
+            'failures': list(self.failures)
+        }
+
+    def _read_operations(self, source):
+        # yields (position in the stream, operation dictionary) -- unusable lines are failed here, and not yielded
+        if isinstance(source, str):
+            with open(source, 'r') as file_handle:
+                for entry in self._read_operations(file_handle):
+                    yield entry
+            return
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            index = self.operations_read
+            self.operations_read += 1
+            try:
+                operation = json.loads(line)
+            except ValueError as e:
+                self._fail(index, None, None, 'invalid JSON: %s' % e)
+                continue
+            if not isinstance(operation, dict) or operation.get('op') not in _USER_FIELDS:
+                self._fail(index, None, None, 'unknown operation: %s' % line[:80])
+                continue
+            # the users are batch and cache keys -- anything but a non-empty string would break the whole run
+            user_field = _USER_FIELDS[operation['op']]
+            if not _is_name(operation.get(user_field)):
+                self._fail(index, operation['op'], None, '%s must be a non-empty string' % user_field)
+                continue
+            # an update's new values are merged into the batch's bulk write (and the passwords hashed together), so
+            # one bad value would fail every update in the batch
+            if operation['op'] == constants.RUNNER_OP_UPDATE:
+                invalid = [field for field in ('username', 'email', 'password')
+                           if field in operation and not _is_name(operation[field])]
+                if len(invalid) > 0:
+                    self._fail(index, operation['op'], operation[user_field],
+                               '%s must be a non-empty string' % invalid[0])
+                    continue
+            yield index, operation
+
+    def _batches(self, operations):
+        # groups consecutive operations of the same type, up to batch_size operations per batch
+        op_type, batch = None, []
+        for index, operation in operations:
+            if len(batch) > 0 and (operation['op'] != op_type or len(batch) >= self.batch_size):
+                yield op_type, batch
+                batch = []
+            op_type = operation['op']
+            batch.append((index, operation))
+        if len(batch) > 0:
+            yield op_type, batch
+
+    def _run_batch(self, op_type, batch):
+        """
+        _run_batch() -- OperationRunner private method
+
+        Applies one batch on the worker thread, and returns the batch result.  (Operations without a valid user were
+        already failed by _read_operations().)
+
+        :param op_type: string - the type of the operations in the batch
+        :param batch:   list of (position in the stream, operation dictionary) tuples
+        :return:        dictionary containing the op type, operation count, elapsed time, and the failures as a list
+                        of (position, user, error message) tuples
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     the users are validated when the operations are read
+
+        """
+        start_time = time.perf_counter()
+        try:
+            failures = getattr(self, '_' + op_type)(self._user_model(), batch)
+        except Exception as e:
+            failures = [(index, self._user_of(operation), '%s - %s' % (e.__class__.__name__, e))
+                        for index, operation in batch]
+        return {'op': op_type, 'operations': len(batch), 'elapsed': time.perf_counter() - start_time,
+                'failures': failures}
+
+    def _create(self, user_model, batch):
+        # validate the batch as OP_CREATE does (in one validate_new_users() call), hash the passwords in one call,
+        # and write the batch with per-record accounting
+        failures, entries = [], []
+        for index, operation in batch:
+            missing = [field for field in ('password', 'email') if not isinstance(operation.get(field), str)]
+            if len(missing) > 0:
+                failures.append((index, operation['username'], 'missing required field: %s' % missing[0]))
+            else:
+                entries.append((index, _payload(operation)))
+        results = user_model.validate_new_users([record for index, record in entries]) if entries else []
+        for (index, record), is_valid in zip(entries, results):
+            if is_valid is False:
+                failures.append((index, record['username'], 'user data failed validation'))
+        entries = [entry for entry, is_valid in zip(entries, results) if is_valid is True]
+        if len(entries) == 0:
+            return failures
+        records = [record for index, record in entries]
+        hashes = user_model.mongo_toolbox.hash_passwords([record['password'] for record in records])
+        for record, hashed_password in zip(records, hashes):
+            record['password'] = hashed_password
+        loader = BulkLoaderModel.BulkLoader(user_model.mongo_toolbox, chunk_size=len(records),
+                                            max_errors=len(records))
+        result = loader.load(records)
+        return failures + [(entries[failure['index']][0], records[failure['index']].get('username'),
+                            failure['errmsg']) for failure in result['failures']]
+
+    def _update(self, user_model, batch):
+        # one batched update -- the operations on the same user are merged, so they succeed or fail together
+        updates = []
+        for index, operation in batch:
+            changes = _payload(operation)
+            updates.append((changes.pop('target_user'), changes))
+        results = user_model.update_users(updates)
+        failures = []
+        for index, operation in batch:
+            result = results[operation['target_user']]
+            if 'errmsg' in result:
+                failures.append((index, operation['target_user'], result['errmsg']))
+            elif result['matched'] == 0:
+                failures.append((index, operation['target_user'], 'no such user'))
+        return failures
+
+    def _delete(self, user_model, batch):
+        # one delete for the whole batch -- deleting a user that doesn't exist is not a failure
+        usernames = [operation['username'] for index, operation in batch]
+        result = user_model.delete_users(usernames, chunk_size=len(usernames), expire=self.expire)
+        if result['status'] is False:
+            errmsg = result['chunks'][0].get('errmsg')
+            return [(index, operation['username'], errmsg) for index, operation in batch]
+        return []
+
+    def _user_model(self):
+        # each worker thread has its own UserModel (and toolbox), over the shared client
+        user_model = getattr(self._local, 'user_model', None)
+        if user_model is None:
+            user_model = UserModel.UserModel(self.mongo_resource, rely_on_unique_indexes=True,
+                                             user_cache=self.user_cache, email_validator=self.email_validator,
+                                             tombstones=self.tombstones)
+            if self.connect_data is not None:
+                user_model.mongo_toolbox.configure_profiles(self.connect_data.profiles,
+                                                            self.connect_data.operationProfiles)
+                user_model.mongo_toolbox.configure_read_routes(self.connect_data.readRoutes,
+                                                               self.connect_data.operationReadRoutes)
+            self._local.user_model = user_model
+        return user_model
+
+    def _collect(self, result):
+        stats = self.operation_stats.setdefault(result['op'], {'operations': 0, 'failed': 0, 'latencies': []})
+        stats['operations'] += result['operations']
+        stats['failed'] += len(result['failures'])
+        stats['latencies'].append(result['elapsed'])
+        self.operations_succeeded += result['operations'] - len(result['failures'])
+        for index, user, errmsg in result['failures']:
+            self._fail(index, result['op'], user, errmsg)
+
+    def _fail(self, index, op_type, user, errmsg):
+        self.operations_failed += 1
+        if len(self.failures) < self.max_errors:
+            self.failures.append({'index': index, 'op': op_type, 'user': user, 'errmsg': errmsg})
+
+    @staticmethod
+    def _user_of(operation):
+        return operation.get(_USER_FIELDS[operation['op']])
+
+    def _reset_counters(self):
+        self.status = False
+        self.operations_read = 0
+        self.operations_succeeded = 0
+        self.operations_failed = 0
+        self.elapsed_time = 0.0
+        self.operation_stats = {}
+        self.failures = []
+
+
+def _is_name(value):
+    return isinstance(value, str) and len(value) > 0
+
+
+def _payload(operation):
+    # the operation without its op field -- the dictionary the UserModel/toolbox methods take
+    payload = dict(operation)
+    del payload['op']
+    return payload
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000.0, 3) if seconds is not None else None
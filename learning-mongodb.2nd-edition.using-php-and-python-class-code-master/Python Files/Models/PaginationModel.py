@@ -0,0 +1,223 @@
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+from shared import constants
+import base64
+import binascii
+
+"""
+PaginationModel.py -- keyset (range-based) pagination on top of the MongoToolbox
+
+Paging with skip/limit gets slower the deeper we page, because the server has to walk (and discard) every skipped
+record.  Keyset pagination remembers where the last page ended -- the sort-key values of its last record -- and the
+next page is a range query starting just after those values.  With an index on the sort keys, every page is an index
+seek followed by a short scan, so page N costs the same as page 1.
+
+Because pages are positioned by key values, not by offsets, records inserted while we're paging can't shift records
+onto the next page (or off it) -- a record is never returned twice, and a record that existed when the paging began
+is never skipped.
+
+The sort must be on indexed fields, and must be unique -- so _id is always appended as the final tie-breaker.  For
+example: [('created', ASCENDING), ('_id', ASCENDING)] needs an index on {created: 1, _id: 1}.
+
+The position is returned to the caller as an opaque, url-safe, continuation token.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+
+class KeysetPaginator:
+    """
+    KeysetPaginator -- pages through a collection using continuation tokens
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = True
+    mongo_toolbox = None
+    sort_keys = None
+    page_size = None
+    query_filter = None
+    projection = None
+    db = None
+    collection = None
+
+    def __init__(self, mongo_toolbox, sort_keys=None, page_size=constants.PAGE_SIZE, query_filter=None,
+                 projection=None, db=None, collection=None):
+        """
+        __init__() -- KeysetPaginator instantiation method
+
+        There is one required input parameter - an instantiated MongoToolbox - and the following optional parameters:
+
+        sort_keys -- a list of (field, direction) tuples; defaults to [('_id', ASCENDING)].  If _id is not the last
+        sort key, it's appended (in the direction of the last key) to make the sort order unique.
+        page_size -- the number of records per page
+        query_filter -- a query filter applied to every page
+        projection -- the fields returned; the sort keys are always added to an inclusion projection as we need them
+        to build the continuation token
+        db, collection -- alternative database/collection names
+
+        :param mongo_toolbox:   an instantiated MongoToolbox object
+        :param sort_keys:       optional list of (field, direction) tuples
+        :param page_size:       optional integer - records per page
+        :param query_filter:    optional dictionary containing the base query filter
+        :param projection:      optional dictionary containing the projection
+        :param db:              optional - alternative database name
+        :param collection:      optional - alternative collection name
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        sort_keys = list(sort_keys) if sort_keys else [('_id', ASCENDING)]
+        if sort_keys[-1][0] != '_id':
+            sort_keys = [key for key in sort_keys if key[0] != '_id'] + [('_id', sort_keys[-1][1])]
+        self.sort_keys = sort_keys
+        self.page_size = max(1, int(page_size))
+        self.query_filter = query_filter or {}
+        if projection is not None and any(value for name, value in projection.items() if name != '_id'):
+            # inclusion projection -- make sure the sort keys are returned
+            projection = dict(projection)
+            for field, direction in self.sort_keys:
+                projection[field] = 1
+        self.projection = projection
+        self.db = db
+        self.collection = collection
+
+    def get_page(self, continuation_token=None):
+        """
+        get_page() -- KeysetPaginator method
+
+        Returns one page of records, and the continuation token for the next page.  Pass None (default) to get the
+        first page.  When there are no more records after the returned page, the continuation token is None.
+
+        We fetch one record more than the page size, so we can tell if there's a next page without an extra round
+        trip.
+
+        If the continuation token can't be decoded, we display an error and return an empty page.  If the read fails
+        part-way, the records read so far are discarded -- a truncated page would look like the last page -- and we
+        return an empty page with the same continuation token, so the page can be requested again, and set the status
+        member to False (it's True after every successful page).
+
+        :param continuation_token:  optional string - the token returned with the previous page
+        :return:                    a list of records, and the continuation token (or None)
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     a failed read is reported, not returned as the last page
+
+        """
+        query_filter = self.query_filter
+        if continuation_token is not None:
+            last_values = self.decode_token(continuation_token)
+            if last_values is None:
+                print('invalid continuation token: %s' % continuation_token)
+                return [], None
+            range_filter = self._range_filter(last_values)
+            query_filter = {'$and': [self.query_filter, range_filter]} if self.query_filter else range_filter
+
+        self.mongo_toolbox.last_error = None
+        records = list(self.mongo_toolbox.find_records(query_filter, self.projection, sort=self.sort_keys,
+                                                       limit=self.page_size + 1, batch_size=self.page_size + 1,
+                                                       db=self.db, collection=self.collection))
+        self.status = self.mongo_toolbox.last_error is None
+        if self.status is False:
+            return [], continuation_token
+        if len(records) <= self.page_size:
+            return records, None
+        records = records[:self.page_size]
+        return records, self.encode_token(records[-1])
+
+    def iterate_pages(self, continuation_token=None):
+        """
+        iterate_pages() -- KeysetPaginator method
+
+        A generator that yields successive pages (lists of records), starting from the continuation token (or the
+        first page), until the records are exhausted -- or a read fails, in which case the status member is False.
+
+        :param continuation_token:  optional string - the token to start from
+        :return:                    yields each page as a list of records
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     stop on a failed read
+
+        """
+        while True:
+            records, continuation_token = self.get_page(continuation_token)
+            if len(records) > 0:
+                yield records
+            if continuation_token is None or self.status is False:
+                break
+
+    def encode_token(self, record):
+        values = [self._get_value(record, field) for field, direction in self.sort_keys]
+        return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+    def decode_token(self, continuation_token):
+        try:
+            values = json_util.loads(base64.urlsafe_b64decode(continuation_token.encode()).decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.sort_keys):
+            return None
+        return values
+
+    def _range_filter(self, last_values):
+        """
+        _range_filter() -- KeysetPaginator private method
+
+        Builds the query for "every record after last_values" in the compound sort order:
+
+            k1 > v1  OR  (k1 == v1 AND k2 > v2)  OR  ...  OR  (k1 == v1 AND ... AND kn > vn)
+
+        using $lt instead of $gt for descending keys.  Each branch is a bounded range on the sort index.
+
+        :param last_values: list of the sort-key values of the last record on the previous page
+        :return:            dictionary containing the range query
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        branches = []
+        for i, (field, direction) in enumerate(self.sort_keys):
+            branch = dict((self.sort_keys[j][0], last_values[j]) for j in range(i))
+            branch[field] = {'$lt' if direction == DESCENDING else '$gt': last_values[i]}
+            branches.append(branch)
+        return branches[0] if len(branches) == 1 else {'$or': branches}
+
+    @staticmethod
+    def _get_value(record, field):
+        # walk dotted field names into embedded documents
+        value = record
+        for part in field.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
@@ -0,0 +1,373 @@
+from Models import MongoConnectorModel
+from Models import MongoConnectorDataModel
+from Models import MongoToolbox
+from Models import BulkLoaderModel
+from Models import BulkImportModel
+from shared import constants
+from collections import deque
+import csv
+import multiprocessing
+import os
+import time
+
+"""
+ParallelLoaderModel.py -- multi-process bulk loading
+
+One python process tops out well below what a replica set can absorb -- bcrypt hashing and BSON encoding are CPU
+bound, and the GIL keeps them on a single core.  The ParallelLoader reads the input in the parent process, shards it
+into chunks, and hands the chunks to a pool of worker processes.  Each worker:
+
+    - builds its own MongoClient, from the MongoConnectorDataModel settings, after the fork -- the connection registry
+      never hands a client inherited from the parent to a child process
+    - hashes the clear-text passwords in its chunk
+    - writes the chunk through its own BulkLoader, so each chunk is retried and accounted for record-by-record
+
+The parent validates each record as it's read (see BulkImportModel validate_record()) -- the rejected records are
+counted, and reported with the failures, but never sent to a worker.
+
+The parent keeps a bounded number of chunks in flight (so memory doesn't grow with the size of the input), aggregates
+the per-chunk reports, prints progress as it goes, and returns a single report at the end.
+
+For local testing, local_connect_data() builds a configuration for a stand-alone mongod on localhost, and workers=0
+runs the same code in-process, without a pool.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     workers use the connection profiles of the configuration
+10-17-26        mks     workers use the read routes of the configuration
+10-17-26        mks     records are validated before they're loaded
+10-17-26        mks     abort on a malformed CSV file
+
+"""
+
+# per-process worker state, created by _init_worker() in each worker process
+_worker_loader = None
+_worker_error = None
+
+
+class ParallelLoader:
+    """
+    ParallelLoader -- shards a load across worker processes
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    connect_data = None
+    workers = None
+    chunk_size = None
+    max_in_flight = None
+    progress_interval = None
+    max_errors = None
+    records_read = 0
+    records_inserted = 0
+    records_already_present = 0
+    records_rejected = 0
+    records_failed = 0
+    chunks_written = 0
+    retries = 0
+    elapsed_time = 0.0
+    worker_stats = None
+    failures = None
+
+    def __init__(self, connect_data=None, workers=constants.PARALLEL_LOAD_WORKERS,
+                 chunk_size=constants.BULK_LOAD_CHUNK_SIZE, max_in_flight=None,
+                 progress_interval=constants.PARALLEL_LOAD_PROGRESS_INTERVAL,
+                 max_errors=constants.BULK_IMPORT_MAX_ERRORS):
+        """
+        __init__() -- ParallelLoader instantiation method
+
+        All of the input parameters are optional:
+
+        connect_data -- a MongoConnectorDataModel object, used by every worker to build its own connection; defaults
+        to the data model settings
+        workers -- the number of worker processes; 0 loads in-process (useful for testing)
+        chunk_size -- the number of records in each chunk handed to a worker
+        max_in_flight -- the maximum number of chunks queued or in progress; defaults to twice the number of workers
+        progress_interval -- seconds between progress reports; None disables them
+        max_errors -- the maximum number of failed records we keep the details of
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.connect_data = connect_data if connect_data is not None else \
+            MongoConnectorDataModel.MongoConnectorDataModel()
+        self.workers = max(0, int(workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_in_flight = max_in_flight if max_in_flight is not None else max(1, self.workers * 2)
+        self.progress_interval = progress_interval
+        self.max_errors = max_errors
+        self.worker_stats = {}
+        self.failures = []
+
+    def load(self, source, file_format=None):
+        """
+        load() -- ParallelLoader method
+
+        Loads the records from the source, which is passed to the BulkImportModel read_records() function -- a file
+        path, an iterable of text lines, or an iterable of dictionaries.  Records that fail validation are rejected
+        here, in the parent: they're counted, and listed with the failures, but not loaded.
+
+        :param source:       file path, iterable of text lines, or iterable of dictionaries
+        :param file_format:  optional, the format of the source data (csv or jsonl)
+        :return:             a dictionary containing the load report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     validate the records
+        10-17-26        mks     abort on a malformed CSV file
+
+        """
+        self._reset_counters()
+        start_time = time.time()
+        pool = None
+        if self.workers > 0:
+            pool = multiprocessing.Pool(self.workers, _init_worker, (self.connect_data, self.chunk_size))
+        else:
+            _init_worker(self.connect_data, self.chunk_size)
+        in_flight = deque()
+        try:
+            for positions, chunk in self._chunks(BulkImportModel.read_records(source, file_format)):
+                if pool is None:
+                    self._collect(chunk, _load_chunk(positions, chunk))
+                    continue
+                in_flight.append((positions, chunk, pool.apply_async(_load_chunk, (positions, chunk))))
+                if len(in_flight) >= self.max_in_flight:
+                    self._wait(in_flight.popleft())
+            while len(in_flight) > 0:
+                self._wait(in_flight.popleft())
+            self.status = self.records_failed == 0
+        except (IOError, ValueError, csv.Error) as e:
+            print('load aborted after %d records: %s - %s' % (self.records_read, e.__class__, e))
+            self.status = False
+        finally:
+            if pool is not None:
+                # chunks still in flight here means we're aborting -- don't wait for them
+                if len(in_flight) > 0:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+        self.elapsed_time = time.time() - start_time
+        return self.report()
+
+    def report(self):
+        """
+        report() -- ParallelLoader method
+
+        Returns a dictionary describing the last load: the aggregated record counters, the elapsed time, throughput
+        in records-per-second, the counters for each worker process (keyed by pid) and the (bounded) details of the
+        failed and rejected records.  Failed record indexes are positions in the input.
+
+        :return: dictionary containing the load report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     added the rejected record count
+
+        """
+        throughput = self.records_inserted / self.elapsed_time if self.elapsed_time > 0 else 0.0
+        return {
+            'status': self.status,
+            'workers': self.workers,
+            'records_read': self.records_read,
+            'records_inserted': self.records_inserted,
+            'records_already_present': self.records_already_present,
+            'records_rejected': self.records_rejected,
+            'records_failed': self.records_failed,
+            'chunks_written': self.chunks_written,
+            'retries': self.retries,
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'records_per_second': round(throughput, 1),
+            'worker_stats': dict(self.worker_stats),
+            'failures': list(self.failures)
+        }
+
+    def _chunks(self, records):
+        # yields (list of the records' positions in the input, list of valid records) -- the rejected records are
+        # counted and listed here
+        positions, chunk = [], []
+        for record in records:
+            self.records_read += 1
+            is_valid, err_msg = BulkImportModel.validate_record(record)
+            if is_valid is False:
+                self.records_rejected += 1
+                self._add_failure({'index': self.records_read - 1, 'code': None, 'errmsg': err_msg,
+                                   'token': record.get(constants.BULK_LOAD_IDEMPOTENCY_KEY)
+                                   if isinstance(record, dict) else None})
+                continue
+            positions.append(self.records_read - 1)
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                yield positions, chunk
+                positions, chunk = [], []
+        if len(chunk) > 0:
+            yield positions, chunk
+
+    def _wait(self, entry):
+        positions, chunk, async_result = entry
+        try:
+            result = async_result.get()
+        except Exception as e:
+            # the worker died, or the chunk couldn't be pickled -- every record in the chunk is failed
+            result = _failed_result(positions, chunk, '%s - %s' % (e.__class__.__name__, e))
+        self._collect(chunk, result)
+
+    def _collect(self, chunk, result):
+        """
+        _collect() -- ParallelLoader private method
+
+        Adds one chunk report to the aggregated counters and the worker's counters, and prints the progress if the
+        progress interval has passed.
+
+        :param chunk:   list of the records in the chunk
+        :param result:  dictionary containing the chunk report returned by _load_chunk()
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     the failure positions are mapped by the worker
+
+        """
+        self.records_inserted += result['records_inserted']
+        self.records_already_present += result['records_already_present']
+        self.records_failed += result['records_failed']
+        self.retries += result['retries']
+        self.chunks_written += 1
+        for failure in result['failures']:
+            self._add_failure(failure)
+        stats = self.worker_stats.setdefault(result['pid'], {'chunks': 0, 'records_inserted': 0,
+                                                             'records_failed': 0, 'busy_seconds': 0.0})
+        stats['chunks'] += 1
+        stats['records_inserted'] += result['records_inserted']
+        stats['records_failed'] += result['records_failed']
+        stats['busy_seconds'] = round(stats['busy_seconds'] + result['elapsed_seconds'], 3)
+
+        now = time.time()
+        if self.progress_interval is not None and now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            elapsed = now - self._start_time
+            print('loaded %d of %d records read (%.1f records/second), %d rejected, %d failed' %
+                  (self.records_inserted + self.records_already_present, self.records_read,
+                   self.records_inserted / elapsed if elapsed > 0 else 0.0, self.records_rejected,
+                   self.records_failed))
+
+    def _add_failure(self, failure):
+        if len(self.failures) < self.max_errors:
+            self.failures.append(failure)
+
+    def _reset_counters(self):
+        self.status = False
+        self.records_read = 0
+        self.records_inserted = 0
+        self.records_already_present = 0
+        self.records_rejected = 0
+        self.records_failed = 0
+        self.chunks_written = 0
+        self.retries = 0
+        self.elapsed_time = 0.0
+        self.worker_stats = {}
+        self.failures = []
+        self._start_time = time.time()
+        self._last_progress = self._start_time
+
+
+def local_connect_data(port=27017):
+    """
+    local_connect_data() -- parallel loader helper function
+
+    Returns a MongoConnectorDataModel configured for a stand-alone mongod on localhost: no replica set, no TLS and no
+    authentication.  The other settings (pool sizes, database and collection names...) keep their defaults.
+
+    :param port:    integer - the port mongod is listening on
+    :return:        a MongoConnectorDataModel object
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    connect_data = MongoConnectorDataModel.MongoConnectorDataModel()
+    connect_data.uri = 'localhost'
+    connect_data.port = port
+    connect_data.login = None
+    connect_data.password = None
+    connect_data.authDB = None
+    connect_data.replSetName = None
+    connect_data.readPreference = 'primary'
+    connect_data.ssl = None
+    return connect_data
+
+
+def _init_worker(connect_data, chunk_size):
+    # runs once in each worker process: connect, and build the worker's toolbox and loader
+    global _worker_loader, _worker_error
+    _worker_loader, _worker_error = None, None
+    mongo_object = MongoConnectorModel.MongoConnectorModel(connect_data)
+    if mongo_object.status is False:
+        _worker_error = 'worker %d failed to connect to mongoDB' % os.getpid()
+        return
+    toolbox = MongoToolbox.MongoToolbox(mongo_object.res_mongo)
+    toolbox.configure_profiles(connect_data.profiles, connect_data.operationProfiles)
+    toolbox.configure_read_routes(connect_data.readRoutes, connect_data.operationReadRoutes)
+    _worker_loader = BulkLoaderModel.BulkLoader(toolbox, chunk_size=chunk_size)
+
+
+def _load_chunk(positions, chunk):
+    # runs in the worker process: hash the clear-text passwords, and write the chunk through the worker's loader --
+    # positions holds the input position of each record, for the failure indexes
+    if _worker_loader is None:
+        return _failed_result(positions, chunk, _worker_error)
+    start_time = time.time()
+    passwords = [(record, record['password']) for record in chunk if record.get('password')]
+    if len(passwords) > 0:
+        hashes = _worker_loader.mongo_toolbox.hash_passwords([password for record, password in passwords])
+        for (record, password), hashed_password in zip(passwords, hashes):
+            record['password'] = hashed_password
+    result = _worker_loader.load(chunk)
+    for failure in result['failures']:
+        failure['index'] = positions[failure['index']]
+    result['pid'] = os.getpid()
+    result['elapsed_seconds'] = time.time() - start_time
+    return result
+
+
+def _failed_result(positions, chunk, errmsg):
+    return {
+        'pid': os.getpid(),
+        'records_inserted': 0,
+        'records_already_present': 0,
+        'records_failed': len(chunk),
+        'retries': 0,
+        'elapsed_seconds': 0.0,
+        'failures': [{'index': position, 'token': record.get(constants.BULK_LOAD_IDEMPOTENCY_KEY), 'code': None,
+                      'errmsg': errmsg} for position, record in zip(positions, chunk)]
+    }
@@ -0,0 +1,334 @@
+from Models import CacheModel
+from Models import MetricsModel
+from pymongo import errors as mongo_errors
+from shared import constants
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import random
+import threading
+import time
+
+"""
+SlowOperationModel.py -- slow-operation capture with automatic explain()
+
+The toolbox passes the caller's query filters straight to the server, so a filter that can't use an index is only
+noticed when the cluster is already struggling.  The SlowOperationRecorder is an opt-in watchdog for the toolbox:
+
+    - every instrumented toolbox call (see MetricsModel.timed) that takes longer than the threshold is observed
+    - the query filter is reduced to its shape -- the field names and operators, with every value replaced by '?' --
+      so that all of the lookups for different usernames are recognized as the same query
+    - a sample of the slow calls is explained, once per shape per explain interval, on a background thread, so the
+      request that triggered the explain is never slowed down by it
+    - the winning plan is checked for collection scans (COLLSCAN), and for a poor ratio of keys/documents examined
+      to documents returned (POOR_SELECTIVITY)
+
+Findings are kept in a bounded, in-memory, ring buffer and, optionally, written to a capped collection so they're
+visible to other processes.  Flagged findings are also printed, and counted in the metrics registry as the
+slow_operation_alerts counter.
+
+To enable the recorder, assign it to the toolbox:
+
+    toolbox.slow_operation_recorder = SlowOperationModel.SlowOperationRecorder(threshold_ms=100)
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+FLAG_COLLSCAN = 'COLLSCAN'
+FLAG_POOR_SELECTIVITY = 'POOR_SELECTIVITY'
+LOGICAL_OPERATORS = ('$and', '$or', '$nor')
+
+
+class SlowOperationRecorder:
+    """
+    SlowOperationRecorder -- captures and explains slow toolbox operations
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    threshold_ms = None
+    sample_rate = None
+    ratio_threshold = None
+    capped_collection = None
+    findings = None
+    observed = 0
+    explained = 0
+
+    def __init__(self, threshold_ms=constants.SLOW_OP_THRESHOLD_MS, sample_rate=constants.SLOW_OP_SAMPLE_RATE,
+                 ratio_threshold=constants.SLOW_OP_RATIO_THRESHOLD, max_findings=constants.SLOW_OP_MAX_FINDINGS,
+                 explain_interval=constants.SLOW_OP_EXPLAIN_INTERVAL, capped_collection=None):
+        """
+        __init__() -- SlowOperationRecorder instantiation method
+
+        All of the input parameters are optional:
+
+        threshold_ms -- toolbox calls that take at least this many milliseconds are observed
+        sample_rate -- the fraction (0.0 - 1.0) of the slow calls, for shapes not explained recently, that are explained
+        ratio_threshold -- a plan that examines more than this many keys (or documents) per document returned is
+        flagged as POOR_SELECTIVITY
+        max_findings -- the size of the in-memory ring buffer; the oldest findings are discarded first
+        explain_interval -- seconds before the same query shape, on the same namespace, is explained again
+        capped_collection -- an optional pyMongo collection (see create_capped_collection()) the findings are
+        also written to
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.ratio_threshold = ratio_threshold
+        self.capped_collection = capped_collection
+        self.findings = deque(maxlen=max(1, int(max_findings)))
+        self._recent_shapes = CacheModel.LRUCache(constants.SLOW_OP_SHAPE_CACHE_SIZE, explain_interval)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+
+    def observe(self, toolbox, operation, query_filter, elapsed, db=None, collection=None):
+        """
+        observe() -- SlowOperationRecorder method
+
+        Called by the timed() decorator after every instrumented toolbox call.  Calls under the threshold, shapes
+        that were explained recently, and calls that aren't sampled, are ignored.  Otherwise, the explain is queued
+        on the background thread.
+
+        Nothing raised in here is allowed to reach the toolbox caller -- errors are displayed and the call is ignored.
+
+        :param toolbox:         the MongoToolbox object that made the call
+        :param operation:       string - the toolbox operation name
+        :param query_filter:    dictionary containing the query filter used by the call
+        :param elapsed:         float - the latency of the call, in seconds
+        :param db:              optional - the alternative database name passed to the call
+        :param collection:      optional - the alternative collection name passed to the call
+        :return:                a Future for the finding, or None if the call isn't explained
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        elapsed_ms = elapsed * 1000.0
+        if elapsed_ms < self.threshold_ms or not isinstance(query_filter, dict):
+            return None
+        try:
+            self.observed += 1
+            target = toolbox.get_collection(db, collection)
+            shape = query_shape(query_filter)
+            shape_key = '%s/%s' % (target.full_name, json.dumps(shape, sort_keys=True))
+            if self._recent_shapes.get(shape_key) is not None or random.random() >= self.sample_rate:
+                return None
+            self._recent_shapes.set(shape_key, True)
+            return self._executor.submit(self._explain, target, operation, query_filter, shape, elapsed_ms)
+        except Exception as e:
+            print('failed to observe slow %s: %s - %s' % (operation, e.__class__, e))
+            return None
+
+    def get_findings(self, flagged_only=False):
+        """
+        get_findings() -- SlowOperationRecorder method
+
+        :param flagged_only:    boolean - only return the findings with a COLLSCAN or POOR_SELECTIVITY flag
+        :return:                a list of findings (dictionaries), oldest first
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        with self._lock:
+            findings = list(self.findings)
+        return [finding for finding in findings if finding['flags']] if flagged_only else findings
+
+    def close(self):
+        # wait for any queued explains to finish
+        self._executor.shutdown(wait=True)
+
+    def _explain(self, target, operation, query_filter, shape, elapsed_ms):
+        """
+        _explain() -- SlowOperationRecorder private method
+
+        Runs on the background thread: explains the query filter as a find() on the target collection -- the plan
+        chosen for the filter is the same one used by the update/delete operations, and explaining a find() can't
+        modify any data -- analyzes the plan, and stores the finding.
+
+        :param target:          the pyMongo collection object the call ran against
+        :param operation:       string - the toolbox operation name
+        :param query_filter:    dictionary containing the query filter
+        :param shape:           dictionary containing the query shape
+        :param elapsed_ms:      float - the latency of the call, in milliseconds
+        :return:                the finding (a dictionary), or None if the explain failed
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        try:
+            plan = target.find(query_filter).explain()
+        except (mongo_errors.PyMongoError, Exception) as e:
+            print('explain of slow %s on %s failed: %s - %s' % (operation, target.full_name, e.__class__, e))
+            return None
+        self.explained += 1
+        finding = analyze_plan(plan, self.ratio_threshold)
+        finding.update({
+            'operation': operation,
+            'namespace': target.full_name,
+            'shape': shape,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'timestamp': int(time.time())
+        })
+        self._store(finding)
+        return finding
+
+    def _store(self, finding):
+        with self._lock:
+            self.findings.append(finding)
+        if finding['flags']:
+            print('slow %s on %s (%.1f ms) flagged %s -- query shape: %s' %
+                  (finding['operation'], finding['namespace'], finding['elapsed_ms'], '/'.join(finding['flags']),
+                   json.dumps(finding['shape'], sort_keys=True)))
+            for flag in finding['flags']:
+                MetricsModel.registry.increment('slow_operation_alerts',
+                                                {'operation': finding['operation'], 'flag': flag})
+        if self.capped_collection is not None:
+            try:
+                # insert a copy -- insert_one() adds an _id to the document it's given
+                self.capped_collection.insert_one(dict(finding))
+            except (mongo_errors.PyMongoError, Exception) as e:
+                print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+
+    @staticmethod
+    def create_capped_collection(database, name=constants.SLOW_OP_COLLECTION, size=constants.SLOW_OP_CAPPED_SIZE):
+        """
+        create_capped_collection() -- SlowOperationRecorder static method
+
+        Returns the capped collection used to store the findings, creating it if it doesn't already exist.  A capped
+        collection is a fixed-size ring buffer on the server: once it's full, the oldest findings are overwritten.
+
+        :param database:    a pyMongo database object
+        :param name:        string - the collection name
+        :param size:        integer - the maximum size of the collection, in bytes
+        :return:            a pyMongo collection object
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        try:
+            return database.create_collection(name, capped=True, size=size)
+        except mongo_errors.CollectionInvalid:
+            return database[name]
+
+
+def query_shape(query_filter):
+    """
+    query_shape() -- slow operation helper function
+
+    Reduces a query filter to its shape: field names and operators are kept, and every value is replaced by '?'.
+    The branches of $and/$or/$nor are shaped individually.
+
+        {'$or': [{'username': 'mshallop'}, {'email': 'mshallop@linux.com'}]}
+            -> {'$or': [{'username': '?'}, {'email': '?'}]}
+
+    :param query_filter:    a query filter (or any value within it)
+    :return:                the shape of the filter
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    if not isinstance(query_filter, dict):
+        return '?'
+    shape = {}
+    for key, value in query_filter.items():
+        if key in LOGICAL_OPERATORS and isinstance(value, list):
+            shape[key] = [query_shape(branch) for branch in value]
+        else:
+            shape[key] = query_shape(value)
+    return shape
+
+
+def analyze_plan(plan, ratio_threshold=constants.SLOW_OP_RATIO_THRESHOLD):
+    """
+    analyze_plan() -- slow operation helper function
+
+    Extracts the stages of the winning plan (from every shard, on a sharded cluster) and the execution counters from
+    the output of explain(), and flags collection scans and poorly selective plans.
+
+    :param plan:            dictionary returned by explain()
+    :param ratio_threshold: the keys/documents examined per document returned above which a plan is flagged
+    :return:                a dictionary containing the stages, the execution counters and the flags
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    stages = []
+    _collect_stages(plan.get('queryPlanner', {}).get('winningPlan', {}), stages)
+    stats = plan.get('executionStats', {})
+    keys_examined = stats.get('totalKeysExamined', 0)
+    docs_examined = stats.get('totalDocsExamined', 0)
+    n_returned = stats.get('nReturned', 0)
+
+    flags = []
+    if FLAG_COLLSCAN in stages:
+        flags.append(FLAG_COLLSCAN)
+    if max(keys_examined, docs_examined) > ratio_threshold * max(n_returned, 1):
+        flags.append(FLAG_POOR_SELECTIVITY)
+    return {
+        'stages': stages,
+        'keys_examined': keys_examined,
+        'docs_examined': docs_examined,
+        'n_returned': n_returned,
+        'flags': flags
+    }
+
+
+def _collect_stages(node, stages):
+    # walk the plan tree: single-input stages use inputStage, $or and sort-merge use inputStages, sharded plans list
+    # a winningPlan per shard, and the slot-based engine nests the classic plan under queryPlan
+    if isinstance(node, list):
+        for child in node:
+            _collect_stages(child, stages)
+    elif isinstance(node, dict):
+        if 'stage' in node:
+            stages.append(node['stage'])
+        for key in ('queryPlan', 'winningPlan', 'inputStage', 'inputStages', 'shards'):
+            if key in node:
+                _collect_stages(node[key], stages)
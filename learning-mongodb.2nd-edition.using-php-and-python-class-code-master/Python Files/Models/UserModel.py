@@ -1,6 +1,10 @@
 from Models import MongoToolbox
 from Models import HelperModel
-from validate_email import validate_email
+from Models import CacheModel
+from Models import EmailValidationModel
+from Models import IndexManagerModel
+from shared import constants
+import datetime
 import time
 
 """
@@ -37,8 +41,14 @@ class UserModel:
     """
     mongo_toolbox = None
     error_stack = []
-
-    def __init__(self, mongo_toolbox):
+    rely_on_unique_indexes = False
+    user_cache = None
+    email_validator = None
+    tombstones = False
+    expiry_index_present = False
+
+    def __init__(self, mongo_toolbox, hash_service=None, rely_on_unique_indexes=False, user_cache=None,
+                 email_validator=None, tombstones=False):
         """
         __init__() -- UserModel Instantiation Class
 
@@ -47,7 +57,28 @@ class UserModel:
 
         We simply copy the resource into a member for later use.
 
-        :param mongo_toolbox:  mongo resource object generated in the MongoConnector model
+        The optional hash_service is an instantiated HashService that's passed through to the toolbox so that password
+        hashing is performed in a process pool.
+
+        The optional rely_on_unique_indexes flag should only be set when the unique username and email indexes are
+        known to exist (see IndexManagerModel) -- validation then skips the pre-insert lookup for an existing account,
+        and duplicates are rejected by the server when the account is inserted.
+
+        The optional user_cache is an LRUCache used by the user lookup methods -- if not provided, we create one
+        using the USER_CACHE_* constants.
+
+        The optional email_validator is an EmailDomainValidator -- if not provided we create one with the default
+        (system) resolver.  Sharing one validator across UserModel instances shares its domain cache.
+
+        The optional tombstones flag makes delete_user() leave a tombstone for every deleted user, so that the
+        incremental extractor (see IncrementalExtractModel) can propagate the delete downstream.
+
+        :param mongo_toolbox:           mongo resource object generated in the MongoConnector model
+        :param hash_service:            optional HashService object used for password hashing
+        :param rely_on_unique_indexes:  optional boolean - skip the existing-account check during validation
+        :param user_cache:              optional LRUCache object for user lookups
+        :param email_validator:         optional EmailDomainValidator object
+        :param tombstones:              optional boolean - record deletes in the tombstone collection
 
         @author     mshallop@linux.com
         @version    1.0
@@ -55,9 +86,22 @@ class UserModel:
         HISTORY:
         ========
         01-06-19        mks     original coding
+        10-17-26        mks     added the optional hash service
+        10-17-26        mks     added the unique-index option
+        10-17-26        mks     added the user lookup cache
+        10-17-26        mks     added the cached email domain validator
+        10-17-26        mks     added the tombstone option
 
         """
-        self.mongo_toolbox = MongoToolbox.MongoToolbox(mongo_toolbox)
+        self.mongo_toolbox = MongoToolbox.MongoToolbox(mongo_toolbox, hash_service)
+        self.rely_on_unique_indexes = rely_on_unique_indexes
+        self.tombstones = tombstones
+        if user_cache is None:
+            user_cache = CacheModel.LRUCache(constants.USER_CACHE_SIZE, constants.USER_CACHE_TTL)
+        self.user_cache = user_cache
+        if email_validator is None:
+            email_validator = EmailValidationModel.EmailDomainValidator()
+        self.email_validator = email_validator
 
     def validate_new_user_data(self, data):
         """
@@ -74,7 +118,8 @@ class UserModel:
         containing diagnostic information.
 
         We also submit a request to the MongoToolbox to confirm that neither the user's username nor their email address
-        is already in-use in the database.
+        is already in-use in the database -- unless we're relying on the unique indexes, in which case that check is
+        left to the server when the record is inserted.
 
         @author     mshallop@linux.com
         @version    1.0
@@ -86,6 +131,8 @@ class UserModel:
         HISTORY:
         ========
         01-06-19        mks     original coding
+        10-17-26        mks     skip the existing-account round trip when relying on the unique indexes
+        10-17-26        mks     validate the email domain through the cached domain validator
 
         """
 
@@ -97,12 +144,49 @@ class UserModel:
         if status is False:
             self.error_stack.append(err_msg)
             return status
-        is_valid = validate_email(user_email, check_mx=True, verify=True)
+        is_valid = self.email_validator.validate(user_email)
         if is_valid is False:
             self.error_stack.append('email: ' + user_email + ' failed validation')
             return False
+        if self.rely_on_unique_indexes is True:
+            return True
         return self.mongo_toolbox.check_for_existing_account(user_name, user_email)
 
+    def validate_new_users(self, users):
+        """
+        validate_new_users() -- UserModel Method
+
+        The batch version of validate_new_user_data() -- this method requires a list of user-data dictionaries.
+
+        The email addresses for the whole batch are validated first, in a single call to the email validator, so each
+        distinct email domain in the batch is resolved only once (and concurrently).  The remaining validation is the
+        same as validate_new_user_data(); diagnostic messages are appended to the error stack.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        :param users:   list of dictionaries containing the user's username, email, and password
+        :return:        list of Boolean values, one per user, in input order
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        email_results = self.email_validator.validate_many([data['email'] for data in users])
+        results = []
+        for data, email_valid in zip(users, email_results):
+            status, err_msg = HelperModel.validate_password_length(data['password'])
+            if status is False:
+                self.error_stack.append(err_msg)
+            elif email_valid is False:
+                self.error_stack.append('email: ' + data['email'] + ' failed validation')
+                status = False
+            elif self.rely_on_unique_indexes is False:
+                status = self.mongo_toolbox.check_for_existing_account(data['username'], data['email'])
+            results.append(status)
+        return results
+
     def insert_new_user(self, user_data):
         """
         insert_new_user() -- UserModel method
@@ -147,19 +231,112 @@ class UserModel:
         We remove the target_user data from the user_data array.
         We inject the last_updated field into the update data.
         We reformat the update data into a mongoDB $set directive for the update operation.
+        Finally, the cached copy of the user (if any) is invalidated.
 
         :param user_data:   a dictionary containing both the query filter and the update data
         :return:            a boolean value received from the toolbox method indicating event success or failure
         """
         # extract the query filter
-        query_filter = {"username": user_data['target_user']}
+        target_user = user_data['target_user']
+        query_filter = {"username": target_user}
         del user_data["target_user"]
         # inject the updated time into the record
         user_data['last_updated'] = int(time.time())
         if 'password' in user_data:
-            user_data['password'] = HelperModel.hash_string(user_data['password'])
+            user_data['password'] = self.mongo_toolbox.hash_password(user_data['password'])
+        new_username = user_data.get('username')
         user_data = {"$set": user_data}
-        return self.mongo_toolbox.update_one_record(query_filter, user_data)
+        result = self.mongo_toolbox.update_one_record(query_filter, user_data)
+        self.invalidate_user(target_user)
+        if new_username is not None:
+            self.invalidate_user(new_username)
+        return result
+
+    def update_users(self, updates):
+        """
+        update_users() -- userModel method
+
+        The batch version of update_user(), for jobs that update many users at once.  There is one input parameter -
+        an iterable of (target_user, changes) pairs, where changes is a dictionary of new/replacement data, as in the
+        update_user() payload (without the target_user key).
+
+        The changes for the same user are merged, in order, into a single $set -- a later value of a field replaces an
+        earlier one -- so each user is updated once.  The passwords are hashed in one hash_passwords() call, every $set
+        is stamped with the same last_updated time, and the updates are sent as one unordered bulk write (see
+        MongoToolbox.bulk_update_records()).  Finally, the cached copies of the users are invalidated.
+
+        The result is a dictionary, keyed by target_user, of {matched, modified} counts -- plus an errmsg for a user
+        whose update failed.  The server only reports the totals for a bulk write: usernames are unique, so a user is
+        matched unless the totals come up short, in which case we look up which users exist.  Every update sets
+        last_updated, so a matched user is modified -- unless the same update was applied within the same second, in
+        which case the server's modified total is lower, and the per-user modified counts are reported as None.  If
+        the lookup fails, the matched and modified counts of the users that weren't rejected are reported as None.
+
+        RACE:  the lookup is a separate read, after the write -- a user created, deleted or renamed by another client
+        in between is counted as it is at the time of the lookup, not as it was when the update was applied.  The
+        lookup is checked against the server's matched total, and if they disagree (another client changed one of the
+        users) the counts are reported as None; two changes that cancel each other out can still go unnoticed, so
+        jobs that need exact per-user counts should use update_user() for each user.
+
+        :param updates:     iterable of (target_user, changes) tuples
+        :return:            dictionary of target_user: {matched, modified[, errmsg]}
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     a failed lookup reports unknown counts
+        10-17-26        mks     check the lookup against the matched total, documented the race
+
+        """
+        pending = {}
+        for target_user, changes in updates:
+            pending.setdefault(target_user, {}).update(changes)
+        if not pending:
+            return {}
+        with_passwords = [changes for changes in pending.values() if 'password' in changes]
+        hashes = self.mongo_toolbox.hash_passwords([changes['password'] for changes in with_passwords])
+        for changes, hashed_password in zip(with_passwords, hashes):
+            changes['password'] = hashed_password
+        last_updated = int(time.time())
+        targets = list(pending)
+        self.mongo_toolbox.bulk_update_records([({"username": target_user},
+                                                 {"$set": dict(pending[target_user], last_updated=last_updated)})
+                                                for target_user in targets])
+        toolbox = self.mongo_toolbox
+        failed = dict((targets[error['index']], error['errmsg']) for error in toolbox.write_errors)
+        applied = [target_user for target_user in targets if target_user not in failed]
+        # the username each applied update left the record under
+        final_names = dict((target_user, pending[target_user].get('username', target_user)) for target_user in applied)
+        if toolbox.number_records_matched < len(applied):
+            toolbox.last_error = None
+            existing = set(record['username'] for record in toolbox.find_records(
+                {"username": {"$in": list(final_names.values())}}, {"username": 1, "_id": 0},
+                read_route=constants.READ_ROUTE_PRIMARY))
+            if toolbox.last_error is not None or len(existing) != toolbox.number_records_matched:
+                # a truncated lookup can't tell us who was matched -- and neither can one that disagrees with the
+                # server's total, because another client changed one of the users since the write
+                existing = None
+        else:
+            existing = set(final_names.values())
+        all_modified = toolbox.number_records_updated == toolbox.number_records_matched
+        results = {}
+        for target_user in targets:
+            if target_user in failed:
+                results[target_user] = {'matched': 0, 'modified': 0, 'errmsg': failed[target_user]}
+                continue
+            if existing is None:
+                results[target_user] = {'matched': None, 'modified': None}
+                continue
+            matched = 1 if final_names[target_user] in existing else 0
+            results[target_user] = {'matched': matched, 'modified': matched if all_modified else None}
+        for target_user in targets:
+            self.invalidate_user(target_user)
+            if 'username' in pending[target_user]:
+                self.invalidate_user(pending[target_user]['username'])
+        return results
 
     def delete_user(self, user_data):
         """
@@ -168,7 +345,8 @@ class UserModel:
         This method is called when we need to delete, one or more, users from the user collection.  There is one input
         parameter to the method - a string containing the user name of the target user to be deleted.
 
-        LIMITATION:  only one user can be deleted at a time, and only by the user name.
+        LIMITATION:  only one user can be deleted at a time, and only by the user name -- use delete_users() to delete
+        many users, by username or token.
 
         todo:  expand input parameters to allow for more complex filters by passing in a dictionary
 
@@ -181,7 +359,218 @@ class UserModel:
         HISTORY:
         ========
         01-20-19        mks     original coding
+        10-17-26        mks     invalidate the cached copy of the user
+        10-17-26        mks     leave a tombstone, when configured
+        10-17-26        mks     see delete_users() for bulk deletes
 
         """
         query_filter = {"username": user_data}
-        return self.mongo_toolbox.delete_records(query_filter)
+        result = self.mongo_toolbox.delete_records(query_filter, tombstone=self.tombstones)
+        self.invalidate_user(user_data)
+        return result
+
+    def delete_users(self, values, field='username', chunk_size=constants.BULK_DELETE_CHUNK_SIZE, expire=False,
+                     expire_after=constants.USER_EXPIRY_DELAY_SECONDS):
+        """
+        delete_users() -- userModel method
+
+        The batch version of delete_user() -- deletes the users named by a (possibly very large) list of usernames or
+        tokens.  The list is de-duplicated and sent in chunks, one delete_records() call with an $in filter per chunk,
+        so no single request holds more than chunk_size values, and every chunk reports its own count.
+
+        A purge of many accounts as a few giant deletes spikes the oplog, and the replication lag with it.  With
+        expire set, the users are soft-deleted instead: each chunk is one update that sets expire_at (and
+        last_updated, so incremental extracts see the change) on the users that aren't already expiring, and the
+        server's TTL monitor removes them in the background once expire_at has passed -- this relies on the
+        expire_at_1 TTL index (see IndexManagerModel), so expiring is refused (every chunk fails, and nothing is
+        changed) unless the index is in place; the check is made once per model, on the first expiring call.  From
+        the moment they're expired, the user lookups no longer return them, but their usernames and email addresses
+        stay taken until the TTL monitor has removed them.  The TTL monitor doesn't leave tombstones so, when the
+        model was created with tombstones, the tombstones are written when the users are expired -- with expire_at as
+        their deletion time -- before the users are updated.
+
+        The result is a dictionary: status (false if any chunk failed), field, mode (delete or expire), the number of
+        distinct values requested, the number of users deleted (or expired), the elapsed time, and a list of chunks,
+        each {values, count, status} -- plus an errmsg for a failed chunk.
+
+        :param values:          list of usernames or tokens
+        :param field:           the field the values are matched on: username or token
+        :param chunk_size:      the maximum number of values in a single request
+        :param expire:          boolean - soft-delete the users, and leave the removal to the TTL monitor
+        :param expire_after:    integer - seconds from now the expired users are removed at
+        :return:                dictionary containing the delete report
+        :raises ValueError:     if the field isn't username or token
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     expiring deletes leave tombstones, when configured
+        10-17-26        mks     refuse to expire users without the TTL index
+
+        """
+        if field not in constants.BULK_DELETE_FIELDS:
+            raise ValueError('users can only be deleted by %s' % ' or '.join(constants.BULK_DELETE_FIELDS))
+        start_time = time.time()
+        values = list(dict.fromkeys(values))
+        chunk_size = max(1, int(chunk_size))
+        toolbox = self.mongo_toolbox
+        if expire is True and self.expiry_index_present is False:
+            # without the TTL index, the expired users would never be removed
+            self.expiry_index_present = IndexManagerModel.IndexManager(toolbox).expiry_index_present()
+        refused = expire is True and self.expiry_index_present is False
+        chunks = []
+        for offset in range(0, len(values), chunk_size):
+            chunk = values[offset:offset + chunk_size]
+            if refused is True:
+                chunks.append({'values': len(chunk), 'count': 0, 'status': False,
+                               'errmsg': 'the %s TTL index is not in place' % IndexManagerModel.USER_EXPIRY_INDEX})
+                continue
+            if expire is True:
+                status, count = self._expire_chunk(field, chunk, expire_after)
+            else:
+                status = toolbox.delete_records({field: {"$in": chunk}}, multi=True, tombstone=self.tombstones)
+                count = toolbox.number_records_deleted
+            chunk_report = {'values': len(chunk), 'count': count, 'status': status}
+            if status is False:
+                chunk_report['errmsg'] = str(toolbox.last_error)
+            chunks.append(chunk_report)
+            for value in chunk:
+                self._invalidate(field, value)
+        return {
+            'status': all(chunk['status'] for chunk in chunks),
+            'field': field,
+            'mode': 'expire' if expire is True else 'delete',
+            'requested': len(values),
+            'count': sum(chunk['count'] for chunk in chunks),
+            'elapsed_seconds': round(time.time() - start_time, 3),
+            'chunks': chunks
+        }
+
+    def get_user_by_username(self, username, consistent=False):
+        """
+        get_user_by_username() -- userModel method
+
+        Returns the user record (without the password hash) for the username, or None if there is no such user.
+
+        Lookups are served from the user cache when possible.  Set consistent to True to bypass the cache and read
+        the record from the database -- the fresh record then replaces any cached copy.
+
+        :param username:    string containing the username
+        :param consistent:  optional boolean - bypass the cache
+        :return:            dictionary containing the user record, or None
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return self._cached_lookup('username', username, consistent)
+
+    def get_user_by_token(self, token, consistent=False):
+        """
+        get_user_by_token() -- userModel method
+
+        Returns the user record (without the password hash) for the record token (guid), or None if there is no
+        such user.  See get_user_by_username() for a description of the consistent parameter.
+
+        :param token:       string containing the user's record token
+        :param consistent:  optional boolean - bypass the cache
+        :return:            dictionary containing the user record, or None
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return self._cached_lookup('token', token, consistent)
+
+    def invalidate_user(self, username):
+        """
+        invalidate_user() -- userModel method
+
+        Removes the user from the lookup cache.  A cached user record is stored under both its username and its
+        token, as one group (see LRUCache.set_many()), so invalidating the username entry invalidates the token entry
+        as well -- even when the username entry itself was already evicted or expired.
+
+        :param username:    string containing the username
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     the token entry is found through the cache key group
+
+        """
+        self.user_cache.invalidate(('username', username))
+
+    def _expire_chunk(self, field, chunk, expire_after):
+        # set expire_at on the users of the chunk that aren't already expiring -- tombstoned first, when configured
+        toolbox = self.mongo_toolbox
+        expire_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expire_after)
+        query_filter = {field: {"$in": chunk}, constants.USER_EXPIRY_FIELD: {"$exists": False}}
+        if self.tombstones is True:
+            toolbox.last_error = None
+            expiring = list(toolbox.find_records(query_filter, {"token": 1}, read_route=constants.READ_ROUTE_PRIMARY))
+            if toolbox.last_error is not None:
+                return False, 0
+            if toolbox.write_tombstones(expiring, int(expire_at.timestamp())) is False:
+                return False, 0
+            query_filter = {"_id": {"$in": [record["_id"] for record in expiring]},
+                            constants.USER_EXPIRY_FIELD: {"$exists": False}}
+        status = toolbox.update_many_records(query_filter, {"$set": {constants.USER_EXPIRY_FIELD: expire_at,
+                                                                     "last_updated": int(time.time())}})
+        return status, toolbox.number_records_updated
+
+    def _invalidate(self, field, value):
+        # remove the user from the cache by username or by token -- either key invalidates the other
+        self.user_cache.invalidate((field, value))
+
+    def _cached_lookup(self, field, value, consistent):
+        """
+        _cached_lookup() -- userModel private method
+
+        Read-through lookup: on a cache miss (or a consistent read) the record is fetched with the toolbox and cached
+        under both its username and token, as one key group.  Misses for users that don't exist are not cached, so a
+        newly-created account is visible immediately.  Callers receive a copy of the cached record, so modifying the
+        returned dictionary does not modify the cache.  Consistent reads are routed to the primary, so they see the
+        caller's own writes whatever the client's read preference.  Expired users (see delete_users()) are not
+        returned.
+
+        :param field:       the field name we're searching on (username or token)
+        :param value:       the value of the field
+        :param consistent:  boolean - bypass the cache
+        :return:            dictionary containing the user record, or None
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     consistent reads are routed to the primary
+        10-17-26        mks     expired users are not returned
+        10-17-26        mks     cache the username and token entries as one group
+
+        """
+        if consistent is False:
+            cached_user = self.user_cache.get((field, value))
+            if cached_user is not None:
+                return dict(cached_user)
+        read_route = constants.READ_ROUTE_PRIMARY if consistent is True else None
+        user = self.mongo_toolbox.find_one_record({field: value, constants.USER_EXPIRY_FIELD: {"$exists": False}},
+                                                  read_route=read_route)
+        if user is None:
+            return None
+        self.user_cache.set_many([(key, user[key]) for key in ('username', 'token') if key in user], user)
+        return dict(user)
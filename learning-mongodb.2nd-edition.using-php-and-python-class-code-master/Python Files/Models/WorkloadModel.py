@@ -0,0 +1,533 @@
+from Models import UserModel
+from Models import BulkLoaderModel
+from Models import CacheModel
+from Models import EmailValidationModel
+from Models import MetricsModel
+from Models import MongoConnectorDataModel
+from shared import constants
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import random
+import re
+import threading
+import time
+
+"""
+WorkloadModel.py -- YCSB-style workload generator for the UserModel
+
+The WorkloadGenerator drives a configurable mix of user operations through the UserModel (and so through the
+MongoToolbox, its indexes, cache and password hashing), and measures the latency of every operation:
+
+    read    -- get_user_by_username(); a database read unless cached reads were asked for
+    update  -- update_user() of the phone numbers
+    create  -- insert_new_user() of a new synthetic user (the password is hashed, as it is for a real sign-up); the
+               created users are numbered on from the highest synthetic user already in the collection, so a second
+               run against the same data (e.g. --skip-load) doesn't collide with the users an earlier run created
+
+The reads and updates pick one of the pre-loaded users with a uniform, or a (scrambled) zipfian, key distribution --
+zipfian models a few very hot users, and the scrambling spreads the hot users across the key space rather than
+putting them all at the start of the username index.  The synthetic users extend the MongoConnectorDataModel newUser
+payload with the fields of the update payload (full name and phone numbers).
+
+There are two load modes:
+
+    closed  -- each of the threads issues its next operation when the previous one completes (optionally paced so the
+               threads together don't exceed the target rate); latency is measured from the start of each call, so it
+               hides the queueing a slow server causes
+    open    -- operations are scheduled at the target rate whether or not earlier operations have completed, and run
+               on the thread pool; latency is measured from the time each operation was scheduled, so a server that
+               falls behind shows up as growing latency (no coordinated omission)
+
+Latencies are kept in fixed-bucket histograms (see MetricsModel.Histogram), per operation for the whole run and per
+operation for every second of the run, so the report shows how latency moved over time.  The percentiles are the
+upper bound of the bucket holding the percentile.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     creates continue from the highest existing synthetic user
+
+"""
+
+WORKLOAD_USER_PREFIX = 'loadtest'
+
+
+class UniformKeys:
+    """
+    UniformKeys -- picks every key with the same probability
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+
+    def __init__(self, item_count):
+        self.item_count = max(1, int(item_count))
+
+    def next(self, rng):
+        return rng.randrange(self.item_count)
+
+
+class ZipfianKeys:
+    """
+    ZipfianKeys -- scrambled zipfian key distribution
+
+    The zipfian generator from YCSB (Gray et al., "Quickly Generating Billion-Record Synthetic Databases"): key 0 is
+    the most popular, key 1 the next most popular, and so on.  Each generated rank is then hashed (FNV-1a) into the key
+    space, so the popular keys are scattered.  The zeta constant is computed once, in O(item_count).
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+
+    def __init__(self, item_count, theta=constants.WORKLOAD_ZIPFIAN_THETA):
+        self.item_count = max(1, int(item_count))
+        self.theta = theta
+        self.zeta_n = sum(1.0 / (i ** theta) for i in range(1, self.item_count + 1))
+        self.zeta_2 = 1.0 + 0.5 ** theta
+        self.alpha = 1.0 / (1.0 - theta)
+        self.eta = (1.0 - (2.0 / self.item_count) ** (1.0 - theta)) / (1.0 - self.zeta_2 / self.zeta_n) \
+            if self.item_count > 1 else 0.0
+
+    def next(self, rng):
+        u = rng.random()
+        uz = u * self.zeta_n
+        if uz < 1.0:
+            rank = 0
+        elif uz < self.zeta_2:
+            rank = 1
+        else:
+            rank = int(self.item_count * ((self.eta * u - self.eta + 1.0) ** self.alpha))
+        return _fnv_hash(min(rank, self.item_count - 1)) % self.item_count
+
+
+def key_distribution(distribution, item_count):
+    """
+    key_distribution() -- workload helper function
+
+    Returns the key generator for the distribution name.
+
+    :param distribution:    string - one of the WORKLOAD_DISTRIBUTION_* constants
+    :param item_count:      integer - the number of keys
+    :return:                a UniformKeys or ZipfianKeys object
+    :raises ValueError:     if the distribution isn't known
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    if distribution == constants.WORKLOAD_DISTRIBUTION_UNIFORM:
+        return UniformKeys(item_count)
+    if distribution == constants.WORKLOAD_DISTRIBUTION_ZIPFIAN:
+        return ZipfianKeys(item_count)
+    raise ValueError('unknown key distribution: %s' % distribution)
+
+
+def synthetic_user(number, template):
+    """
+    synthetic_user() -- workload helper function
+
+    Builds the numbered synthetic user: the newUser payload (username, password, email) with a unique username and
+    email address, extended with a full name and phone numbers, as in the update payload.
+
+    :param number:      integer - the user number
+    :param template:    dictionary containing the newUser payload
+    :return:            dictionary containing the user record
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    user = dict(template)
+    user['username'] = username_for(number)
+    user['email'] = '%s@%s' % (user['username'], template['email'].rpartition('@')[2])
+    user['flName'] = 'Load Test %d' % number
+    user['phone'] = [{'home': '555-%04d' % (number % 10000), 'work': '555-%04d' % ((number + 1) % 10000)}]
+    return user
+
+
+def username_for(number):
+    return '%s%010d' % (WORKLOAD_USER_PREFIX, number)
+
+
+class WorkloadGenerator:
+    """
+    WorkloadGenerator -- drives a mixed user workload and measures it
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_resource = None
+    connect_data = None
+    mix = None
+    distribution = None
+    record_count = None
+    target_rate = None
+    mode = None
+    duration = None
+    threads = None
+    cached_reads = False
+    db = None
+    collection = None
+    template = None
+    operations = 0
+    errors = 0
+    max_backlog = 0
+    elapsed_time = 0.0
+
+    def __init__(self, mongo_resource, connect_data=None, mix=None,
+                 distribution=constants.WORKLOAD_DISTRIBUTION_ZIPFIAN, record_count=constants.WORKLOAD_RECORDS,
+                 target_rate=constants.WORKLOAD_RATE, mode=constants.WORKLOAD_MODE_OPEN,
+                 duration=constants.WORKLOAD_DURATION, threads=constants.WORKLOAD_THREADS, cached_reads=False,
+                 db=None, collection=None, seed=None):
+        """
+        __init__() -- WorkloadGenerator instantiation method
+
+        There is one required input parameter - the mongo resource (MongoClient) created by the MongoConnectorModel -
+        and the following optional parameters:
+
+        connect_data -- a MongoConnectorDataModel object: the newUser payload is the synthetic user template, and the
+        connection profiles and read routes are configured on every thread's toolbox; defaults to the data model
+        mix -- dictionary of operation: share (read, update, create); the shares are normalized
+        distribution -- the key distribution for reads and updates: uniform or zipfian
+        record_count -- the number of pre-loaded users
+        target_rate -- operations per second; required in open mode, optional (None: as fast as possible) in closed
+        mode -- open or closed (see the module notes)
+        duration -- seconds
+        threads -- the number of threads issuing (closed) or running (open) the operations
+        cached_reads -- reads are served from the user cache, as they are in the application
+        db, collection -- alternative database/collection names
+        seed -- optional random seed, for repeatable key and operation sequences
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_resource = mongo_resource
+        self.connect_data = connect_data if connect_data is not None else \
+            MongoConnectorDataModel.MongoConnectorDataModel()
+        mix = mix if mix is not None else constants.WORKLOAD_MIX
+        for operation in mix:
+            if operation not in (constants.WORKLOAD_OP_READ, constants.WORKLOAD_OP_UPDATE,
+                                 constants.WORKLOAD_OP_CREATE):
+                raise ValueError('unknown workload operation: %s' % operation)
+        total = float(sum(mix.values()))
+        if total <= 0:
+            raise ValueError('the operation mix is empty')
+        self.mix = dict((operation, share / total) for operation, share in mix.items() if share > 0)
+        self.distribution = distribution
+        self.record_count = max(1, int(record_count))
+        self.target_rate = target_rate
+        if mode not in (constants.WORKLOAD_MODE_OPEN, constants.WORKLOAD_MODE_CLOSED):
+            raise ValueError('unknown workload mode: %s' % mode)
+        if mode == constants.WORKLOAD_MODE_OPEN and not target_rate:
+            raise ValueError('an open-loop workload needs a target rate')
+        self.mode = mode
+        self.duration = duration
+        self.threads = max(1, int(threads))
+        self.cached_reads = cached_reads
+        self.db = db
+        self.collection = collection
+        self.template = self.connect_data.newUser[0]
+        self._seed = seed
+        self._keys = key_distribution(distribution, self.record_count)
+        self._operation_bounds = list(itertools.accumulate(self.mix.values()))
+        self._operation_names = list(self.mix)
+        # the shared cache and validator, as in the application: one of each per process
+        self._user_cache = CacheModel.LRUCache(constants.USER_CACHE_SIZE, constants.USER_CACHE_TTL)
+        self._email_validator = EmailValidationModel.EmailDomainValidator()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_user = itertools.count(self.record_count)
+        self._reset_counters()
+
+    def load(self):
+        """
+        load() -- WorkloadGenerator method
+
+        Pre-loads the record_count synthetic users the reads and updates pick from.  The users all share the
+        template's password, so it's hashed once and the hash is reused -- otherwise the load would be bound by
+        bcrypt.  The users are written by a BulkLoader; run the load once per database (the username index rejects a
+        second load).
+
+        :return:    dictionary containing the BulkLoader report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        toolbox = self._user_model().mongo_toolbox
+        hashed_password = toolbox.hash_password(self.template['password'])
+        users = (dict(synthetic_user(number, self.template), password=hashed_password)
+                 for number in range(self.record_count))
+        return BulkLoaderModel.BulkLoader(toolbox).load(users)
+
+    def run(self):
+        """
+        run() -- WorkloadGenerator method
+
+        Runs the workload for the duration, and returns the workload report.  Before the run starts, the create
+        counter is moved past the highest synthetic user in the collection (see _seed_creates()).
+
+        :return:    dictionary containing the workload report (see report())
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     seed the create counter from the collection
+
+        """
+        self._seed_creates()
+        self._reset_counters()
+        self._start = time.perf_counter()
+        deadline = self._start + self.duration
+        if self.mode == constants.WORKLOAD_MODE_OPEN:
+            self._run_open(deadline)
+        else:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                list(executor.map(self._run_closed, range(self.threads), [deadline] * self.threads))
+        self.elapsed_time = time.perf_counter() - self._start
+        self.status = self.errors == 0
+        return self.report()
+
+    def report(self):
+        """
+        report() -- WorkloadGenerator method
+
+        Returns a dictionary describing the last run: the settings, the operation and error counts, the achieved
+        throughput, the largest number of scheduled operations waiting for a thread (open mode), the latency summary
+        for each operation, and the timeline -- the count and latency percentiles of each operation, second by second.
+
+        :return:    dictionary containing the workload report
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        with self._lock:
+            summary = dict((operation, _latency_summary(histogram, self._errors[operation]))
+                           for operation, histogram in self._totals.items())
+            timeline = []
+            for second in sorted(self._timeline):
+                entry = {'second': second}
+                for operation, histogram in self._timeline[second].items():
+                    entry[operation] = _latency_summary(histogram)
+                timeline.append(entry)
+        return {
+            'status': self.status,
+            'mode': self.mode,
+            'distribution': self.distribution,
+            'mix': dict(self.mix),
+            'target_rate': self.target_rate,
+            'threads': self.threads,
+            'operations': self.operations,
+            'errors': self.errors,
+            'elapsed_seconds': round(self.elapsed_time, 3),
+            'operations_per_second': round(self.operations / self.elapsed_time, 1) if self.elapsed_time > 0 else 0.0,
+            'max_backlog': self.max_backlog,
+            'summary': summary,
+            'timeline': timeline
+        }
+
+    def _run_open(self, deadline):
+        """
+        _run_open() -- WorkloadGenerator private method
+
+        Schedules an operation every 1/target_rate seconds until the deadline, and hands each one to the thread
+        pool.  When the scheduler falls behind (a slow sleep, a busy interpreter) it catches up without sleeping, so
+        the intended schedule is kept; each operation's latency runs from its scheduled time.
+
+        :param deadline:    float - the perf_counter() time the run ends at
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        rng = random.Random(self._seed)
+        interval = 1.0 / self.target_rate
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for scheduled in itertools.count():
+                intended_start = self._start + scheduled * interval
+                if intended_start >= deadline:
+                    break
+                delay = intended_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                operation, key = self._next_operation(rng)
+                with self._lock:
+                    self._backlog += 1
+                    self.max_backlog = max(self.max_backlog, self._backlog)
+                executor.submit(self._timed_operation, operation, key, intended_start, True)
+
+    def _run_closed(self, worker, deadline):
+        # one closed-loop thread: paced to its share of the target rate, if there is one
+        rng = random.Random(None if self._seed is None else self._seed + worker)
+        interval = float(self.threads) / self.target_rate if self.target_rate else 0.0
+        next_start = self._start
+        while True:
+            if interval > 0:
+                delay = next_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_start += interval
+            start_time = time.perf_counter()
+            if start_time >= deadline:
+                break
+            operation, key = self._next_operation(rng)
+            self._timed_operation(operation, key, start_time)
+
+    def _next_operation(self, rng):
+        # pick the operation from the mix, and its key: an existing user, or the next new user for a create
+        draw = rng.random()
+        operation = self._operation_names[-1]
+        for name, bound in zip(self._operation_names, self._operation_bounds):
+            if draw < bound:
+                operation = name
+                break
+        if operation == constants.WORKLOAD_OP_CREATE:
+            with self._lock:
+                return operation, next(self._next_user)
+        return operation, self._keys.next(rng)
+
+    def _timed_operation(self, operation, key, intended_start, scheduled=False):
+        try:
+            success = self._execute(operation, key)
+        except Exception as e:
+            print('workload %s failed: %s - %s' % (operation, e.__class__, e))
+            success = False
+        finish_time = time.perf_counter()
+        second = int(intended_start - self._start)
+        with self._lock:
+            if scheduled is True:
+                self._backlog -= 1
+            self.operations += 1
+            self._totals[operation].observe(finish_time - intended_start)
+            window = self._timeline.setdefault(second, {})
+            if operation not in window:
+                window[operation] = MetricsModel.Histogram(constants.WORKLOAD_LATENCY_BUCKETS)
+            window[operation].observe(finish_time - intended_start)
+            if success is False:
+                self.errors += 1
+                self._errors[operation] += 1
+
+    def _execute(self, operation, key):
+        user_model = self._user_model()
+        if operation == constants.WORKLOAD_OP_READ:
+            return user_model.get_user_by_username(username_for(key), consistent=not self.cached_reads) is not None
+        if operation == constants.WORKLOAD_OP_UPDATE:
+            user = synthetic_user(key + int(time.time() * 1000), self.template)
+            return user_model.update_user({'target_user': username_for(key), 'phone': user['phone']})
+        return user_model.insert_new_user(synthetic_user(key, self.template))
+
+    def _seed_creates(self):
+        # the usernames are zero-padded, so the highest one sorts last: creates are numbered on from it (or from the
+        # pre-loaded users, if none were created yet) -- if the lookup fails, the toolbox has displayed the error, and
+        # the creates start after the pre-loaded users
+        toolbox = self._user_model().mongo_toolbox
+        toolbox.last_error = None
+        highest = list(toolbox.find_records({'username': {'$regex': '^%s[0-9]{10}$' % re.escape(WORKLOAD_USER_PREFIX)}},
+                                            {'_id': 0, 'username': 1}, sort=[('username', -1)], limit=1,
+                                            read_route=constants.READ_ROUTE_PRIMARY))
+        start = self.record_count
+        if toolbox.last_error is None and highest:
+            start = max(start, int(highest[0]['username'][len(WORKLOAD_USER_PREFIX):]) + 1)
+        self._next_user = itertools.count(start)
+
+    def _user_model(self):
+        # each thread has its own UserModel (and toolbox), over the shared client, cache and validator
+        user_model = getattr(self._local, 'user_model', None)
+        if user_model is None:
+            user_model = UserModel.UserModel(self.mongo_resource, rely_on_unique_indexes=True,
+                                             user_cache=self._user_cache, email_validator=self._email_validator)
+            toolbox = user_model.mongo_toolbox
+            toolbox.configure_profiles(self.connect_data.profiles, self.connect_data.operationProfiles)
+            toolbox.configure_read_routes(self.connect_data.readRoutes, self.connect_data.operationReadRoutes)
+            if self.db is not None or self.collection is not None:
+                toolbox.collection = toolbox.get_collection(self.db, self.collection)
+                toolbox.database = toolbox.collection.database
+            self._local.user_model = user_model
+        return user_model
+
+    def _reset_counters(self):
+        self.status = False
+        self.operations = 0
+        self.errors = 0
+        self.max_backlog = 0
+        self.elapsed_time = 0.0
+        self._backlog = 0
+        self._start = time.perf_counter()
+        self._totals = dict((operation, MetricsModel.Histogram(constants.WORKLOAD_LATENCY_BUCKETS))
+                            for operation in self.mix)
+        self._errors = dict((operation, 0) for operation in self.mix)
+        self._timeline = {}
+
+
+def _latency_summary(histogram, errors=None):
+    summary = {
+        'count': histogram.count,
+        'mean_ms': round(histogram.sum / histogram.count * 1000.0, 3) if histogram.count > 0 else None,
+        'p50_ms': _milliseconds(histogram.percentile(50)),
+        'p95_ms': _milliseconds(histogram.percentile(95)),
+        'p99_ms': _milliseconds(histogram.percentile(99))
+    }
+    if errors is not None:
+        summary['errors'] = errors
+    return summary
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000.0, 3) if seconds is not None else None
+
+
+def _fnv_hash(value):
+    # 64-bit FNV-1a of the value's eight little-endian bytes
+    hashed = 0xCBF29CE484222325
+    for i in range(8):
+        hashed ^= (value >> (i * 8)) & 0xFF
+        hashed = (hashed * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+    return hashed
@@ -0,0 +1,358 @@
+from pymongo import errors as mongo_errors
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
+from shared import constants
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+"""
+WriteBufferModel.py -- write-behind buffer that coalesces toolbox writes into bulk_write batches
+
+Each MongoToolbox write method is one network round trip.  When we're issuing thousands of small writes per second,
+the round trips (not the server) become the bottleneck.  This model is an opt-in alternative: write requests are
+queued and a background thread flushes them as unordered bulk_write() batches when either the batch size or the
+time threshold is reached -- we trade a few milliseconds of latency for an order of magnitude more throughput.
+
+Every write request returns a concurrent.futures.Future (and optionally invokes a callback) that resolves when its
+batch has been flushed:
+
+    insert      -- the future's result is the _id of the inserted document
+    update      -- the future's result is the upserted _id, if the update was an upsert, otherwise True
+    delete      -- the future's result is True
+
+If an individual operation fails within the batch, only that operation's future raises the error -- the other
+operations in the (unordered) batch are unaffected.  An operation whose future was cancelled before its batch was
+flushed is dropped from the batch, and never written.
+
+The queue is bounded: when it's full, write requests block (back-pressure) until the flusher catches up.  Calling
+close() flushes everything that's been queued before returning -- including the requests of writers that were
+still waiting for room in the queue when close() was called.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     close() waits for the writers in progress before ending the queue
+10-17-26        mks     cancelled operations are skipped, a failed batch doesn't stop the flusher
+
+"""
+
+# marks the end of the queue when the buffer is closed
+_SHUTDOWN = object()
+
+
+class WriteBuffer:
+    """
+    WriteBuffer -- the buffered writer
+
+    The method names mirror the MongoToolbox write methods, but they return futures instead of Booleans.
+
+    @author     mshallop@linux.com
+    @version    1.0
+
+    HISTORY:
+    ========
+    10-17-26        mks     original coding
+
+    """
+    status = False
+    mongo_toolbox = None
+    max_batch_size = None
+    max_delay = None
+    ordered = False
+    operations_queued = 0
+    operations_flushed = 0
+    operations_failed = 0
+    batches_flushed = 0
+
+    def __init__(self, mongo_toolbox, max_batch_size=constants.WRITE_BUFFER_MAX_BATCH,
+                 max_delay_ms=constants.WRITE_BUFFER_MAX_DELAY_MS, max_queue_size=constants.WRITE_BUFFER_MAX_QUEUE,
+                 ordered=False):
+        """
+        __init__() -- WriteBuffer instantiation method
+
+        There is one required parameter - an instantiated MongoToolbox - and four optional parameters:
+
+        max_batch_size -- flush when this many operations are waiting
+        max_delay_ms -- flush when the oldest waiting operation has waited this many milliseconds
+        max_queue_size -- the maximum number of queued operations; write requests block when the queue is full
+        ordered -- passed to bulk_write(); the default (False) lets the server continue past a failed operation
+
+        The background flush thread is started immediately.
+
+        :param mongo_toolbox:   an instantiated MongoToolbox object
+        :param max_batch_size:  integer - maximum number of operations per bulk_write
+        :param max_delay_ms:    integer - maximum time, in milliseconds, an operation waits before being flushed
+        :param max_queue_size:  integer - maximum number of queued operations
+        :param ordered:         boolean - ordered or unordered bulk writes
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self.mongo_toolbox = mongo_toolbox
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max_delay_ms / 1000.0
+        self.ordered = ordered
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._writers_done = threading.Condition(self._lock)
+        self._writers = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name='WriteBufferFlusher', daemon=True)
+        self._flusher.start()
+        self.status = True
+
+    def insert_one_record(self, data, db=None, collection=None, callback=None):
+        """
+        insert_one_record() -- WriteBuffer method
+
+        Queues the insert of a single record -- as with the toolbox method, data is a list containing one dictionary.
+        The token and created meta fields are injected when the record is queued.
+
+        :param data:        a list containing a single dictionary record
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :param callback:    optional - function invoked with the future once the operation completes
+        :return:            a Future resolving to the _id of the inserted record
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        record = self.mongo_toolbox.add_meta_fields(data[0])
+        return self._enqueue(InsertOne(record), db, collection, callback, record)
+
+    def insert_many_records(self, data, db=None, collection=None, callback=None):
+        """
+        insert_many_records() -- WriteBuffer method
+
+        Queues an insert for every record in the data iterable.
+
+        :param data:        an iterable of documents
+        :param db:          optional - alternative database name
+        :param collection:  optional - alternative collection name
+        :param callback:    optional - function invoked with each future as its operation completes
+        :return:            a list of Futures, one per record, in input order
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        return [self.insert_one_record([record], db, collection, callback) for record in data]
+
+    def update_one_record(self, query, update, upsert_value=False, db=None, collection=None, callback=None):
+        return self._enqueue(UpdateOne(query, update, upsert=upsert_value), db, collection, callback)
+
+    def update_many_records(self, query, update, upsert_value=False, db=None, collection=None, callback=None):
+        return self._enqueue(UpdateMany(query, update, upsert=upsert_value), db, collection, callback)
+
+    def delete_records(self, query_filter, db=None, collection=None, multi=False, callback=None):
+        operation = DeleteMany(query_filter) if multi is True else DeleteOne(query_filter)
+        return self._enqueue(operation, db, collection, callback)
+
+    def flush(self):
+        """
+        flush() -- WriteBuffer method
+
+        Blocks until every operation queued before the call has been flushed to mongo.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        close() -- WriteBuffer method
+
+        Flushes all of the queued operations and stops the background flush thread.  Write requests made after the
+        buffer is closed raise a RuntimeError.  A write request that was accepted before the buffer was closed may
+        still be waiting for room in the queue -- we wait for every such writer to queue its operation before the end
+        of the queue is marked, so no operation is queued behind the marker (where its future would never resolve).
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     wait for the writers in progress
+
+        """
+        with self._lock:
+            if self.status is False:
+                return
+            self.status = False
+            # the flusher is still running, so writers blocked on a full queue get their turn
+            while self._writers > 0:
+                self._writers_done.wait()
+        self._queue.put(_SHUTDOWN)
+        self._flusher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _enqueue(self, operation, db, collection, callback, record=None):
+        # the status check and the writer count are under the lock close() takes, so close() either refuses this
+        # request or waits for it to be queued
+        with self._lock:
+            if self.status is False:
+                raise RuntimeError('write buffer is closed')
+            self._writers += 1
+        try:
+            future = Future()
+            if callback is not None:
+                future.add_done_callback(callback)
+            # blocks while the queue is full -- this is the back-pressure on the writers
+            self._queue.put((self.mongo_toolbox.get_collection(db, collection), operation, future, record))
+        finally:
+            with self._lock:
+                self._writers -= 1
+                if self._writers == 0:
+                    self._writers_done.notify_all()
+        with self._lock:
+            self.operations_queued += 1
+        return future
+
+    def _flush_loop(self):
+        """
+        _flush_loop() -- WriteBuffer private method
+
+        The background thread.  We wait for the first operation to arrive, and then keep collecting operations until
+        either the batch is full or the first operation has waited max_delay seconds -- then the batch is flushed.
+        If the flush raises, the futures of the batch that weren't resolved are failed with the error, and the thread
+        carries on with the next batch -- otherwise every later future (and flush() and close()) would wait forever.
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     a failed batch doesn't stop the thread
+
+        """
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is _SHUTDOWN:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _SHUTDOWN:
+                    running = False
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            try:
+                self._flush_batch(batch)
+            except Exception as e:
+                print('write buffer batch failed: %s - %s' % (e.__class__, e))
+                for _, _, future, _ in batch:
+                    if future.running():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _flush_batch(self, batch):
+        """
+        _flush_batch() -- WriteBuffer private method
+
+        Groups the batch by target collection (preserving the order of the operations) and issues one bulk_write()
+        per collection.  The per-operation futures are then resolved: a write error reported for an operation fails
+        that operation's future only, a write-concern error or any other exception fails every future in the group.
+
+        Each future is claimed (set running) before the write: a future the caller has already cancelled is skipped,
+        along with its operation, and a claimed future can no longer be cancelled -- so resolving it can't fail.
+
+        :param batch:   a list of (collection, operation, future, record) tuples
+
+        @author     mshallop@linux.com
+        @version    1.0
+
+        HISTORY:
+        ========
+        10-17-26        mks     original coding
+        10-17-26        mks     skip the cancelled operations
+
+        """
+        groups = {}
+        for target, operation, future, record in batch:
+            if future.set_running_or_notify_cancel() is False:
+                continue
+            key = (target.database.name, target.name)
+            if key not in groups:
+                groups[key] = (target, [], [], [])
+            groups[key][1].append(operation)
+            groups[key][2].append(future)
+            groups[key][3].append(record)
+
+        for target, operations, futures, records in groups.values():
+            failed = {}
+            upserted_ids = {}
+            try:
+                result = target.bulk_write(operations, ordered=self.ordered)
+                upserted_ids = result.upserted_ids or {}
+            except mongo_errors.BulkWriteError as e:
+                for write_error in e.details.get('writeErrors', []):
+                    failed[write_error['index']] = mongo_errors.WriteError(write_error.get('errmsg'),
+                                                                           write_error.get('code'), write_error)
+                for upsert in e.details.get('upserted', []):
+                    upserted_ids[upsert['index']] = upsert['_id']
+                if e.details.get('writeConcernErrors'):
+                    error = mongo_errors.WriteConcernError(str(e.details['writeConcernErrors']))
+                    failed.update((index, error) for index in range(len(operations)) if index not in failed)
+                elif self.ordered is True and failed:
+                    # an ordered bulk_write stops at the first error -- everything after it was never attempted
+                    first_error = min(failed)
+                    for index in range(first_error + 1, len(operations)):
+                        failed[index] = failed[first_error]
+            except (mongo_errors.PyMongoError, Exception) as e:
+                print('a mongo exception was trapped: %s - %s' % (e.__class__, e))
+                failed = dict((index, e) for index in range(len(operations)))
+
+            for index, (future, record) in enumerate(zip(futures, records)):
+                if index in failed:
+                    self.operations_failed += 1
+                    future.set_exception(failed[index])
+                elif record is not None:
+                    # pyMongo assigns the _id to the inserted document when the bulk_write is built
+                    future.set_result(record.get('_id'))
+                else:
+                    future.set_result(upserted_ids.get(index, True))
+            self.operations_flushed += len(operations)
+            self.batches_flushed += 1
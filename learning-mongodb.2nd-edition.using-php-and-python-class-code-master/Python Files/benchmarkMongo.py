@@ -0,0 +1,76 @@
+from Models import BenchmarkModel
+from shared import constants
+import argparse
+import json
+import sys
+
+"""
+benchmarkMongo.py -- command-line runner for the toolbox benchmark suite
+
+Runs the benchmark cases against a local mongod or, when no mongod is reachable, the in-process mongomock stand-in.
+The results are printed as a table and can be saved as JSON; a saved result file can be passed back in as the
+baseline, in which case every case is compared with it and the script exits with status 2 if any case regressed.
+
+    python benchmarkMongo.py --output baseline.json
+    python benchmarkMongo.py --baseline baseline.json --output current.json
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+
+def integer_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+parser = argparse.ArgumentParser(description='Benchmark the MongoToolbox and password hashing.')
+parser.add_argument('--backend', default=constants.BENCHMARK_BACKEND_AUTO,
+                    choices=[constants.BENCHMARK_BACKEND_AUTO, constants.BENCHMARK_BACKEND_MONGOD,
+                             constants.BENCHMARK_BACKEND_MONGOMOCK])
+parser.add_argument('--uri', default=constants.BENCHMARK_URI, help='mongod connection uri')
+parser.add_argument('--iterations', type=int, default=constants.BENCHMARK_ITERATIONS)
+parser.add_argument('--batch-sizes', type=integer_list, default=constants.BENCHMARK_BATCH_SIZES)
+parser.add_argument('--bcrypt-rounds', type=integer_list, default=constants.BENCHMARK_BCRYPT_ROUNDS)
+parser.add_argument('--case', default=None, help='only run cases whose name contains this string')
+parser.add_argument('--output', default=None, help='write the results to this JSON file')
+parser.add_argument('--baseline', default=None, help='compare the results with this JSON file')
+parser.add_argument('--threshold', type=float, default=constants.BENCHMARK_REGRESSION_THRESHOLD)
+args = parser.parse_args()
+
+client, backend = BenchmarkModel.connect_backend(args.backend, args.uri)
+if client is None:
+    exit(1)
+print('benchmark backend: %s' % backend)
+
+suite = BenchmarkModel.BenchmarkSuite(client, backend, args.iterations, args.batch_sizes, args.bcrypt_rounds)
+results = suite.run(args.case)
+
+print('%-42s %12s %10s %10s %10s %14s' % ('case', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'alloc peak B'))
+for name, result in sorted(results['results'].items()):
+    print('%-42s %12.1f %10.4f %10.4f %10.4f %14d' % (name, result['ops_per_sec'], result['p50_ms'],
+                                                      result['p95_ms'], result['p99_ms'], result['alloc_peak_bytes']))
+
+if args.output is not None:
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+
+if args.baseline is not None:
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('meta', {}).get('backend') != backend:
+        print('warning: the baseline was recorded against a different backend (%s)' % baseline['meta'].get('backend'))
+    comparison, regressed = BenchmarkModel.compare_results(baseline, results, args.threshold)
+    for case in comparison:
+        if 'ops_per_sec_change' in case:
+            print('%-42s %-10s ops/s %+7.1f%%  p95 %+7.1f%%' % (case['case'], case['status'],
+                                                              case['ops_per_sec_change'] * 100,
+                                                              case['p95_change'] * 100))
+        else:
+            print('%-42s %-10s' % (case['case'], case['status']))
+    if regressed is True:
+        sys.exit(2)
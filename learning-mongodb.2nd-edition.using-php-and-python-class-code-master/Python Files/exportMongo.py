@@ -0,0 +1,68 @@
+from Models import MongoConnectorModel
+from Models import MongoConnectorDataModel
+from Models import MongoToolbox
+from Models import ExportModel
+from shared import constants
+import argparse
+
+"""
+exportMongo.py -- command-line runner for the parallel collection export
+
+Exports the collection configured in the MongoConnectorDataModel (or the --db/--collection given) as a set of
+partition files, scanned in parallel:
+
+    python exportMongo.py --output-dir ./export
+    python exportMongo.py --output-dir ./export --format bson --partitions 32 --workers 16
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     connection profiles from the configuration
+10-17-26        mks     read routes from the configuration, --read-route option
+10-17-26        mks     the export status covers a count mismatch
+
+"""
+
+program_data = MongoConnectorDataModel.MongoConnectorDataModel()
+
+parser = argparse.ArgumentParser(description='Export a collection as partitioned, compressed, files.')
+parser.add_argument('--output-dir', required=True, help='directory the partition files are written to')
+parser.add_argument('--format', default=constants.EXPORT_FORMAT_JSONL,
+                    choices=[constants.EXPORT_FORMAT_JSONL, constants.EXPORT_FORMAT_BSON])
+parser.add_argument('--partitions', type=int, default=constants.EXPORT_PARTITIONS)
+parser.add_argument('--workers', type=int, default=constants.EXPORT_WORKERS)
+parser.add_argument('--partition-field', default='_id', help='indexed field the collection is split on')
+parser.add_argument('--batch-size', type=int, default=constants.EXPORT_BATCH_SIZE)
+parser.add_argument('--no-compress', action='store_true', help='write uncompressed files')
+parser.add_argument('--read-route', default=constants.EXPORT_READ_ROUTE,
+                    help='read route the partitions are read through, e.g. primary or analytics')
+parser.add_argument('--db', default=program_data.database)
+parser.add_argument('--collection', default=program_data.table)
+args = parser.parse_args()
+
+mongo_object = MongoConnectorModel.MongoConnectorModel(program_data)
+if mongo_object.status is False:
+    print('Failed to connect to DB using configuration!')
+    exit(1)
+
+mongo_toolbox = MongoToolbox.MongoToolbox(mongo_object.res_mongo)
+mongo_toolbox.configure_profiles(program_data.profiles, program_data.operationProfiles)
+mongo_toolbox.configure_read_routes(program_data.readRoutes, program_data.operationReadRoutes)
+exporter = ExportModel.CollectionExporter(mongo_toolbox, args.output_dir,
+                                          args.format, args.partitions, args.partition_field, args.workers,
+                                          args.batch_size, not args.no_compress, db=args.db,
+                                          collection=args.collection, read_route=args.read_route)
+report = exporter.export()
+for partition in report['partitions']:
+    print('%-48s %12d records %14d bytes' % (partition['file'], partition['records'], partition['bytes']))
+print('exported %d of %s records in %.3f seconds (%.1f records/second)' %
+      (report['records_exported'], report['records_expected'], report['elapsed_seconds'],
+       report['records_per_second']))
+if report['status'] is False:
+    print('export is incomplete!')
+MongoConnectorModel.MongoConnectorModel.close_all()
+if report['status'] is False:
+    exit(1)
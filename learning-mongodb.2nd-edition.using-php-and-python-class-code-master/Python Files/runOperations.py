@@ -0,0 +1,94 @@
+from Models import MongoConnectorModel
+from Models import MongoConnectorDataModel
+from Models import IndexManagerModel
+from Models import MongoToolbox
+from Models import OperationRunnerModel
+from shared import constants
+import argparse
+import json
+import sys
+
+"""
+runOperations.py -- command-line runner for a log of user operations
+
+Replays a JSONL stream of create/update/delete user operations (see OperationRunnerModel for the format) against the
+configured database -- e.g. a production operation log against staging -- in concurrent batches, and prints the
+throughput, the batch latency percentiles for each operation type, and the failed operations:
+
+    python runOperations.py operations.jsonl
+    python runOperations.py operations.jsonl --concurrency 16 --batch-size 1000 --output report.json
+    zcat operations.jsonl.gz | python runOperations.py -
+
+Duplicate users are rejected by the unique username, email and token indexes, so the runner refuses to start if
+they're missing -- run with --ensure-indexes to create any missing index first.  With --expire, the expired users are
+removed by the expire_at TTL index, so the runner also refuses to start without it.
+
+The exit status is 0 if every operation was applied, 1 if we couldn't connect or the unique (or, with --expire, TTL)
+indexes aren't in place, and 2 if any operation failed.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+10-17-26        mks     added the --expire option
+10-17-26        mks     check (or, with --ensure-indexes, create) the unique indexes first
+10-17-26        mks     check the TTL index for --expire
+
+"""
+
+parser = argparse.ArgumentParser(description='Apply a JSONL log of user operations in concurrent batches.')
+parser.add_argument('source', help='JSONL file of operations, or - to read standard input')
+parser.add_argument('--batch-size', type=int, default=constants.RUNNER_BATCH_SIZE)
+parser.add_argument('--concurrency', type=int, default=constants.RUNNER_CONCURRENCY)
+parser.add_argument('--tombstones', action='store_true', help='deletes leave a tombstone for incremental extracts')
+parser.add_argument('--expire', action='store_true',
+                    help='deletes expire the users, for the TTL index to remove in the background')
+parser.add_argument('--ensure-indexes', action='store_true', help='create any missing index before the run')
+parser.add_argument('--max-errors', type=int, default=constants.BULK_IMPORT_MAX_ERRORS,
+                    help='maximum number of failed operations reported')
+parser.add_argument('--output', default=None, help='write the report to this JSON file')
+args = parser.parse_args()
+
+program_data = MongoConnectorDataModel.MongoConnectorDataModel()
+mongo_object = MongoConnectorModel.MongoConnectorModel(program_data)
+if mongo_object.status is False:
+    print('Failed to connect to DB using configuration!')
+    exit(1)
+if program_data.warmUp is True:
+    mongo_object.warm_up(args.concurrency)
+index_manager = IndexManagerModel.IndexManager(MongoToolbox.MongoToolbox(mongo_object.res_mongo))
+if args.ensure_indexes is True and index_manager.ensure_indexes() is False:
+    print('Failed to create the indexes!')
+    exit(1)
+if index_manager.unique_indexes_present() is False:
+    print('The unique user indexes are not in place -- run with --ensure-indexes to create them.')
+    exit(1)
+if args.expire is True and index_manager.expiry_index_present() is False:
+    print('The TTL index expiring deletes rely on is not in place -- run with --ensure-indexes to create it.')
+    exit(1)
+
+runner = OperationRunnerModel.OperationRunner(mongo_object.res_mongo, program_data, args.batch_size, args.concurrency,
+                                              tombstones=args.tombstones, max_errors=args.max_errors,
+                                              expire=args.expire)
+report = runner.run(sys.stdin if args.source == '-' else args.source)
+
+print('%-8s %10s %8s %8s %12s %10s %10s %10s' % ('op', 'operations', 'failed', 'batches', 'ops/s', 'p50 ms',
+                                                 'p95 ms', 'p99 ms'))
+for op_type, stats in sorted(report['operations'].items()):
+    print('%-8s %10d %8d %8d %12.1f %10s %10s %10s' % (op_type, stats['operations'], stats['failed'], stats['batches'],
+                                                       stats['operations_per_second'], stats['p50_ms'],
+                                                       stats['p95_ms'], stats['p99_ms']))
+print('applied %d of %d operations in %.3f seconds (%.1f operations/second), %d failed' %
+      (report['operations_succeeded'], report['operations_read'], report['elapsed_seconds'],
+       report['operations_per_second'], report['operations_failed']))
+for failure in report['failures']:
+    print('operation %d (%s %s): %s' % (failure['index'], failure['op'], failure['user'], failure['errmsg']))
+
+if args.output is not None:
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True, default=str)
+MongoConnectorModel.MongoConnectorModel.close_all()
+if report['status'] is False:
+    exit(2)
@@ -12,9 +12,216 @@ ultimate purpose, is to serve as an I18N catalog.  That and I dislike seeing str
 HISTORY:
 ========
 01-06-19        mks     original coding
+10-17-26        mks     added bulk-import constants
+10-17-26        mks     added password hashing service constants
+10-17-26        mks     added asyncio toolbox constants
+10-17-26        mks     added write-behind buffer constants
+10-17-26        mks     added user cache constants
+10-17-26        mks     added email domain validation constants
+10-17-26        mks     added pagination constants
+10-17-26        mks     added benchmark constants
+10-17-26        mks     added metrics constants
+10-17-26        mks     added slow-operation constants
+10-17-26        mks     added raw insert constants
+10-17-26        mks     added bulk loader constants
+10-17-26        mks     added parallel loader constants
+10-17-26        mks     added export constants
+10-17-26        mks     added incremental extract constants
+10-17-26        mks     added connection configuration and profile constants
+10-17-26        mks     added read routing constants
+10-17-26        mks     added operation runner constants
+10-17-26        mks     added workload generator constants
+10-17-26        mks     added bulk delete and expiry constants
+10-17-26        mks     added the majority read route for incremental extracts
+10-17-26        mks     the metrics exporter listens on localhost by default
+10-17-26        mks     added the ensure-indexes operation
+10-17-26        mks     added the string connection settings
+10-17-26        mks     the SMTP mailbox probe is on by default, as it was before the domain cache
 
 """
 OP_CREATE = 1
 OP_FETCH = 2
 OP_UPDATE = 3
 OP_DELETE = 4
+OP_IMPORT = 5
+OP_PARALLEL_LOAD = 6
+OP_EXTRACT = 7
+OP_ENSURE_INDEXES = 8
+
+# bulk import settings
+BULK_IMPORT_CHUNK_SIZE = 1000
+BULK_IMPORT_MAX_ERRORS = 1000
+IMPORT_FORMAT_CSV = 'csv'
+IMPORT_FORMAT_JSONL = 'jsonl'
+
+# password hashing service settings
+BCRYPT_ROUNDS = 12
+HASH_SERVICE_CHUNK_SIZE = 8
+
+# asyncio toolbox settings
+ASYNC_CONCURRENCY = 100
+
+# write-behind (bulk_write) buffer settings
+WRITE_BUFFER_MAX_BATCH = 1000
+WRITE_BUFFER_MAX_DELAY_MS = 50
+WRITE_BUFFER_MAX_QUEUE = 10000
+
+# user lookup cache settings
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+# email domain validation settings
+EMAIL_PATTERN = r'^[^@\s]+@([^@\s]+\.[^@\s]+)$'
+EMAIL_DOMAIN_CACHE_SIZE = 10000
+EMAIL_DOMAIN_TTL = 3600
+EMAIL_DOMAIN_NEGATIVE_TTL = 300
+EMAIL_DOMAIN_WORKERS = 8
+EMAIL_DNS_TIMEOUT = 5.0
+EMAIL_SMTP_VERIFY = True         # False is an explicit downgrade to the (cached) MX check only
+
+# keyset pagination settings
+PAGE_SIZE = 100
+
+# benchmark suite settings
+BENCHMARK_BACKEND_AUTO = 'auto'
+BENCHMARK_BACKEND_MONGOD = 'mongod'
+BENCHMARK_BACKEND_MONGOMOCK = 'mongomock'
+BENCHMARK_URI = 'mongodb://localhost:27017'
+BENCHMARK_CONNECT_TIMEOUT_MS = 500
+BENCHMARK_DATABASE = 'benchmark'
+BENCHMARK_COLLECTION = 'users'
+BENCHMARK_ITERATIONS = 1000
+BENCHMARK_BATCH_SIZES = [10, 100, 1000]
+BENCHMARK_BCRYPT_ROUNDS = [4, 8, 10, 12]
+BENCHMARK_HASH_CALLS = 20
+BENCHMARK_ALLOCATION_CALLS = 50
+BENCHMARK_MULTI_GROUP_SIZE = 10
+BENCHMARK_REGRESSION_THRESHOLD = 0.10
+
+# operation/command metrics settings -- latency histogram bucket upper-bounds are in seconds
+METRICS_LATENCY_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+METRICS_EXPORTER_HOST = '127.0.0.1'
+METRICS_EXPORTER_PORT = 9108
+
+# slow-operation capture settings
+SLOW_OP_THRESHOLD_MS = 100
+SLOW_OP_SAMPLE_RATE = 0.25
+SLOW_OP_RATIO_THRESHOLD = 10
+SLOW_OP_MAX_FINDINGS = 1000
+SLOW_OP_EXPLAIN_INTERVAL = 300
+SLOW_OP_SHAPE_CACHE_SIZE = 1000
+SLOW_OP_COLLECTION = 'slow_operations'
+SLOW_OP_CAPPED_SIZE = 16 * 1024 * 1024
+
+# pre-encoded (RawBSON) insert settings -- the number of tokens generated at a time
+RAW_INSERT_TOKEN_BLOCK = 1000
+
+# bulk loader settings -- the transient codes are the server's network, failover, and shutdown error codes
+BULK_LOAD_CHUNK_SIZE = 1000
+BULK_LOAD_MAX_RETRIES = 5
+BULK_LOAD_BACKOFF_BASE_MS = 100
+BULK_LOAD_BACKOFF_MAX_MS = 5000
+BULK_LOAD_IDEMPOTENCY_KEY = 'token'
+BULK_LOAD_DUPLICATE_KEY_CODES = [11000, 11001]
+BULK_LOAD_TRANSIENT_ERROR_CODES = [6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436]
+
+# parallel loader settings -- progress is reported every PARALLEL_LOAD_PROGRESS_INTERVAL seconds
+PARALLEL_LOAD_WORKERS = 4
+PARALLEL_LOAD_PROGRESS_INTERVAL = 5
+
+# collection export settings
+EXPORT_FORMAT_JSONL = 'jsonl'
+EXPORT_FORMAT_BSON = 'bson'
+EXPORT_PARTITIONS = 16
+EXPORT_WORKERS = 8
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SAMPLES_PER_PARTITION = 20
+EXPORT_COMPRESS_LEVEL = 6
+
+# incremental extract settings -- deleted records are tombstoned in <collection>TOMBSTONE_SUFFIX
+TOMBSTONE_SUFFIX = '_tombstones'
+INCREMENTAL_STATE_FILE = './incremental_state.json'
+INCREMENTAL_OVERLAP_SECONDS = 30
+
+# connection configuration -- a JSON file (named by the CONFIG_FILE_ENV variable), then MONGO_* environment variables
+CONFIG_FILE_ENV = 'MONGO_CONFIG_FILE'
+CONFIG_ENV_PREFIX = 'MONGO_'
+# the settings whose environment variables are always taken verbatim -- a password of 12345678, or a login of null,
+# is a string, not a JSON value
+CONFIG_STRING_SETTINGS = ('uri', 'login', 'password', 'authDB', 'replSetName', 'readPreference', 'database', 'table',
+                          'profile', 'compressors')
+
+# connection profiles: client options (applied when the client is built), and the write concern, read concern,
+# cursor batch size and time limit applied to the toolbox operations that select the profile
+PROFILE_DEFAULT = 'default'
+PROFILE_BULK_THROUGHPUT = 'bulk-throughput'
+PROFILE_DURABLE_LOW_LATENCY = 'durable-low-latency'
+CONNECTION_PROFILES = {
+    PROFILE_DEFAULT: {},
+    PROFILE_BULK_THROUGHPUT: {
+        'client': {'compressors': 'zstd,snappy,zlib', 'maxPoolSize': 200, 'minPoolSize': 10,
+                   'socketTimeoutMS': 120000, 'waitQueueTimeoutMS': 30000},
+        'write_concern': {'w': 1},
+        'batch_size': 5000
+    },
+    PROFILE_DURABLE_LOW_LATENCY: {
+        'client': {'connectTimeoutMS': 500, 'serverSelectionTimeoutMS': 1000, 'socketTimeoutMS': 2000,
+                   'waitQueueTimeoutMS': 250},
+        'write_concern': {'w': 'majority', 'j': True, 'wtimeout': 1000},
+        'read_concern': {'level': 'majority'},
+        'batch_size': 100,
+        'max_time_ms': 1000
+    }
+}
+
+# read routing: named read preferences a toolbox read can be routed to -- mode, optional tag_sets (tried in order, {}
+# matches any member) and optional max_staleness in seconds (at least 90; -1 means no bound).  Reads with no route use
+# the client's read preference, which is counted under the READ_ROUTE_CLIENT label.
+READ_ROUTE_CLIENT = 'client'
+READ_ROUTE_PRIMARY = 'primary'
+READ_ROUTE_ANALYTICS = 'analytics'
+READ_ROUTE_MAJORITY = 'majority'
+READ_ROUTES = {
+    READ_ROUTE_PRIMARY: {'mode': 'primary'},
+    READ_ROUTE_ANALYTICS: {'mode': 'secondaryPreferred', 'max_staleness': 120,
+                           'tag_sets': [{'workload': 'analytics'}, {}]},
+    READ_ROUTE_MAJORITY: {'mode': 'primary', 'read_concern': 'majority'}
+}
+# correctness-sensitive reads -- uniqueness checks, and the records a delete is about to tombstone -- go to the primary
+READ_ROUTE_OPERATIONS = {
+    'check_for_existing_account': READ_ROUTE_PRIMARY,
+    'delete_records': READ_ROUTE_PRIMARY
+}
+EXPORT_READ_ROUTE = READ_ROUTE_ANALYTICS
+# incremental extracts must not miss a change a lagging secondary hasn't applied yet
+INCREMENTAL_READ_ROUTE = READ_ROUTE_MAJORITY
+
+# operation runner settings -- the op field of each JSONL operation is one of the RUNNER_OP_* values
+RUNNER_OP_CREATE = 'create'
+RUNNER_OP_UPDATE = 'update'
+RUNNER_OP_DELETE = 'delete'
+RUNNER_BATCH_SIZE = 500
+RUNNER_CONCURRENCY = 8
+
+# workload generator settings -- the mix is the share of each operation, and the latency buckets are in seconds
+WORKLOAD_OP_READ = 'read'
+WORKLOAD_OP_UPDATE = 'update'
+WORKLOAD_OP_CREATE = 'create'
+WORKLOAD_MIX = {WORKLOAD_OP_READ: 0.7, WORKLOAD_OP_UPDATE: 0.2, WORKLOAD_OP_CREATE: 0.1}
+WORKLOAD_DISTRIBUTION_UNIFORM = 'uniform'
+WORKLOAD_DISTRIBUTION_ZIPFIAN = 'zipfian'
+WORKLOAD_ZIPFIAN_THETA = 0.99
+WORKLOAD_MODE_OPEN = 'open'
+WORKLOAD_MODE_CLOSED = 'closed'
+WORKLOAD_RECORDS = 100000
+WORKLOAD_RATE = 5000
+WORKLOAD_DURATION = 60
+WORKLOAD_THREADS = 32
+WORKLOAD_LATENCY_BUCKETS = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05,
+                            0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0]
+
+# bulk delete settings -- expired users are removed by the TTL index on USER_EXPIRY_FIELD (see IndexManagerModel)
+BULK_DELETE_CHUNK_SIZE = 1000
+BULK_DELETE_FIELDS = ['username', 'token']
+USER_EXPIRY_FIELD = 'expire_at'
+USER_EXPIRY_DELAY_SECONDS = 0
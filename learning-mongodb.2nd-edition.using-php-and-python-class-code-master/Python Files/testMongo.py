@@ -1,9 +1,23 @@
+import time
+start_time = time.perf_counter()
+
 from Models import MongoConnectorModel
 from Models import MongoConnectorDataModel
 from Models import UserModel
+from Models import IndexManagerModel
+from Models import HelperModel as Helper
 from shared import constants
 
-mongo_object = MongoConnectorModel.MongoConnectorModel()
+# the models only some operations use are imported lazily -- they're loaded when the operation first uses them
+BulkImportModel = Helper.lazy_import('Models.BulkImportModel')
+SlowOperationModel = Helper.lazy_import('Models.SlowOperationModel')
+ParallelLoaderModel = Helper.lazy_import('Models.ParallelLoaderModel')
+IncrementalExtractModel = Helper.lazy_import('Models.IncrementalExtractModel')
+import_seconds = time.perf_counter() - start_time
+
+# the settings, and connection profiles, come from the data model defaults, a config file, and the environment
+program_data = MongoConnectorDataModel.MongoConnectorDataModel()
+mongo_object = MongoConnectorModel.MongoConnectorModel(program_data)
 
 if mongo_object.status is False:
     print('Failed to connect to DB using configuration!')
@@ -11,11 +25,34 @@ if mongo_object.status is False:
 else:
     print('Successfully connected to mongoDB!')
 
-program_data = MongoConnectorDataModel.MongoConnectorDataModel()
-user_model = UserModel.UserModel(mongo_object.res_mongo)
+# long-running services open the pool ahead of traffic -- otherwise, the client connects on the first operation
+if program_data.warmUp is True:
+    warm_up = mongo_object.warm_up()
+    print('warm-up: server selection %ss, %d pooled connections %ss' %
+          (warm_up['server_selection_seconds'], warm_up['connections'], warm_up['pool_seconds']))
+
+user_model = UserModel.UserModel(mongo_object.res_mongo, tombstones=program_data.incrementalExtract[0]['tombstones'])
+user_model.mongo_toolbox.configure_profiles(program_data.profiles, program_data.operationProfiles)
+user_model.mongo_toolbox.configure_read_routes(program_data.readRoutes, program_data.operationReadRoutes)
+
+# index creation is an explicit step (the OP_ENSURE_INDEXES operation, or the opt-in ensureIndexes setting) -- it
+# lists the indexes, and may build them, so it isn't paid on every invocation.  Once the indexes are known to be in
+# place, let the unique indexes catch duplicate accounts.  The index round trips are timed, and reported
+index_seconds = 0.0
+if program_data.ensureIndexes is True:
+    index_start_time = time.perf_counter()
+    index_manager = IndexManagerModel.IndexManager(user_model.mongo_toolbox)
+    user_model.rely_on_unique_indexes = index_manager.ensure_indexes()
+    index_seconds = time.perf_counter() - index_start_time
+
+# optionally, explain slow toolbox calls and alert on collection scans
+if program_data.slowOperationMS is not None:
+    user_model.mongo_toolbox.slow_operation_recorder = SlowOperationModel.SlowOperationRecorder(
+        program_data.slowOperationMS)
 
 # the selected operation for this iteration
 current_operation = constants.OP_DELETE
+operation_start_time = time.perf_counter()
 
 #  since python doesn't have switch-case, we'll use stodgy if-elif
 
@@ -52,3 +89,52 @@ elif current_operation == constants.OP_DELETE:
         print('delete user record request has failed')
     else:
         print('user: ' + user_data + ' successfully deleted')
+elif current_operation == constants.OP_IMPORT:
+    import_data = program_data.bulkImport[0]
+    bulk_import = BulkImportModel.BulkImportModel(user_model, chunk_size=import_data['chunk_size'])
+    report = bulk_import.import_records(import_data['source'], import_data['format'])
+    print('imported %d of %d records in %.3f seconds (%.1f records/second)' %
+          (report['records_inserted'], report['records_read'], report['elapsed_seconds'],
+           report['records_per_second']))
+    print('rejected: %d, failed: %d' % (report['records_rejected'], report['records_failed']))
+    for err_msg in report['errors']:
+        print(err_msg)
+elif current_operation == constants.OP_PARALLEL_LOAD:
+    import_data = program_data.bulkImport[0]
+    load_data = program_data.parallelLoad[0]
+    connect_data = ParallelLoaderModel.local_connect_data() if load_data['local'] is True else program_data
+    parallel_loader = ParallelLoaderModel.ParallelLoader(connect_data, load_data['workers'], load_data['chunk_size'])
+    report = parallel_loader.load(import_data['source'], import_data['format'])
+    print('loaded %d of %d records (%d already present) with %d workers in %.3f seconds (%.1f records/second)' %
+          (report['records_inserted'], report['records_read'], report['records_already_present'], report['workers'],
+           report['elapsed_seconds'], report['records_per_second']))
+    print('rejected: %d, failed: %d, retries: %d' % (report['records_rejected'], report['records_failed'],
+                                                    report['retries']))
+    for failure in report['failures']:
+        print('record %d (token %s): %s' % (failure['index'], failure['token'], failure['errmsg']))
+elif current_operation == constants.OP_ENSURE_INDEXES:
+    index_manager = IndexManagerModel.IndexManager(user_model.mongo_toolbox)
+    if index_manager.ensure_indexes() is False:
+        print('the indexes could not all be put in place')
+    else:
+        print('all of the toolbox indexes are in place')
+elif current_operation == constants.OP_EXTRACT:
+    extract_data = program_data.incrementalExtract[0]
+    extractor = IncrementalExtractModel.IncrementalExtractor(user_model.mongo_toolbox, extract_data['state_file'])
+    extractor.ensure_indexes()
+    report = extractor.extract(extract_data['output'])
+    if report['status'] is False:
+        print('incremental extract failed -- the high-water mark was not moved')
+    else:
+        print('extracted %d upserts and %d deletes since %s to %s in %.3f seconds' %
+              (report['records_upserted'], report['records_deleted'], report['since'], report['file'],
+               report['elapsed_seconds']))
+
+print('imports: %.3f seconds, indexes: %.3f seconds, operation: %.3f seconds, total: %.3f seconds' %
+      (import_seconds, index_seconds, time.perf_counter() - operation_start_time, time.perf_counter() - start_time))
+
+if user_model.mongo_toolbox.slow_operation_recorder is not None:
+    user_model.mongo_toolbox.slow_operation_recorder.close()
+
+# release the pooled connections held by the process-wide connection registry
+MongoConnectorModel.MongoConnectorModel.close_all()
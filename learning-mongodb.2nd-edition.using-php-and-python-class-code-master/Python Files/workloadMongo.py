@@ -0,0 +1,100 @@
+from Models import MongoConnectorModel
+from Models import MongoConnectorDataModel
+from Models import IndexManagerModel
+from Models import MongoToolbox
+from Models import ParallelLoaderModel
+from Models import WorkloadModel
+from shared import constants
+import argparse
+import json
+
+"""
+workloadMongo.py -- YCSB-style workload generator for the user collection
+
+Pre-loads a set of synthetic users, then runs a read/update/create mix against them for a fixed duration, and prints
+the throughput and latency percentiles of each operation (see WorkloadModel for the modes and the distributions):
+
+    python workloadMongo.py --local --records 100000 --mix read=70,update=20,create=10 --rate 5000 --duration 60
+    python workloadMongo.py --local --skip-load --mode closed --threads 64 --distribution uniform
+    python workloadMongo.py --local --skip-load --output workload.json
+
+The JSON report includes the per-second timeline, to see how latency moved over the run.  The exit status is 0 if
+every operation succeeded, 1 if we couldn't connect, and 2 if any operation failed.
+
+@author     mshallop@linux.com
+@version    1.0
+
+HISTORY:
+========
+10-17-26        mks     original coding
+
+"""
+
+
+def parse_mix(mix_string):
+    # read=70,update=20,create=10 -> {'read': 70.0, 'update': 20.0, 'create': 10.0}
+    mix = {}
+    for item in mix_string.split(','):
+        operation, separator, share = item.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError('expected operation=share, got %s' % item)
+        mix[operation.strip()] = float(share)
+    return mix
+
+
+parser = argparse.ArgumentParser(description='Run a read/update/create workload against the user collection.')
+parser.add_argument('--mix', type=parse_mix, default=dict(constants.WORKLOAD_MIX),
+                    help='operation shares, e.g. read=70,update=20,create=10')
+parser.add_argument('--distribution', default=constants.WORKLOAD_DISTRIBUTION_ZIPFIAN,
+                    choices=[constants.WORKLOAD_DISTRIBUTION_UNIFORM, constants.WORKLOAD_DISTRIBUTION_ZIPFIAN])
+parser.add_argument('--records', type=int, default=constants.WORKLOAD_RECORDS, help='number of pre-loaded users')
+parser.add_argument('--rate', type=float, default=constants.WORKLOAD_RATE,
+                    help='target operations per second (0: unpaced, closed mode only)')
+parser.add_argument('--mode', default=constants.WORKLOAD_MODE_OPEN,
+                    choices=[constants.WORKLOAD_MODE_OPEN, constants.WORKLOAD_MODE_CLOSED])
+parser.add_argument('--duration', type=float, default=constants.WORKLOAD_DURATION, help='seconds')
+parser.add_argument('--threads', type=int, default=constants.WORKLOAD_THREADS)
+parser.add_argument('--cached-reads', action='store_true', help='serve reads from the user cache')
+parser.add_argument('--local', action='store_true', help='use a stand-alone mongod on localhost')
+parser.add_argument('--skip-load', action='store_true', help='the users were loaded by an earlier run')
+parser.add_argument('--db', default=None)
+parser.add_argument('--collection', default=None)
+parser.add_argument('--seed', type=int, default=None)
+parser.add_argument('--output', default=None, help='write the report to this JSON file')
+args = parser.parse_args()
+
+program_data = ParallelLoaderModel.local_connect_data() if args.local is True else \
+    MongoConnectorDataModel.MongoConnectorDataModel()
+mongo_object = MongoConnectorModel.MongoConnectorModel(program_data)
+if mongo_object.status is False:
+    print('Failed to connect to DB using configuration!')
+    exit(1)
+if program_data.warmUp is True:
+    mongo_object.warm_up(args.threads)
+
+workload = WorkloadModel.WorkloadGenerator(mongo_object.res_mongo, program_data, args.mix, args.distribution,
+                                           args.records, args.rate or None, args.mode, args.duration, args.threads,
+                                           args.cached_reads, args.db, args.collection, args.seed)
+if args.skip_load is False:
+    # the reads and creates rely on the username index, as they do in the application
+    IndexManagerModel.IndexManager(MongoToolbox.MongoToolbox(mongo_object.res_mongo), db=args.db,
+                                   collection=args.collection).ensure_indexes()
+    load_report = workload.load()
+    print('loaded %d of %d users in %.3f seconds' % (load_report['records_inserted'], args.records,
+                                                     load_report['elapsed_seconds']))
+
+report = workload.run()
+print('%-8s %10s %8s %10s %10s %10s %10s' % ('op', 'operations', 'errors', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms'))
+for operation, summary in sorted(report['summary'].items()):
+    print('%-8s %10d %8d %10s %10s %10s %10s' % (operation, summary['count'], summary['errors'], summary['mean_ms'],
+                                                 summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+print('%s loop: %d operations in %.3f seconds (%.1f operations/second, target %s), %d errors, max backlog %d' %
+      (report['mode'], report['operations'], report['elapsed_seconds'], report['operations_per_second'],
+       report['target_rate'], report['errors'], report['max_backlog']))
+
+if args.output is not None:
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True, default=str)
+MongoConnectorModel.MongoConnectorModel.close_all()
+if report['status'] is False:
+    exit(2)